@@ -16,6 +16,8 @@ from utils.utils import CounterDict
 from utils.helper_functions import scan_output_for_decision, graph_episode_output
 from Transformer.AttentionLayers import *
 from data_management.data_preprocessing import DataPreprocessing
+from utilities.utils import init_gpus_for_tf
+from utilities.training_callbacks import ThroughputLogger
 
 
 
@@ -154,7 +156,8 @@ class GTN:
                 monitor='val_categorical_accuracy',
                 mode='max',
                 save_best_only=True
-            )
+            ),
+            ThroughputLogger(model_name='GTN', batch_size=batch_size)
         ]
 
         self.history = self.model.fit(
@@ -175,20 +178,7 @@ class GTN:
 
 
 if __name__ == '__main__':
-    gpus = tf.config.experimental.list_physical_devices(device_type='GPU')
-    print( f"Found {len(gpus)} GPUs!" )
-    for i in range( len( gpus ) ):
-        try:
-            tf.config.experimental.set_memory_growth(device=gpus[i], enable=True)
-            tf.config.experimental.VirtualDeviceConfiguration( memory_limit = 1024*3 )
-            print( f"\t{tf.config.experimental.get_device_details( device=gpus[i] )}" )
-        except RuntimeError as e:
-            print( '\n', e, '\n' )
-
-    devices = tf.config.list_physical_devices()
-    print( "Tensorflow sees the following devices:" )
-    for dev in devices:
-        print( f"\t{dev}" )
+    init_gpus_for_tf()
 
     dp = DataPreprocessing()
     dp.run(verbose=True)
@@ -0,0 +1,165 @@
+import os, sys, json, time, platform
+sys.path.append(os.path.realpath('../'))
+# print(sys.path)
+
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2' # INFO and WARNING messages are not printed
+
+import numpy as np
+
+from benchmarks.startup_time import get_commit
+from utilities.utils import limit_tf_threads
+
+# Inference latency of every saved model in three settings:
+#   * batch: one `predict_on_batch` call on BATCH_SIZES random test windows (what the offline evaluation does)
+#   * streaming: consecutive windows of one episode fed one at a time (what the controller does every sample)
+#   * episode: all windows of one episode in a single call
+# Thread counts are fixed and every setting is warmed up first, so results are comparable across commits
+MODELS = [
+    'FCN',
+    'RNN',
+    'GRU',
+    'LSTM',
+    'OOP_Transformer',
+    'OOP_Transformer_small'
+]
+DATA = ['reactive', 'training']
+DATA_DIR = f'../../data/data_manager/{"_".join(DATA)}'
+BATCH_SIZES = [2 ** i for i in range(11)] # 1 ... 1024
+N_THREADS = 1
+N_WARMUP = 10
+N_REPEATS = 100
+MAX_SECONDS_PER_SETTING = 30.0 # Large batches of big models stop early, with at least MIN_REPEATS calls
+MIN_REPEATS = 10
+N_STREAMING_WINDOWS = 500
+N_EPISODES = 20
+SAMPLE_PERIOD_S = 20.0 / 1000.0 # Controller period, streaming latencies above it miss a sample
+SEED = 0
+RESULTS_PATH = '../saved_data/benchmarks/'
+
+
+# Functions -----------------------------------------------------------------------
+def load_model(model_name: str, X_sample):
+    """ Saved Keras model, or the transformer rebuilt from its config with the saved weights """
+    import tensorflow as tf
+
+    if model_name.startswith('OOP_Transformer'):
+        from model_builds.OOPTransformer import OOPTransformer, load_oop_transformer_config
+        transformer_net = OOPTransformer(model_name=model_name)
+        transformer_net.build(
+            X_sample=X_sample,
+            **load_oop_transformer_config(model_type='small' if model_name.endswith('small') else 'big'),
+            verbose=False
+        )
+        transformer_net.model.load_weights(f'../saved_models/{model_name}/').expect_partial()
+        return transformer_net.model
+
+    return tf.keras.models.load_model(f'../saved_models/{model_name}.keras')
+
+
+def time_calls(model, batches: list, n_warmup: int = N_WARMUP, max_seconds: float = MAX_SECONDS_PER_SETTING) -> np.ndarray:
+    """ Latency [ms] of `model.predict_on_batch` on each batch (cycled through), after `n_warmup` untimed calls """
+    for i in range(n_warmup):
+        model.predict_on_batch(batches[i % len(batches)])
+
+    latencies = []
+    t_start = time.perf_counter()
+    for i, batch in enumerate(batches):
+        t0 = time.perf_counter()
+        np.asarray(model.predict_on_batch(batch))
+        latencies.append(1000.0 * (time.perf_counter() - t0))
+        if i + 1 >= MIN_REPEATS and time.perf_counter() - t_start > max_seconds:
+            break
+
+    return np.array(latencies)
+
+
+def latency_stats(latencies_ms: np.ndarray, samples_per_call: float) -> dict:
+    p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99])
+    return {
+        'n_calls': int(len(latencies_ms)),
+        'mean_ms': float(latencies_ms.mean()),
+        'p50_ms': float(p50),
+        'p95_ms': float(p95),
+        'p99_ms': float(p99),
+        'throughput_per_s': float(1000.0 * samples_per_call / p50)
+    }
+
+
+def sample_windows(cache, rng: np.random.Generator, batch_size: int) -> np.ndarray:
+    """ `batch_size` test windows drawn uniformly over all episodes, gathered from the strided window views
+    without concatenating them (a copy of every window of the test set) """
+    offsets = np.cumsum([0] + [len(w) for w in cache.windows])
+    idx = np.sort(rng.integers(offsets[-1], size=batch_size))
+    episodes = np.searchsorted(offsets, idx, side='right') - 1
+
+    return np.stack([cache.windows[e][i - offsets[e]] for e, i in zip(episodes, idx)]).astype('float32')
+
+
+def benchmark_model(model, cache, rng: np.random.Generator, verbose: bool = True) -> dict:
+    """ Batch, streaming and full-episode latencies of one model over the cached test episodes """
+    results = {'batch': {}}
+
+    for batch_size in BATCH_SIZES:
+        batches = [sample_windows(cache, rng, batch_size) for _ in range(N_REPEATS)]
+        results['batch'][batch_size] = latency_stats(time_calls(model, batches), samples_per_call=batch_size)
+        if verbose:
+            res = results['batch'][batch_size]
+            print(f'\tbatch {batch_size:>5}: p50 {res["p50_ms"]:9.3f} ms | p99 {res["p99_ms"]:9.3f} ms | {res["throughput_per_s"]:10.1f} windows/s')
+
+    episode = cache.windows[int(rng.integers(len(cache)))]
+    stream = [episode[i:i + 1].astype('float32') for i in range(min(N_STREAMING_WINDOWS, len(episode)))]
+    latencies = time_calls(model, stream)
+    results['streaming'] = latency_stats(latencies, samples_per_call=1)
+    results['streaming']['missed_sample_fraction'] = float(np.mean(latencies > 1000.0 * SAMPLE_PERIOD_S))
+
+    episodes = [cache.windows[e].astype('float32') for e in rng.choice(len(cache), size=min(N_EPISODES, len(cache)), replace=False)]
+    results['episode'] = latency_stats(time_calls(model, episodes, n_warmup=1), samples_per_call=np.mean([len(e) for e in episodes]))
+    if verbose:
+        print(f'\tstreaming: p50 {results["streaming"]["p50_ms"]:.3f} ms | p99 {results["streaming"]["p99_ms"]:.3f} ms | {100 * results["streaming"]["missed_sample_fraction"]:.1f} % over {1000 * SAMPLE_PERIOD_S:.0f} ms')
+        print(f'\tepisode:   p50 {results["episode"]["p50_ms"]:.3f} ms | p99 {results["episode"]["p99_ms"]:.3f} ms')
+
+    return results
+
+
+def run_latency_benchmark(models: list = MODELS, verbose: bool = True) -> dict:
+    # Must run before TensorFlow creates its thread pools
+    limit_tf_threads(N_THREADS)
+    import tensorflow as tf
+    from utilities.makespan_utils import EpisodeWindowCache
+
+    episodes = np.load(f'{DATA_DIR}/{"_".join(DATA)}_data_test.npy', allow_pickle=True)
+    cache = EpisodeWindowCache(episodes)
+    X_sample = np.asarray(cache.windows[0][:64], dtype='float32')
+
+    results = {
+        'commit': get_commit(),
+        'python': sys.version,
+        'tensorflow': tf.__version__,
+        'machine': platform.processor() or platform.machine(),
+        'n_threads': N_THREADS,
+        'n_warmup': N_WARMUP,
+        'seed': SEED,
+        'models': {}
+    }
+    for model_name in models:
+        try:
+            model = load_model(model_name, X_sample)
+        except (OSError, IOError) as e:
+            print(f'{e}: model {model_name} does not exist!')
+            continue
+        if verbose:
+            print(f'====> {model_name}')
+        # Same inputs for every model
+        results['models'][model_name] = benchmark_model(model, cache, rng=np.random.default_rng(SEED), verbose=verbose)
+        tf.keras.backend.clear_session()
+
+    return results
+
+
+if __name__ == '__main__':
+    results = run_latency_benchmark()
+
+    if not os.path.exists(RESULTS_PATH):
+        os.makedirs(RESULTS_PATH)
+    with open(f'{RESULTS_PATH}/inference_latency_{results["commit"]}.json', 'w') as f:
+        json.dump(results, f, indent=4)
@@ -0,0 +1,224 @@
+import os, sys, json, time, resource, tracemalloc, cProfile, pstats, io
+sys.path.append(os.path.realpath('../'))
+# print(sys.path)
+
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2' # INFO and WARNING messages are not printed
+
+import numpy as np
+from tabulate import tabulate
+
+from benchmarks.startup_time import get_commit
+from data_management.data_preprocessing import DataPreprocessing
+from data_management.episode_index import EpisodeIndex
+from data_management.synthetic_episodes import SyntheticEpisodeModel
+from utilities.makespan_simulation import simulate_makespans
+from utilities.bootstrap import bootstrap_outcome_variables, bootstrap_mean
+
+# Whole chain from the raw episode .npy files to the makespan table, timed stage by stage:
+#   load_data -> scale_up -> scale_data -> set_episode_beginning -> windowing -> inference -> simulation -> report
+# `run_simulation` is inference + simulation. Every scale factor adds synthetic episodes to the loaded ones, so the
+# stages can be checked for scaling cliffs before the dataset actually grows
+DATA = ['reactive', 'training']
+MAX_EPISODES = None # Subset of the raw episodes (None = all)
+SCALE_FACTORS = [1, 10, 100]
+SCALE_UP = 'synthetic' # 'synthetic' (`SyntheticEpisodeModel` fitted to the loaded episodes) or 'jitter' (noisy copies)
+JITTER = 0.01 # Noise of the jittered copies, relative to each channel's std
+MODEL_NAME = 'FCN' # Saved model used for inference, an untrained FCN when it does not exist (same cost)
+CONFIDENCE = 0.9
+N_SIMULATIONS = 1000
+N_RESAMPLES = 10000
+# Windowing materializes every window as float64, it is skipped when the estimate exceeds this fraction of the RAM
+MAX_WINDOW_MEMORY_FRACTION = 0.5
+TRACE_MEMORY = True # Per stage peak of traced allocations (slows pure Python stages down)
+PROFILE = True # cProfile every stage, `.prof` files plus the top functions in the results
+N_TOP_FUNCTIONS = 10
+SEED = 0
+RESULTS_PATH = '../saved_data/benchmarks/'
+
+
+# Functions -----------------------------------------------------------------------
+def synthetic_copies(episodes: list, factor: int, rng: np.random.Generator, jitter: float = JITTER) -> list:
+    """ `episodes` plus `factor - 1` jittered copies of each, labels and timestamps untouched """
+    scaled = list(episodes)
+    for _ in range(factor - 1):
+        for ep in episodes:
+            copy = ep.copy()
+            copy[:, 1:7] += rng.normal(scale=jitter * (ep[:, 1:7].std(axis=0) + 1e-12), size=copy[:, 1:7].shape)
+            scaled.append(copy)
+
+    return scaled
+
+
+def scale_up(episodes: list, factor: int, rng: np.random.Generator, model: SyntheticEpisodeModel = None) -> list:
+    """ `episodes` plus `(factor - 1) * len(episodes)` synthetic ones, with the same failure rate """
+    if model is None:
+        return synthetic_copies(episodes, factor, rng)
+
+    n_failures = sum(ep[0, 7] == 0.0 for ep in episodes)
+    return list(episodes) + list(model.iter_episodes(
+        n_episodes=(factor - 1) * len(episodes),
+        failure_rate=n_failures / len(episodes),
+        seed=int(rng.integers(2 ** 32))
+    ))
+
+
+def physical_memory_bytes() -> int:
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+
+
+def window_memory_estimate(dp: DataPreprocessing, window_width: int = int(7.0 * 50)) -> int:
+    """ Bytes of the per-episode windows plus their stacked train/test copies """
+    n_windows = sum(max(0, len(ep) - window_width + 1) for ep in dp.truncData)
+    return 2 * n_windows * window_width * 7 * 8
+
+
+def load_inference_model(window_width: int):
+    import tensorflow as tf
+
+    try:
+        return tf.keras.models.load_model(f'../saved_models/{MODEL_NAME}.keras')
+    except (OSError, IOError):
+        from model_builds.FCN import FCN
+        print(f'--> {MODEL_NAME}.keras does not exist, timing an untrained FCN')
+        fcn = FCN(rolling_window_width=window_width)
+        fcn.build()
+        return fcn.model
+
+
+class StageTimer:
+    """ Wall time, peak traced memory, peak RSS and (optionally) a profile of each named stage """
+    def __init__(self, name: str, profile_dir: str) -> None:
+        self.name = name
+        self.profile_dir = profile_dir
+        self.stages = {}
+
+
+    def run(self, stage: str, func, *args, **kwargs):
+        profiler = cProfile.Profile() if PROFILE else None
+        if TRACE_MEMORY:
+            tracemalloc.start()
+        if profiler is not None:
+            profiler.enable()
+        t0 = time.perf_counter()
+        out = func(*args, **kwargs)
+        seconds = time.perf_counter() - t0
+        if profiler is not None:
+            profiler.disable()
+
+        result = {
+            'seconds': seconds,
+            # ru_maxrss is in kilobytes on Linux, and never decreases
+            'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        }
+        if TRACE_MEMORY:
+            result['peak_traced_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            tracemalloc.stop()
+        if profiler is not None:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            profiler.dump_stats(f'{self.profile_dir}/{self.name}_{stage}.prof')
+            stream = io.StringIO()
+            pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(N_TOP_FUNCTIONS)
+            result['top_functions'] = stream.getvalue().strip().splitlines()[-N_TOP_FUNCTIONS:]
+        self.stages[stage] = result
+        print(f'\t{stage:<22} {seconds:10.3f} s | peak RSS {result["peak_rss_mb"]:9.1f} MB')
+
+        return out
+
+
+    def skip(self, stage: str, reason: str):
+        self.stages[stage] = {'skipped': reason}
+        print(f'\t{stage:<22} skipped: {reason}')
+
+
+def run_pipeline(raw_episodes: list, scale: int, model, rng: np.random.Generator, profile_dir: str, episode_model: SyntheticEpisodeModel = None) -> dict:
+    """ All stages on the raw episodes scaled `scale` times """
+    timer = StageTimer(name=f'{scale}x', profile_dir=profile_dir)
+    dp = DataPreprocessing(sampling='none', data=DATA)
+    dp.data = timer.run('scale_up', scale_up, [ep.copy() for ep in raw_episodes], scale, rng, episode_model)
+    dp.episode_index = EpisodeIndex.from_episodes(dp.data)
+    timer.run('scale_data', dp.scale_data)
+    timer.run('set_episode_beginning', dp.set_episode_beginning)
+
+    estimate = window_memory_estimate(dp)
+    if estimate > MAX_WINDOW_MEMORY_FRACTION * physical_memory_bytes():
+        timer.skip('windowing', f'needs ~{estimate / 2 ** 30:.1f} GB')
+        n_test = int(len(dp.episode_rows) * dp.testFrac)
+        test_episodes = [dp.data[j] for j in dp.episode_rows[len(dp.episode_rows) - n_test:]]
+    else:
+        def windowing():
+            dp.get_complete_twist_windows()
+            dp.stack_windows()
+            dp.capture_test_episodes()
+        timer.run('windowing', windowing)
+        test_episodes = [dp.data[dp.episode_rows[i]] for i in dp.test_indices]
+        dp.window_data = None
+
+    from utilities.makespan_utils import EpisodeWindowCache, batched_episode_outcomes
+    def inference():
+        cache = EpisodeWindowCache(test_episodes)
+        return batched_episode_outcomes(model=model, cache=cache, confidence=CONFIDENCE)
+    table = timer.run('inference', inference)
+
+    def simulation():
+        try:
+            makespans, _ = simulate_makespans(table=table, n_simulations=N_SIMULATIONS, rng=rng)
+        except ValueError:
+            # No episode ever finishes the task with this model
+            makespans = np.full(N_SIMULATIONS, np.inf)
+        return makespans, bootstrap_outcome_variables(table, n_resamples=N_RESAMPLES, seed=SEED), bootstrap_mean(makespans, n_resamples=N_RESAMPLES, seed=SEED)
+    makespans, ci, mean_ci = timer.run('simulation', simulation)
+
+    def report():
+        return tabulate(
+            [[key, value['estimate'], value['low'], value['high']] for key, value in ci.items()] +
+            [['Simulated makespan', mean_ci['estimate'], mean_ci['low'], mean_ci['high']]],
+            headers=['Variable', 'Estimate', 'CI low', 'CI high']
+        )
+    timer.run('report', report)
+
+    return {
+        'scale': scale,
+        'n_episodes': len(dp.data),
+        'n_test_episodes': len(test_episodes),
+        'stages': timer.stages,
+        'total_seconds': float(sum(s.get('seconds', 0.0) for s in timer.stages.values()))
+    }
+
+
+def run_pipeline_benchmark(scale_factors: list = SCALE_FACTORS, max_episodes: int = MAX_EPISODES) -> dict:
+    rng = np.random.default_rng(SEED)
+    commit = get_commit()
+    profile_dir = f'{RESULTS_PATH}/pipeline_profiles_{commit}'
+
+    print('====> Loading raw episodes')
+    loader = StageTimer(name='raw', profile_dir=profile_dir)
+    dp = DataPreprocessing(sampling='none', data=DATA)
+    loader.run('load_data', dp.load_data)
+    raw_episodes = dp.data if max_episodes is None else dp.data[:max_episodes]
+
+    model = load_inference_model(window_width=int(7.0 * 50))
+    episode_model = SyntheticEpisodeModel.fit(raw_episodes) if SCALE_UP == 'synthetic' else None
+    results = {'commit': commit, 'python': sys.version, 'n_raw_episodes': len(raw_episodes), 'scale_up': SCALE_UP, 'load': loader.stages, 'scales': {}}
+    for scale in scale_factors:
+        print(f'====> Pipeline at {scale}x ({scale * len(raw_episodes)} episodes)')
+        results['scales'][scale] = run_pipeline(raw_episodes, scale, model, rng, profile_dir, episode_model)
+
+    return results
+
+
+if __name__ == '__main__':
+    results = run_pipeline_benchmark()
+
+    stages = list(next(iter(results['scales'].values()))['stages'].keys())
+    print(tabulate(
+        [
+            [stage] + [res['stages'][stage].get('seconds', 'skipped') for res in results['scales'].values()]
+            for stage in stages
+        ] + [['total'] + [res['total_seconds'] for res in results['scales'].values()]],
+        headers=['Stage [s]'] + [f'{scale}x' for scale in results['scales']]
+    ))
+
+    if not os.path.exists(RESULTS_PATH):
+        os.makedirs(RESULTS_PATH)
+    with open(f'{RESULTS_PATH}/pipeline_{results["commit"]}.json', 'w') as f:
+        json.dump(results, f, indent=4)
@@ -0,0 +1,105 @@
+import os, sys, json, time, subprocess
+sys.path.append(os.path.realpath('../'))
+# print(sys.path)
+
+import numpy as np
+
+# Every import is timed in a fresh interpreter, so nothing is cached between measurements.
+# Entries are (working directory relative to `src`, module name), the scripts resolve their imports from there
+MODULES_TO_TIME = [
+    ('utilities', 'utilities.utils'),
+    ('utilities', 'utilities.makespan_equations'),
+    ('utilities', 'utilities.makespan_plots'),
+    ('utilities', 'utilities.makespan_simulation'),
+    ('utilities', 'utilities.bootstrap'),
+    ('data_management', 'data_management.data_preprocessing'),
+    ('runners', 'statistical_testing_simulation_results'),
+    ('runners', 'makespan_plotter'),
+    ('utilities', 'utilities.makespan_utils'),
+]
+# Modules that must NOT pull TensorFlow in
+TF_FREE_MODULES = [
+    'utilities.utils',
+    'utilities.makespan_equations',
+    'utilities.makespan_plots',
+    'utilities.makespan_simulation',
+    'utilities.bootstrap',
+    'data_management.data_preprocessing',
+    'statistical_testing_simulation_results',
+    'makespan_plotter',
+]
+N_REPEATS = 5
+SRC_PATH = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+RESULTS_PATH = '../saved_data/benchmarks/'
+
+TIMER_CODE = '''
+import os, sys, time, json
+sys.path.append(os.path.realpath('../'))
+t0 = time.perf_counter()
+import {module}
+t1 = time.perf_counter()
+print(json.dumps({{'seconds': t1 - t0, 'tensorflow_loaded': 'tensorflow' in sys.modules}}))
+'''
+
+
+def time_import(module: str, cwd: str):
+    """ Time a single import of `module` in a fresh interpreter started in `cwd` """
+    out = subprocess.run(
+        [sys.executable, '-c', TIMER_CODE.format(module=module)],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+        env={**os.environ, 'TF_CPP_MIN_LOG_LEVEL': '2'}
+    )
+    if out.returncode != 0:
+        print(f'--> Could not import {module}: {out.stderr.strip().splitlines()[-1]}')
+        return None
+
+    # Modules may print at import time, the measurement is always the last line
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def get_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SRC_PATH, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return 'unknown'
+
+
+def run_startup_benchmark(modules: list = MODULES_TO_TIME, n_repeats: int = N_REPEATS, verbose: bool = True):
+    results = {'commit': get_commit(), 'python': sys.version, 'n_repeats': n_repeats, 'modules': {}}
+    for rel_dir, module in modules:
+        times = []
+        tf_loaded = False
+        for _ in range(n_repeats):
+            res = time_import(module=module, cwd=os.path.join(SRC_PATH, rel_dir))
+            if res is None:
+                break
+            times.append(res['seconds'])
+            tf_loaded = tf_loaded or res['tensorflow_loaded']
+
+        if len(times) == 0:
+            results['modules'][module] = {'error': 'import failed'}
+            continue
+
+        results['modules'][module] = {
+            'mean_s': float(np.mean(times)),
+            'min_s': float(np.min(times)),
+            'max_s': float(np.max(times)),
+            'tensorflow_loaded': tf_loaded
+        }
+        if verbose:
+            print(f'{module:<45} {np.mean(times):8.3f} s (min {np.min(times):.3f} s) | TensorFlow loaded: {tf_loaded}')
+        if tf_loaded and module in TF_FREE_MODULES:
+            print(f'WARNING: {module} should not import TensorFlow!')
+
+    return results
+
+
+if __name__ == '__main__':
+    results = run_startup_benchmark()
+
+    if not os.path.exists(RESULTS_PATH):
+        os.makedirs(RESULTS_PATH)
+    with open(f'{RESULTS_PATH}/startup_time_{results["commit"]}.json', 'w') as f:
+        json.dump(results, f, indent=4)
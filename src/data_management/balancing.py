@@ -0,0 +1,65 @@
+import sys, os, json
+sys.path.append(os.path.realpath('../'))
+# print(sys.path)
+
+import numpy as np
+
+# Class balancing as index arrays into the (unbalanced) window arrays, applied lazily by the training pipeline:
+#   * 'under': every class down to the size of the smallest one, without replacement
+#   * 'over': every class up to the size of the largest one, minority windows repeated
+#   * 'weighted': all windows, with per-class sample weights n / (n_classes * n_class)
+#   * 'batch': all windows, class-balanced batches are drawn on the fly by `BalancedBatchSequence`
+#   * 'none': all windows
+BALANCING_MODES = ('none', 'under', 'over', 'weighted', 'batch')
+
+
+# Functions -----------------------------------------------------------------------
+def class_labels(Y) -> np.ndarray:
+    """ Integer class of every window, from one-hot targets (or already integer labels) """
+    Y = np.asarray(Y)
+    return Y.argmax(axis=1) if Y.ndim == 2 else Y.astype(int)
+
+
+def balanced_indices(labels: np.ndarray, mode: str, rng: np.random.Generator) -> np.ndarray:
+    """ Sorted positions into `labels` of the windows to train on with balancing `mode` """
+    if mode in ('none', 'weighted', 'batch'):
+        return np.arange(len(labels))
+    elif mode not in BALANCING_MODES:
+        raise ValueError(f'Unknown balancing mode {mode}')
+
+    by_class = [np.flatnonzero(labels == c) for c in np.unique(labels)]
+    counts = [len(idx) for idx in by_class]
+    if mode == 'under':
+        chosen = [rng.choice(idx, size=min(counts), replace=False) for idx in by_class]
+    else:
+        chosen = [np.concatenate([idx, rng.choice(idx, size=max(counts) - len(idx), replace=True)]) for idx in by_class]
+
+    return np.sort(np.concatenate(chosen))
+
+
+def class_weights(labels: np.ndarray) -> dict:
+    """ Weight of every class so that all classes add up to the same total, as sklearn's 'balanced' """
+    classes, counts = np.unique(labels, return_counts=True)
+    return {int(c): len(labels) / (len(classes) * n) for c, n in zip(classes, counts)}
+
+
+def save_class_weight(path: str, class_weight: dict):
+    """ Per-class weights of the 'weighted' sampling as JSON, next to the train indices """
+    with open(path, 'w') as f:
+        json.dump({str(c): w for c, w in class_weight.items()}, f, indent=4)
+
+
+def load_class_weight(path: str):
+    """ {class: weight} saved by `save_class_weight`, None when the data was not saved with 'weighted' sampling """
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return {int(c): float(w) for c, w in json.load(f).items()}
+
+
+def load_train_indices(data_dir: str, data_prefix: str, n_windows: int) -> np.ndarray:
+    """ Balanced train windows saved by `DataPreprocessing.run`, or all of them for data saved before balancing by index """
+    path = f'{data_dir}/{data_prefix}_train_indices.npy'
+    if os.path.exists(path):
+        return np.load(path)
+    return np.arange(n_windows)
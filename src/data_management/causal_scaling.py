@@ -0,0 +1,202 @@
+import sys, os
+sys.path.append(os.path.realpath('../'))
+# print(sys.path)
+
+import numpy as np
+from scipy.signal import lfilter
+
+from data_management.robust_scaling import QUANTILE_RANGE, FT_COLS
+
+# Spreads below this (the first samples of an episode, a still sensor) leave the channel unscaled instead of dividing
+# free-motion noise by a near-zero IQR / std
+MIN_SCALE = 1e-2
+
+# Normalization that only uses the samples seen so far, so a live monitor scales every sample exactly like training
+# did, as soon as it arrives. Both scalers run sample by sample (`partial_transform`) or over stored episodes
+# (`causal_scale_episodes`), with the same statistics up to floating point rounding:
+#   * CausalRobustScaler: running median / IQR from P^2 quantile estimators (Jain & Chlamtac, 1985)
+#   * EMAScaler: exponential moving mean and standard deviation
+# Channels with a spread up to `MIN_SCALE` are left unscaled, as `RobustScaler` does with constant features
+
+
+# Classes --------------------------------------------------------------------------
+class P2Quantile:
+    """ P^2 estimate of the `p` quantile of every element of a stream of arrays of `shape`, O(1) memory
+
+    The first 5 samples are kept and their exact quantile is returned, then 5 markers are moved with piecewise
+    parabolic interpolation. `p` may be an array broadcastable to `shape`, `update` takes an optional `active`
+    mask so ragged episodes can be stepped together """
+    def __init__(self, p, shape: tuple = ()) -> None:
+        self.shape = shape
+        p = np.broadcast_to(np.asarray(p, dtype=float), shape).reshape(-1)
+        self.p = p
+        # Marker i of all elements is row i of a (5, n) array, so every marker update is contiguous
+        self.count = np.zeros(len(p), dtype=int)
+        self.heights = np.zeros((5, len(p)))
+        self.positions = np.tile(np.arange(1.0, 6.0)[:, None], (1, len(p)))
+        self.desired = np.stack([np.ones_like(p), 1.0 + 2 * p, 1.0 + 4 * p, 3.0 + 2 * p, np.full_like(p, 5.0)])
+        self.increments = np.stack([np.zeros_like(p), p / 2, p, (1.0 + p) / 2, np.ones_like(p)])
+
+
+    def update(self, x: np.ndarray, active: np.ndarray = None):
+        x = np.broadcast_to(np.asarray(x, dtype=float), self.shape).reshape(-1)
+        active = np.ones(len(x), dtype=bool) if active is None else np.broadcast_to(active, self.shape).reshape(-1)
+
+        # Warm up: the first 5 samples fill the markers, kept sorted (unused slots sort to the end)
+        filling = active & (self.count < 5)
+        if np.any(filling):
+            cols = np.flatnonzero(filling)
+            heights = self.heights[:, cols]
+            heights[self.count[cols], np.arange(len(cols))] = x[cols]
+            heights = np.sort(np.where(np.arange(5)[:, None] < self.count[cols] + 1, heights, np.inf), axis=0)
+            self.heights[:, cols] = np.where(np.isfinite(heights), heights, 0.0)
+        running = active & (self.count >= 5)
+        self.count = self.count + active
+        if not np.any(running):
+            return
+
+        # Cell of the new sample, extreme markers follow new minima / maxima
+        q = self.heights.copy()
+        np.minimum(q[0], x, out=q[0])
+        np.maximum(q[4], x, out=q[4])
+        k = (x >= q[1]).astype(int) + (x >= q[2]) + (x >= q[3])
+        n = self.positions + (np.arange(5)[:, None] > k)
+        desired = self.desired + self.increments
+
+        for i in range(1, 4):
+            d = desired[i] - n[i]
+            move = ((d >= 1) & (n[i + 1] - n[i] > 1)) | ((d <= -1) & (n[i - 1] - n[i] < -1))
+            d = np.sign(d)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                parabolic = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+                    (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+                )
+                linear = np.where(
+                    d > 0,
+                    q[i] + (q[i + 1] - q[i]) / (n[i + 1] - n[i]),
+                    q[i] - (q[i - 1] - q[i]) / (n[i - 1] - n[i])
+                )
+            new_height = np.where((q[i - 1] < parabolic) & (parabolic < q[i + 1]), parabolic, linear)
+            q[i] = np.where(move, new_height, q[i])
+            n[i] = np.where(move, n[i] + d, n[i])
+
+        self.heights = np.where(running, q, self.heights)
+        self.positions = np.where(running, n, self.positions)
+        self.desired = np.where(running, desired, self.desired)
+
+
+    @property
+    def value(self) -> np.ndarray:
+        """ Current estimate, exact (linear interpolation) while fewer than 5 samples were seen """
+        seen = np.clip(self.count, 1, 5)
+        rank = self.p * (seen - 1)
+        low = np.floor(rank).astype(int)
+        high = np.minimum(low + 1, seen - 1)
+        frac = rank - low
+        cols = np.arange(len(self.p))
+        exact = self.heights[low, cols] * (1 - frac) + self.heights[high, cols] * frac
+
+        return np.where(self.count >= 5, self.heights[2], exact).reshape(self.shape)
+
+
+class CausalRobustScaler:
+    """ (x - running median) / running IQR, statistics include the current sample """
+    def __init__(self, shape: tuple = (6,), quantile_range: tuple = QUANTILE_RANGE, min_scale: float = MIN_SCALE) -> None:
+        # The three quantiles of every element are tracked by one estimator
+        qs = np.array([quantile_range[0], 50.0, quantile_range[1]]) / 100.0
+        self.quantiles = P2Quantile(qs.reshape((3,) + (1,) * len(shape)), (3,) + tuple(shape))
+        self.min_scale = min_scale
+
+
+    def update(self, x: np.ndarray, active: np.ndarray = None):
+        self.quantiles.update(x, active)
+
+
+    def statistics(self) -> tuple:
+        low, median, high = self.quantiles.value
+        scale = high - low
+
+        return median, np.where(scale > self.min_scale, scale, 1.0)
+
+
+    def partial_transform(self, x: np.ndarray) -> np.ndarray:
+        """ Scale one new sample (e.g. the 6 F/T channels read by the controller) """
+        self.update(x)
+        center, scale = self.statistics()
+
+        return (np.asarray(x, dtype=float) - center) / scale
+
+
+class EMAScaler:
+    """ (x - exponential moving mean) / exponential moving std, statistics include the current sample
+
+    `alpha` is the weight of the newest sample, e.g. 1 - exp(-ts / tau) for a time constant tau """
+    def __init__(self, shape: tuple = (6,), alpha: float = 0.01, min_scale: float = MIN_SCALE) -> None:
+        self.alpha = alpha
+        self.min_scale = min_scale
+        self.mean = np.zeros(shape)
+        self.var = np.zeros(shape)
+        self.started = False
+
+
+    def partial_transform(self, x: np.ndarray) -> np.ndarray:
+        x = np.asarray(x, dtype=float)
+        if not self.started:
+            self.mean = x.copy()
+            self.started = True
+        else:
+            delta = x - self.mean
+            self.mean = self.mean + self.alpha * delta
+            self.var = (1.0 - self.alpha) * (self.var + self.alpha * delta ** 2)
+        scale = np.sqrt(self.var)
+
+        return (x - self.mean) / np.where(scale > self.min_scale, scale, 1.0)
+
+
+    def transform_series(self, X: np.ndarray) -> np.ndarray:
+        """ Whole (time, channels) series at once with linear filters, same recursion as `partial_transform` """
+        a = self.alpha
+        mean = np.empty_like(X, dtype=float)
+        mean[0] = X[0]
+        # mean[t] = (1 - a) mean[t-1] + a x[t], started at x[0]
+        mean[1:] = lfilter([a], [1.0, -(1.0 - a)], X[1:], axis=0, zi=((1.0 - a) * X[0])[None, :])[0]
+        delta = np.zeros_like(mean)
+        delta[1:] = X[1:] - mean[:-1]
+        var = lfilter([(1.0 - a) * a], [1.0, -(1.0 - a)], delta ** 2, axis=0)
+        scale = np.sqrt(var)
+        self.mean, self.var, self.started = mean[-1], var[-1], True
+
+        return (X - mean) / np.where(scale > self.min_scale, scale, 1.0)
+
+
+# Functions -----------------------------------------------------------------------
+def causal_scale_episodes(episodes: list, method: str = 'quantile', cols: slice = FT_COLS, **kwargs) -> list:
+    """ Scale every stored episode in place with the statistics a streaming scaler would have at each sample
+
+    'quantile' steps all episodes together through time (vectorized over episodes and channels), 'ema' filters
+    each episode in one call. `kwargs` go to the scaler """
+    if method == 'ema':
+        for ep in episodes:
+            ep[:, cols] = EMAScaler(shape=(ep[:, cols].shape[1],), **kwargs).transform_series(ep[:, cols])
+        return episodes
+    elif method != 'quantile':
+        raise ValueError(f'Unknown causal scaling method {method}')
+
+    lengths = np.array([len(ep) for ep in episodes])
+    n_channels = episodes[0][:, cols].shape[1]
+    padded = np.zeros((len(episodes), lengths.max(), n_channels))
+    for i, ep in enumerate(episodes):
+        padded[i, :lengths[i]] = ep[:, cols]
+
+    scaler = CausalRobustScaler(shape=(len(episodes), n_channels), **kwargs)
+    for t in range(lengths.max()):
+        active = np.repeat((lengths > t)[:, None], n_channels, axis=1)
+        scaler.update(padded[:, t], active)
+        center, scale = scaler.statistics()
+        padded[:, t] = (padded[:, t] - center) / scale
+
+    for i, ep in enumerate(episodes):
+        ep[:, cols] = padded[i, :lengths[i]]
+
+    return episodes
@@ -3,14 +3,12 @@ import random
 sys.path.append(os.path.realpath('../'))
 # print(sys.path)
 
-os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2' # INFO and WARNING messages are not printed
-
 import numpy as np
-import tensorflow as tf
 
-from imblearn.under_sampling import RandomUnderSampler
-from imblearn.over_sampling import RandomOverSampler, SMOTE
-from sklearn.preprocessing import RobustScaler
+from data_management.robust_scaling import GlobalRobustScaler, robust_scale_episodes
+from data_management.causal_scaling import causal_scale_episodes
+from data_management.balancing import class_labels, balanced_indices, class_weights, save_class_weight
+from data_management.episode_index import EpisodeIndex, FZ_COL
 
 from random import shuffle
 from copy import deepcopy
@@ -18,14 +16,18 @@ from copy import deepcopy
 # SHUFFLING ONLY ON EPISODES!!!! NOT ON WINDOWS
 
 class DataPreprocessing:
-    def __init__(self, sampling: str = 'over' or 'under' or 'none', data: list = []) -> None:
+    def __init__(self, sampling: str = 'over' or 'under' or 'weighted' or 'none', data: list = [], scaling: str = 'episode' or 'global' or 'causal_quantile' or 'causal_ema') -> None:
         self.sampling = sampling
+        self.scaling = scaling
+        self.global_scaler = None # ---- Set before `run` to reuse a saved `GlobalRobustScaler`
         self.data_names = data
 
         self.data_dirs = []
         # self.datadir = os.path.join(os.path.dirname(os.path.abspath('../')), f'data/Npy_files/{data}/')
         self.shuffle = True
         self.data = None
+        self.episode_index = None # ---- `EpisodeIndex` of `data`: label, length, impact, window count, source and file
+        self.episode_rows = None # ----- Row in `episode_index` of every episode of `truncData` / `window_data`
         self.truncData = None
         self.window_data = None
         self.testFrac = 0.20
@@ -36,6 +38,12 @@ class DataPreprocessing:
         self.testWindows = 0
         self.train_indices = []
         self.test_indices = []
+        self.train_offsets = None # ---- Start of each train episode in X_train (before balancing), plus the total
+        self.test_offsets = None
+        self.train_groups = None # ----- Train episode of each window in X_train
+        self.train_sample_indices = None # Windows of X_train to train on after balancing, X_train itself is not copied
+        self.class_weight = None # ----- Per-class sample weights of the 'weighted' sampling
+        self.seed = None
         self.X_train = None
         self.Y_train = None
         self.X_test = None
@@ -54,12 +62,14 @@ class DataPreprocessing:
         self.create_data_dirs()
         ext      = "*.npy"
         npyFiles = []
-        for data_dir in self.data_dirs:
+        sources  = {}
+        for data_name, data_dir in zip(self.data_names, self.data_dirs):
             print(data_dir)
             files = glob.glob(data_dir + ext)
             if verbose:
                 print( f"Found {len(files)} {ext} files!" )
             npyFiles += files
+            sources.update({file: data_name for file in files})
 
         if verbose:
             print(f'Total number of files found is {len(npyFiles)}')
@@ -70,47 +80,48 @@ class DataPreprocessing:
                 print( "Shuffled files!" )
 
         epData = []
-        N_s    = 0
-        N_f    = 0
         for file in npyFiles:
             epMatx = np.array( np.load( file ) ).astype( dtype = float )
-            if epMatx[0,7] == 1.0:
-                N_s += 1
-            elif epMatx[0,7] == 0.0:
-                N_f += 1
             epData.append( epMatx )
             if verbose:
                 print( '>', end=' ' )
-        
+
+        self.episode_index = EpisodeIndex.from_episodes(
+            epData,
+            sources=[sources[file] for file in npyFiles],
+            files=[os.path.basename(file) for file in npyFiles]
+        )
+        N_s = int(np.sum(self.episode_index.success))
+        N_f = len(epData) - N_s
+
         if verbose:
             print( f"\nCreated {len(epData)} episode matrices!" )
             print( f"{N_s} successes, {N_f} failures, Success Rate: {N_s/(N_s+N_f)}, Failure Rate: {N_f/(N_s+N_f)}" )
         self.data = epData
 
 
+    def locate_impacts(self):
+        """ First F_z hit of every episode, on copies of F_z scaled by the episode median / IQR
+
+        `IMPACT_THRESH` is tuned for that scaling. Under the causal scalings free-motion noise is divided by its own
+        tiny running spread and crosses it almost at once, so the impacts are located before any scaling and kept """
+        fz = [ep[:, :FZ_COL + 1].copy() for ep in self.data]
+        self.episode_index.locate_impacts(robust_scale_episodes(fz, cols=slice(FZ_COL, FZ_COL + 1)))
+
+
+    def kept_rows(self) -> np.ndarray:
+        """ Rows of the episodes `set_episode_beginning` keeps, the first N_train of them are the train split """
+        # Dump episodes that do not fit criteria, 2022-08-31: Dumped 5 episodes
+        return np.flatnonzero((self.episode_index.trunc_start*20/1000) < 15.0)
+
+
     def set_episode_beginning(self, verbose=False):
-        # Begin each ep at 1st imapct 
-        truncData   = []
-        winWidth    = 10
-        FzCol       =  3
-        spikeThresh = 0.05
-
-        # For every episode
-        for j, epMatx in enumerate( self.data ):
-            # Look for the first spike in F_z
-            N          = epMatx.shape[0]
-            chopDex    = 0
-            for bgn in range( int(1.5*50), N-winWidth+1 ):
-                end     = bgn+winWidth
-                FzSlice = epMatx[ bgn:end, FzCol ].flatten()
-                if np.abs( np.amax( FzSlice ) - np.amin( FzSlice ) ) >= spikeThresh:
-                    chopDex = bgn
-                    break
-            if (chopDex*20/1000) < 15.0:
-                truncData.append( epMatx[ chopDex:,: ] )
-            # else dump an episode that does not fit criteria, 2022-08-31: Dumped 5 episodes
-            if verbose:
-                print( '>', end=' ' )
+        # Begin each ep at 1st imapct, located by `scale_data` before scaling
+        chopDexs = self.episode_index.trunc_start
+        self.episode_rows = self.kept_rows()
+        truncData = [self.data[j][chopDexs[j]:, :] for j in self.episode_rows]
+        if verbose:
+            print( '> ' * len(self.data), end='' )
         
         if verbose:
             print( f"\nTruncated {len(truncData)} episodes!" )
@@ -158,6 +169,14 @@ class DataPreprocessing:
             self.testWindows += ep.shape[0]
             i += 1
 
+        train_rows = self.episode_rows[self.train_indices]
+        test_rows = self.episode_rows[self.test_indices]
+        train_counts = self.episode_index.n_windows[train_rows]
+        test_counts = self.episode_index.n_windows[test_rows]
+        self.train_offsets = np.concatenate(([0], np.cumsum(train_counts))).astype(int)
+        self.test_offsets = np.concatenate(([0], np.cumsum(test_counts))).astype(int)
+        self.train_groups = np.repeat(np.arange(self.N_train), train_counts)
+
         if verbose:
             print( f"{self.trainWindows} windows to Train and {self.testWindows} to Test" )
             print( f"All episodes accounted for?: {i == self.N_ep}, {i}, {self.N_ep}" )
@@ -200,50 +219,18 @@ class DataPreprocessing:
             print( f"\nTest X shape: {self.X_test.shape}" )
             print( f"\nTest Y shape: {self.Y_test.shape}" )
 
-        i   = 0 
-        k   = 0
-        pos = 0
-        neg = 0
+        # Label of every window from its episode (window[0,6] is the success flag of the episode)
+        self.Y_train[:, 0] = np.repeat(self.episode_index.label[train_rows], train_counts)
+        self.Y_test[:, 0] = np.repeat(self.episode_index.label[test_rows], test_counts)
+        neg = int(self.Y_train.sum() + self.Y_test.sum())
+        pos = self.trainWindows + self.testWindows - neg
 
-        for j in range( self.N_train ):
-            ep = self.window_data[i]
-            for window in ep:
-                if datasetTrain[k,0,6] == 1.0:
-                    self.Y_train[k,0] = 0
-                    pos += 1
-                elif datasetTrain[k,0,6] == 0.0:
-                    self.Y_train[k,0] = 1
-                    neg += 1
-                else:
-                    raise ValueError( "BAD LABEL" )
-                k += 1
-            i += 1
-            if verbose:
-                print( i, end = " " )
-            
-        k = 0
-
-        for j in range( self.N_test ):
-            ep = self.window_data[i]
-            for window in ep:
-                if datasetTest[k,0,6] == 1.0:
-                    self.Y_test[k,0] = 0
-                    pos += 1
-                elif datasetTest[k,0,6] == 0.0:
-                    self.Y_test[k,0] = 1
-                    neg += 1
-                else:
-                    raise ValueError( "BAD LABEL" )
-                k += 1
-            i += 1
-            if verbose:
-                print( i, end = " " )
-        
         if verbose:
             print( '\n' )
             print( self.Y_train.shape, self.Y_test.shape )
-        self.Y_train = tf.keras.utils.to_categorical(self.Y_train, num_classes=2)
-        self.Y_test  = tf.keras.utils.to_categorical(self.Y_test, num_classes=2)
+        # One-hot encoding, same output as `tf.keras.utils.to_categorical` without importing TensorFlow
+        self.Y_train = np.eye(2, dtype='float32')[self.Y_train[:, 0].astype(int)]
+        self.Y_test  = np.eye(2, dtype='float32')[self.Y_test[:, 0].astype(int)]
         if verbose:
             print( self.Y_train.shape, self.Y_test.shape )
             print( f"\nThere are {pos} ({(pos * 100) / (pos + neg):.2f}%) passing windows and {neg} ({(neg * 100) / (pos + neg):.2f}%) failing windows!, Total: {pos+neg}" )
@@ -257,12 +244,8 @@ class DataPreprocessing:
             ep = self.window_data[i]
             self.X_winTest.append( ep[ :, :, 0:6 ] )
             y_i = np.zeros( (ep.shape[0], 2) )
-            if ep[ 0, 0, 6 ] == 1.0:
-                y_i[:,:] = [1.0, 0.0]
-                self.Y_winTest.append( y_i ) 
-            elif ep[ 0, 0, 6 ] == 0.0:
-                y_i[:,:] = [0.0, 1.0]
-                self.Y_winTest.append( y_i )
+            y_i[:, self.episode_index.label[self.episode_rows[i]]] = 1.0
+            self.Y_winTest.append( y_i )
             if verbose:
                 print( '>', end=' ' )
 
@@ -274,26 +257,36 @@ class DataPreprocessing:
 
 
     def balance_classes(self, verbose=False):
+        labels = class_labels(self.Y_train)
         if verbose:
             print('    ====> CLASSES DISTRIBUTION BEFORE:')
-            print(f'        Passes = {int(sum(self.Y_train[:,0]))}; Fails = {int(sum(self.Y_train[:,1]))}\n')
+            print(f'        Passes = {int(np.sum(labels == 0))}; Fails = {int(np.sum(labels == 1))}\n')
 
-        # No oversampling
-        if self.sampling == 'under':
-            undersampler = RandomUnderSampler(sampling_strategy='majority')
-            undersampler.fit_resample(self.X_train[:,:,0], self.Y_train)
-            self.X_train = self.X_train[undersampler.sample_indices_]
-            self.Y_train = self.Y_train[undersampler.sample_indices_]
+        # Only the indices are kept, `WindowSequence(..., balance=...)` can also re-draw them every epoch
+        self.train_sample_indices = balanced_indices(labels, mode=self.sampling, rng=np.random.default_rng(self.seed))
+        if self.sampling == 'weighted':
+            self.class_weight = class_weights(labels)
 
         if verbose:
             print('    ====> CLASSES DISTRIBUTION AFTER:')
-            print(f'        Passes = {int(sum(self.Y_train[:,0]))}; Fails = {int(sum(self.Y_train[:,1]))}\n')
+            print(f'        Passes = {int(np.sum(labels[self.train_sample_indices] == 0))}; Fails = {int(np.sum(labels[self.train_sample_indices] == 1))}\n')
 
 
     def scale_data(self, verbose=False):
-        for index, ep in enumerate(self.data):
-            scaler = RobustScaler().fit(ep[:, 1:7])
-            self.data[index][:, 1:7] = scaler.transform(ep[:, 1:7])
+        self.locate_impacts()
+        if self.scaling == 'global':
+            if self.global_scaler is None:
+                # Fitted on exactly the episodes of the later train split, same split as `stack_windows`
+                kept = self.kept_rows()
+                n_train = len(kept) - int(len(kept) * self.testFrac)
+                self.global_scaler = GlobalRobustScaler().fit([self.data[j] for j in kept[:n_train]])
+            self.global_scaler.transform(self.data)
+        elif self.scaling in ('causal_quantile', 'causal_ema'):
+            # Statistics of the samples seen so far only, what a streaming monitor can reproduce online
+            causal_scale_episodes(self.data, method=self.scaling[len('causal_'):])
+        else:
+            # Median / IQR of every episode, same result as one `RobustScaler` per episode
+            robust_scale_episodes(self.data)
 
 
     def run(self, save_data=False, verbose=False):
@@ -333,10 +326,10 @@ class DataPreprocessing:
                 np.save(f, np.asarray(self.data, dtype=object), allow_pickle=True)
 
             with open(f'{save_dir}/{"_".join(self.data_names)}_data_train.npy', 'wb') as f:
-                np.save(f, np.asarray([self.data[i] for i in self.train_indices], dtype=object), allow_pickle=True)
+                np.save(f, np.asarray([self.data[self.episode_rows[i]] for i in self.train_indices], dtype=object), allow_pickle=True)
 
             with open(f'{save_dir}/{"_".join(self.data_names)}_data_test.npy', 'wb') as f:
-                np.save(f, np.asarray([self.data[i] for i in self.test_indices], dtype=object), allow_pickle=True)
+                np.save(f, np.asarray([self.data[self.episode_rows[i]] for i in self.test_indices], dtype=object), allow_pickle=True)
 
             with open(f'{save_dir}/{"_".join(self.data_names)}_trunc_data.npy', 'wb') as f:
                 np.save(f, np.asarray(self.truncData, dtype=object), allow_pickle=True)
@@ -347,6 +340,18 @@ class DataPreprocessing:
             with open(f'{save_dir}/{"_".join(self.data_names)}_Y_train.npy', 'wb') as f:
                 np.save(f, self.Y_train, allow_pickle=True)
 
+            with open(f'{save_dir}/{"_".join(self.data_names)}_train_indices.npy', 'wb') as f:
+                np.save(f, self.train_sample_indices)
+
+            class_weight_path = f'{save_dir}/{"_".join(self.data_names)}_class_weight.json'
+            if self.class_weight is not None:
+                save_class_weight(class_weight_path, self.class_weight)
+            elif os.path.exists(class_weight_path):
+                os.remove(class_weight_path)
+
+            with open(f'{save_dir}/{"_".join(self.data_names)}_train_groups.npy', 'wb') as f:
+                np.save(f, self.train_groups)
+
             with open(f'{save_dir}/{"_".join(self.data_names)}_X_test.npy', 'wb') as f:
                 np.save(f, self.X_test, allow_pickle=True)
 
@@ -359,6 +364,11 @@ class DataPreprocessing:
             with open(f'{save_dir}/{"_".join(self.data_names)}_Y_winTest.npy', 'wb') as f:
                 np.save(f, self.Y_winTest, allow_pickle=True)
 
+            self.episode_index.save(f'{save_dir}/{"_".join(self.data_names)}_episode_index.npz')
+
+            if self.global_scaler is not None:
+                self.global_scaler.save(f'{save_dir}/{"_".join(self.data_names)}_global_scaler.json')
+
             if verbose:
                 print('DONE\n')
 
@@ -0,0 +1,167 @@
+import sys, os
+sys.path.append(os.path.realpath('../'))
+# print(sys.path)
+
+import numpy as np
+
+# Episode matrix columns: 0 = time, 1:7 = F/T, 7 = success flag (1.0 success, 0.0 failure)
+LABEL_COL = 7
+FZ_COL = 3
+# First F_z hit: a `IMPACT_WIDTH`-sample slice with a peak-to-peak of at least `IMPACT_THRESH`, not before `IMPACT_MIN_INDEX`
+IMPACT_MIN_INDEX = int(1.5 * 50)
+IMPACT_WIDTH = 10
+IMPACT_THRESH = 0.05
+WINDOW_WIDTH = int(7.0 * 50)
+TS_S = 20.0 / 1000.0
+
+
+# Functions -----------------------------------------------------------------------
+def first_impact(episode: np.ndarray) -> int:
+    """ Start of the first F_z hit of `episode`, -1 if there is none """
+    fz = episode[IMPACT_MIN_INDEX:, FZ_COL]
+    if len(fz) < IMPACT_WIDTH:
+        return -1
+    slices = np.lib.stride_tricks.sliding_window_view(fz, IMPACT_WIDTH)
+    hits = np.flatnonzero(np.abs(slices.max(axis=1) - slices.min(axis=1)) >= IMPACT_THRESH)
+
+    return IMPACT_MIN_INDEX + int(hits[0]) if len(hits) > 0 else -1
+
+
+# Classes --------------------------------------------------------------------------
+class EpisodeIndex:
+    """ Per-episode metadata as one array per field, computed once so nothing is re-derived from the raw episodes
+
+    Row i describes episode i of the list it was built from:
+        * label: class index of the episode (0 = success, 1 = failure), as in the one-hot targets
+        * length: number of samples
+        * impact: start of the first F_z hit (-1 if none), episodes are truncated there for training
+        * trunc_length: samples from the impact on
+        * n_windows: training windows of `WINDOW_WIDTH` samples of the truncated episode
+        * source / file_id: positions into `sources` (e.g. 'reactive') and `files` """
+    FIELDS = ('label', 'length', 'impact', 'trunc_length', 'n_windows', 'source', 'file_id')
+
+    def __init__(self, label, length, impact, source, file_id, sources: list, files: list, window_width: int = WINDOW_WIDTH) -> None:
+        self.label = np.asarray(label, dtype='int8')
+        self.length = np.asarray(length, dtype='int64')
+        self.source = np.asarray(source, dtype='int16')
+        self.file_id = np.asarray(file_id, dtype='int64')
+        self.sources = list(sources)
+        self.files = list(files)
+        self.window_width = window_width
+        self._rows_by_file = {name: i for i, name in enumerate(self.files)}
+        self.set_impact(impact)
+
+
+    @classmethod
+    def from_episodes(cls, episodes: list, sources: list = None, files: list = None, window_width: int = WINDOW_WIDTH):
+        """ Index of `episodes`. `sources` and `files` are the dataset and file name of every episode, if known """
+        files = list(files) if files is not None else [str(i) for i in range(len(episodes))]
+        sources = list(sources) if sources is not None else [''] * len(episodes)
+        source_names = sorted(set(sources))
+
+        return cls(
+            label=[0 if ep[0, LABEL_COL] == 1.0 else 1 for ep in episodes],
+            length=[ep.shape[0] for ep in episodes],
+            impact=[first_impact(ep) for ep in episodes],
+            source=[source_names.index(s) for s in sources],
+            file_id=np.arange(len(episodes)),
+            sources=source_names,
+            files=files,
+            window_width=window_width
+        )
+
+
+    def set_impact(self, impact):
+        """ Impacts and everything that depends on them, e.g. after the episodes were rescaled """
+        self.impact = np.asarray(impact, dtype='int64')
+        self.trunc_length = self.length - self.trunc_start
+        self.n_windows = np.maximum(self.trunc_length - self.window_width + 1, 0)
+
+
+    def locate_impacts(self, episodes: list):
+        """ Recompute the impacts from `episodes` (same order as the index) """
+        self.set_impact([first_impact(ep) for ep in episodes])
+
+        return self
+
+
+    @property
+    def trunc_start(self) -> np.ndarray:
+        """ First sample kept by `DataPreprocessing.set_episode_beginning` """
+        return np.maximum(self.impact, 0)
+
+
+    @property
+    def decision_start(self) -> np.ndarray:
+        """ First sample classified in the makespan evaluation, the end of the impact slice """
+        return np.where(self.impact >= 0, self.impact + IMPACT_WIDTH, 0)
+
+
+    @property
+    def success(self) -> np.ndarray:
+        return self.label == 0
+
+
+    def run_times(self, ts_s: float = TS_S) -> np.ndarray:
+        """ Full duration of every episode [s] """
+        return self.length * ts_s
+
+
+    def classifiable(self, ts_s: float = TS_S) -> np.ndarray:
+        """ Episodes the makespan evaluation classifies: impact before 15 s and more than one window width of windows """
+        start = self.decision_start
+        return ((start * ts_s) < 15.0) & ((self.length - start) - self.window_width + 1 > self.window_width)
+
+
+    def row(self, file: str) -> int:
+        """ Row of the episode loaded from `file` """
+        return self._rows_by_file[file]
+
+
+    def take(self, rows):
+        """ Index of the episodes at `rows`, in that order """
+        rows = np.asarray(rows, dtype=int)
+        return EpisodeIndex(
+            label=self.label[rows],
+            length=self.length[rows],
+            impact=self.impact[rows],
+            source=self.source[rows],
+            file_id=np.arange(len(rows)),
+            sources=self.sources,
+            files=[self.files[i] for i in self.file_id[rows]],
+            window_width=self.window_width
+        )
+
+
+    def __len__(self) -> int:
+        return len(self.label)
+
+
+    def save(self, path: str):
+        np.savez(
+            path,
+            **{field: getattr(self, field) for field in self.FIELDS},
+            sources=np.asarray(self.sources, dtype=str),
+            files=np.asarray(self.files, dtype=str),
+            window_width=self.window_width
+        )
+
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path) as f:
+            return cls(
+                label=f['label'],
+                length=f['length'],
+                impact=f['impact'],
+                source=f['source'],
+                file_id=f['file_id'],
+                sources=f['sources'].tolist(),
+                files=f['files'].tolist(),
+                window_width=int(f['window_width'])
+            )
+
+
+def as_episode_index(episodes) -> EpisodeIndex:
+    """ `episodes` itself if already an `EpisodeIndex`, otherwise the index of the episode list """
+    return episodes if isinstance(episodes, EpisodeIndex) else EpisodeIndex.from_episodes(episodes)
@@ -0,0 +1,102 @@
+import sys, os, json
+sys.path.append(os.path.realpath('../'))
+# print(sys.path)
+
+import numpy as np
+
+# Same defaults as `sklearn.preprocessing.RobustScaler`: centre on the median, scale by the 25-75 % inter-quantile range
+QUANTILE_RANGE = (25.0, 75.0)
+FT_COLS = slice(1, 7)
+SEGMENT_BLOCK = 256 # Episodes sorted together, bounds the padded copy to ~block x longest episode x channels
+
+
+# Functions -----------------------------------------------------------------------
+def segment_quantiles(values: np.ndarray, offsets: np.ndarray, qs: list, block_size: int = SEGMENT_BLOCK) -> np.ndarray:
+    """ (len(qs), n_segments, n_columns) quantiles of every segment `values[offsets[i]:offsets[i + 1]]`
+
+    Linear interpolation, as `np.percentile`. Segments are padded with +inf to the longest one and sorted together,
+    `block_size` segments at a time to bound the padded copy """
+    lengths = np.diff(offsets)
+    n_segments, n_columns = len(lengths), values.shape[1]
+    out = np.empty((len(qs), n_segments, n_columns))
+    for first in range(0, n_segments, block_size):
+        block = slice(first, min(first + block_size, n_segments))
+        block_lengths = lengths[block]
+        segment = np.repeat(np.arange(len(block_lengths)), block_lengths)
+        position = np.arange(offsets[block.stop] - offsets[first]) - np.repeat(offsets[block][:len(block_lengths)] - offsets[first], block_lengths)
+        # (segment, column, sample) so every sort runs over contiguous memory
+        padded = np.full((len(block_lengths), n_columns, block_lengths.max()), np.inf)
+        padded.transpose(0, 2, 1)[segment, position] = values[offsets[first]:offsets[block.stop]]
+        padded.sort(axis=2)
+
+        rows = np.arange(len(block_lengths))
+        for k, q in enumerate(qs):
+            rank = (q / 100.0) * (block_lengths - 1)
+            low = np.floor(rank).astype(int)
+            high = np.minimum(low + 1, block_lengths - 1)
+            frac = (rank - low)[:, None]
+            out[k, block] = padded[rows, :, low] * (1.0 - frac) + padded[rows, :, high] * frac
+
+    return out
+
+
+def _robust_parameters(quantiles: np.ndarray) -> tuple:
+    """ Centre and scale from the (q_low, median, q_high) quantiles, constant columns keep a scale of 1 like sklearn """
+    scale = quantiles[2] - quantiles[0]
+    scale[scale == 0.0] = 1.0
+
+    return quantiles[1], scale
+
+
+def robust_scale_episodes(episodes: list, cols: slice = FT_COLS, quantile_range: tuple = QUANTILE_RANGE) -> list:
+    """ Every episode scaled in place by its own median and IQR, as one `RobustScaler` per episode would """
+    offsets = np.concatenate(([0], np.cumsum([len(ep) for ep in episodes])))
+    store = np.concatenate([ep[:, cols] for ep in episodes])
+    center, scale = _robust_parameters(segment_quantiles(store, offsets, [quantile_range[0], 50.0, quantile_range[1]]))
+    for i, ep in enumerate(episodes):
+        ep[:, cols] = (ep[:, cols] - center[i]) / scale[i]
+
+    return episodes
+
+
+class GlobalRobustScaler:
+    """ One median / IQR per channel over all training samples, saved with the data so inference (and streaming on the
+    controller, where a whole episode is never available) scales exactly like training did """
+    def __init__(self, center = None, scale = None, cols: slice = FT_COLS, quantile_range: tuple = QUANTILE_RANGE) -> None:
+        self.center = None if center is None else np.asarray(center, dtype=float)
+        self.scale = None if scale is None else np.asarray(scale, dtype=float)
+        self.cols = cols
+        self.quantile_range = quantile_range
+
+
+    def fit(self, episodes: list):
+        store = np.concatenate([ep[:, self.cols] for ep in episodes])
+        self.center, self.scale = _robust_parameters(np.percentile(store, [self.quantile_range[0], 50.0, self.quantile_range[1]], axis=0))
+
+        return self
+
+
+    def transform(self, episodes: list) -> list:
+        """ Scale the channels of every episode in place """
+        for ep in episodes:
+            ep[:, self.cols] = (ep[:, self.cols] - self.center) / self.scale
+
+        return episodes
+
+
+    def save(self, path: str):
+        with open(path, 'w') as f:
+            json.dump({
+                'center': self.center.tolist(),
+                'scale': self.scale.tolist(),
+                'cols': [self.cols.start, self.cols.stop],
+                'quantile_range': list(self.quantile_range)
+            }, f, indent=4)
+
+
+    @classmethod
+    def load(cls, path: str):
+        with open(path, 'r') as f:
+            params = json.load(f)
+
+        return cls(center=params['center'], scale=params['scale'], cols=slice(*params['cols']), quantile_range=tuple(params['quantile_range']))
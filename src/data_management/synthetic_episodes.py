@@ -0,0 +1,210 @@
+import sys, os, glob
+sys.path.append(os.path.realpath('../'))
+# print(sys.path)
+
+import numpy as np
+from scipy.signal import lfilter
+
+# Episode layout of `data/Npy_files`: [time (ms), Fx, Fy, Fz, Tx, Ty, Tz, label (1.0 = success), extra columns...]
+FT_COLS = slice(1, 7)
+FZ_COL = 3
+LABEL_COL = 7
+# Same first-impact rule as `DataPreprocessing.locate_impacts`
+IMPACT_SEARCH_START = int(1.5 * 50)
+IMPACT_WIDTH = 10
+IMPACT_THRESH = 0.05
+SPIKE_S = 1.0 # Part of the contact phase treated as the impact transient, the trend is fitted on the rest
+N_KNOTS = 16 # Piecewise-linear contact trend, knots evenly spaced over the contact phase so it stretches with the length
+
+
+# Functions -----------------------------------------------------------------------
+def first_impact_index(ep: np.ndarray) -> int:
+    """ Start of the first F_z spike of `ep`, 0 when there is none """
+    fz = ep[IMPACT_SEARCH_START:, FZ_COL]
+    if len(fz) < IMPACT_WIDTH:
+        return 0
+    windows = np.lib.stride_tricks.sliding_window_view(fz, IMPACT_WIDTH)
+    hits = np.flatnonzero(windows.max(axis=1) - windows.min(axis=1) >= IMPACT_THRESH)
+
+    return IMPACT_SEARCH_START + int(hits[0]) if len(hits) > 0 else 0
+
+
+def ar1_noise(phi: np.ndarray, sigma: np.ndarray, n: int, rng: np.random.Generator) -> np.ndarray:
+    """ (n, channels) AR(1) noise x[t] = phi * x[t-1] + e[t], e ~ N(0, sigma) """
+    out = np.empty((n, len(phi)))
+    innovations = rng.normal(size=(n, len(phi))) * sigma
+    for c in range(len(phi)):
+        out[:, c] = lfilter([1.0], [1.0, -phi[c]], innovations[:, c])
+
+    return out
+
+
+def trend_basis(n: int, n_spike: int, n_knots: int = N_KNOTS) -> np.ndarray:
+    """ (n, n_knots) linear interpolation weights of the knots, flat over the first `n_spike` samples """
+    u = np.clip((np.arange(n) - n_spike) / max(n - 1 - n_spike, 1), 0.0, 1.0) * (n_knots - 1)
+    return np.clip(1.0 - np.abs(u[:, None] - np.arange(n_knots)[None, :]), 0.0, 1.0)
+
+
+def fit_episode(ep: np.ndarray, ts_s: float) -> dict:
+    """ Per-channel model of one episode: free-motion level and noise, impact transient, contact trend and AR(1) noise """
+    n = len(ep)
+    impact = first_impact_index(ep)
+    ft = ep[:, FT_COLS]
+    pre = ft[:max(impact, IMPACT_SEARCH_START)]
+    post = ft[impact:]
+    t = np.arange(len(post)) * ts_s
+
+    # Contact trend fitted after the transient
+    n_spike = min(int(SPIKE_S / ts_s), max(len(post) - 2 * N_KNOTS, 0))
+    basis = trend_basis(len(post), n_spike)
+    knots, *_ = np.linalg.lstsq(basis[n_spike:], post[n_spike:], rcond=None)
+    trend = basis @ knots
+    residuals = post[n_spike:] - trend[n_spike:]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        phi = np.nan_to_num(np.sum(residuals[1:] * residuals[:-1], axis=0) / np.sum(residuals[:-1] ** 2, axis=0))
+    phi = np.clip(phi, 0.0, 0.999)
+    # Robust (MAD) innovation scale, the rare large jumps of the contact phase would otherwise inflate the noise
+    innovations = residuals[1:] - phi * residuals[:-1]
+    sigma = 1.4826 * np.median(np.abs(innovations - np.median(innovations, axis=0)), axis=0)
+
+    # Impact transient: deviation from the trend at the F_z peak, decaying exponentially
+    deviation = (post - trend)[:max(n_spike, 1)]
+    peak = int(np.argmax(np.abs(deviation[:, FZ_COL - 1])))
+    amplitude = deviation[peak]
+    below = np.flatnonzero(np.abs(deviation[peak:, FZ_COL - 1]) < np.abs(amplitude[FZ_COL - 1]) / np.e)
+    tau = max(1, int(below[0]) if len(below) > 0 else n_spike - peak) * ts_s
+
+    return {
+        'length': n,
+        'impact': impact,
+        'pre_level': pre.mean(axis=0),
+        'pre_noise': pre.std(axis=0),
+        'peak': peak,
+        'amplitude': amplitude,
+        'tau': tau,
+        'knots': knots,
+        'phi': phi,
+        'sigma': sigma,
+        'label': ep[0, LABEL_COL],
+        'extra': ep[0, LABEL_COL + 1:]
+    }
+
+
+class SyntheticEpisodeModel:
+    """ Generator of F/T episodes from per-channel models fitted to the real episodes
+
+    Every synthetic episode starts from the parameters of a random real episode of its class (keeping the joint
+    behaviour of the channels) and jitters its length, impact time and contact trend. Signals are quantized to the
+    resolution of the sensor """
+    def __init__(self, params: dict, resolution: np.ndarray, ts_ms: float, jitter: float = 0.1) -> None:
+        self.params = params
+        self.resolution = resolution
+        self.ts_ms = ts_ms
+        self.jitter = jitter
+        self.by_class = {label: np.flatnonzero(params['label'] == label) for label in (0.0, 1.0)}
+        # Spread of the contact trend across episodes of each class, scales the jitter
+        self.knots_std = {label: params['knots'][idx].std(axis=0) for label, idx in self.by_class.items()}
+
+
+    @classmethod
+    def fit(cls, episodes: list, jitter: float = 0.1):
+        ts_ms = float(np.median(np.concatenate([np.diff(ep[:, 0]) for ep in episodes])))
+        fitted = [fit_episode(ep, ts_s=ts_ms / 1000.0) for ep in episodes]
+        n_extra = max(len(f['extra']) for f in fitted)
+        params = {key: np.array([f[key] for f in fitted]) for key in fitted[0] if key != 'extra'}
+        params['extra'] = np.array([np.pad(f['extra'], (0, n_extra - len(f['extra'])), constant_values=np.nan) for f in fitted])
+
+        # Smallest step of each channel, per episode, the sensor resolution is the most common one
+        steps = []
+        for ep in episodes:
+            diffs = np.abs(np.diff(ep[:, FT_COLS], axis=0))
+            diffs[diffs == 0] = np.inf
+            steps.append(diffs.min(axis=0))
+        resolution = np.median(np.array(steps), axis=0)
+        resolution[~np.isfinite(resolution)] = 0.0
+
+        return cls(params=params, resolution=resolution, ts_ms=ts_ms, jitter=jitter)
+
+
+    @classmethod
+    def fit_dirs(cls, data_names: list, jitter: float = 0.1):
+        """ Fit to every episode of `data/Npy_files/<name>` (paths as in `DataPreprocessing`) """
+        files = []
+        for data in data_names:
+            files += glob.glob(os.path.join(os.path.dirname(os.path.abspath('../')), f'data/Npy_files/{data}/*.npy'))
+
+        return cls.fit([np.load(f).astype(float) for f in sorted(files)], jitter=jitter)
+
+
+    def save(self, path: str):
+        np.savez(path, resolution=self.resolution, ts_ms=self.ts_ms, jitter=self.jitter, **{f'param_{k}': v for k, v in self.params.items()})
+
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path) as f:
+            params = {k[len('param_'):]: f[k] for k in f.files if k.startswith('param_')}
+            return cls(params=params, resolution=f['resolution'], ts_ms=float(f['ts_ms']), jitter=float(f['jitter']))
+
+
+    def sample_episode(self, label: float, rng: np.random.Generator) -> np.ndarray:
+        """ One synthetic episode of class `label` (1.0 = success) """
+        p = {key: value[rng.choice(self.by_class[label])] for key, value in self.params.items()}
+        ts_s = self.ts_ms / 1000.0
+        n = int(np.clip(p['length'] * np.exp(rng.normal(scale=self.jitter)), self.params['length'].min(), self.params['length'].max()))
+        impact = p['impact']
+        if impact > 0:
+            impact = int(np.clip(impact * np.exp(rng.normal(scale=self.jitter)), IMPACT_SEARCH_START, n // 2))
+        knots = p['knots'] + rng.normal(scale=self.jitter, size=N_KNOTS)[:, None] * self.knots_std[label]
+
+        ft = np.empty((n, 6))
+        ft[:impact] = p['pre_level'] + rng.normal(size=(impact, 6)) * p['pre_noise']
+        n_post = n - impact
+        t = np.arange(n_post) * ts_s
+        transient = np.zeros(n_post)
+        peak = min(int(p['peak']), n_post - 1)
+        transient[:peak + 1] = np.linspace(0.0, 1.0, peak + 1)
+        transient[peak + 1:] = np.exp(-(t[peak + 1:] - t[peak]) / p['tau'])
+        n_spike = min(int(SPIKE_S / ts_s), max(n_post - 2 * N_KNOTS, 0))
+        trend = trend_basis(n_post, n_spike) @ knots
+        ft[impact:] = trend + np.outer(transient, p['amplitude']) + ar1_noise(p['phi'], p['sigma'], n_post, rng)
+        resolution = np.where(self.resolution > 0, self.resolution, 1.0)
+        ft = np.where(self.resolution > 0, np.round(ft / resolution) * resolution, ft)
+
+        extra = p['extra'][~np.isnan(p['extra'])]
+        ep = np.empty((n, 1 + 6 + 1 + len(extra)))
+        ep[:, 0] = np.arange(n) * self.ts_ms
+        ep[:, FT_COLS] = ft
+        ep[:, LABEL_COL] = label
+        ep[:, LABEL_COL + 1:] = extra
+
+        return ep
+
+
+    def iter_episodes(self, n_episodes: int, failure_rate: float = None, seed: int = None):
+        """ `n_episodes` synthetic episodes, one at a time, with the real failure rate unless given """
+        rng = np.random.default_rng(seed)
+        if failure_rate is None:
+            failure_rate = float(np.mean(self.params['label'] == 0.0))
+        n_failures = int(round(n_episodes * failure_rate))
+        labels = rng.permutation(np.concatenate([np.zeros(n_failures), np.ones(n_episodes - n_failures)]))
+        for label in labels:
+            yield self.sample_episode(label, rng)
+
+
+def write_synthetic_dataset(model: SyntheticEpisodeModel, name: str, n_episodes: int, failure_rate: float = None, seed: int = None, verbose: bool = True) -> str:
+    """ Save synthetic episodes as `data/Npy_files/<name>/*.npy`, so `DataPreprocessing(data=[name])` loads them """
+    out_dir = os.path.join(os.path.dirname(os.path.abspath('../')), f'data/Npy_files/{name}/')
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+    for i, ep in enumerate(model.iter_episodes(n_episodes=n_episodes, failure_rate=failure_rate, seed=seed)):
+        np.save(f'{out_dir}/Synthetic_{i:07d}_{name}.npy', ep)
+        if verbose and (i + 1) % 1000 == 0:
+            print(f'--> {i + 1}/{n_episodes} episodes')
+
+    return out_dir
+
+
+if __name__ == '__main__':
+    model = SyntheticEpisodeModel.fit_dirs(data_names=['reactive', 'training'])
+    write_synthetic_dataset(model, name='synthetic', n_episodes=10000, seed=0)
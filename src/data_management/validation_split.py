@@ -0,0 +1,46 @@
+import sys, os
+sys.path.append(os.path.realpath('../'))
+# print(sys.path)
+
+import numpy as np
+from sklearn.model_selection import GroupShuffleSplit
+
+from data_management.episode_index import EpisodeIndex
+
+# Validation episodes are carved out of the train split, grouped by episode like the k-fold folds, so model selection
+# (checkpoints, hyperparameter search) never looks at the test episodes the reported results are computed on
+VALIDATION_FRAC = 0.2
+
+
+# Functions -----------------------------------------------------------------------
+def load_train_groups(data_dir: str, data_prefix: str, n_windows: int) -> np.ndarray:
+    """ Train episode of every window of X_train saved by `DataPreprocessing.run`
+
+    For data saved before the groups were, they are rebuilt from the window counts of the saved train episodes """
+    path = f'{data_dir}/{data_prefix}_train_groups.npy'
+    if os.path.exists(path):
+        groups = np.load(path)
+    else:
+        episodes = np.load(f'{data_dir}/{data_prefix}_data_train.npy', allow_pickle=True)
+        counts = EpisodeIndex.from_episodes(list(episodes)).n_windows
+        groups = np.repeat(np.arange(len(counts)), counts)
+    if len(groups) != n_windows:
+        raise ValueError(f'{len(groups)} grouped windows for {n_windows} train windows in {data_dir}')
+
+    return groups
+
+
+def validation_split(groups, val_frac: float = VALIDATION_FRAC, seed: int = 0):
+    """ (train windows, validation windows, validation episodes): positions into X_train of whole episodes """
+    groups = np.asarray(groups)
+    splitter = GroupShuffleSplit(n_splits=1, test_size=val_frac, random_state=seed)
+    train, val = next(splitter.split(np.zeros(len(groups)), groups=groups))
+
+    return np.sort(train), np.sort(val), np.unique(groups[val])
+
+
+def load_validation_episodes(data_dir: str, data_prefix: str, episodes) -> list:
+    """ Full (scaled) train episodes at positions `episodes`, e.g. for an `EpisodeWindowCache` """
+    data_train = np.load(f'{data_dir}/{data_prefix}_data_train.npy', allow_pickle=True)
+
+    return [data_train[i] for i in episodes]
@@ -0,0 +1,146 @@
+import sys, os
+sys.path.append(os.path.realpath('../'))
+# print(sys.path)
+
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2' # INFO and WARNING messages are not printed
+
+import numpy as np
+import tensorflow as tf
+
+from data_management.balancing import class_labels, balanced_indices
+
+
+class WindowSequence(tf.keras.utils.Sequence):
+    """ Batches gathered by index from one shared window array (e.g. memory-mapped), so splits never copy the data
+
+    With `balance` ('under' or 'over') the windows of every epoch are re-drawn from `indices`, so an undersampled run
+    still sees most of the majority class over the epochs. With `class_weight` batches also carry per-window weights """
+    def __init__(self, X, Y, indices, batch_size: int = 256, shuffle: bool = True, seed: int = None, balance: str = None, class_weight: dict = None) -> None:
+        super().__init__()
+        if balance == 'weighted' and class_weight is None:
+            raise ValueError("'weighted' balancing trains on every window and needs the `class_weight` of the classes")
+        self.X = X
+        self.Y = Y
+        self.pool = np.asarray(indices)
+        self.balance = balance
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.rng = np.random.default_rng(seed)
+        self.labels = class_labels(Y[self.pool]) if balance is not None or class_weight is not None else None
+        self.weights = None
+        if class_weight is not None:
+            # Lookup of the weight of every window of `pool`, by position
+            self.weights = np.asarray([class_weight[int(c)] for c in self.labels], dtype='float32')
+        self.draw()
+
+
+    def draw(self):
+        """ Windows of the next epoch, in the order they are batched """
+        self.positions = np.arange(len(self.pool))
+        if self.balance is not None:
+            self.positions = balanced_indices(self.labels, mode=self.balance, rng=self.rng)
+        self.indices = self.pool[self.positions]
+        if self.shuffle:
+            order = self.rng.permutation(len(self.positions))
+            self.positions = self.positions[order]
+
+
+    @property
+    def shape(self):
+        """ Shape of the (virtual) array of selected windows """
+        return (len(self.indices),) + tuple(self.X.shape[1:])
+
+
+    def __len__(self) -> int:
+        # Incomplete last batches are dropped, as `steps_per_epoch = len(X) // batch_size` did
+        return len(self.indices) // self.batch_size
+
+
+    def __getitem__(self, i: int):
+        # Sorted indices read memory-mapped arrays sequentially, the order inside a batch does not matter
+        pos = np.sort(self.positions[i * self.batch_size:(i + 1) * self.batch_size])
+        idx = self.pool[pos]
+        if self.weights is not None:
+            return np.asarray(self.X[idx]), np.asarray(self.Y[idx]), self.weights[pos]
+        return np.asarray(self.X[idx]), np.asarray(self.Y[idx])
+
+
+    def on_epoch_end(self):
+        if self.shuffle or self.balance in ('under', 'over'):
+            self.draw()
+
+
+class BalancedBatchSequence(tf.keras.utils.Sequence):
+    """ Class-balanced batches drawn on the fly from all windows of `indices`, nothing is resampled into a copy
+
+    Every batch has the same number of windows of each class. Inside a class, episodes (`groups`) are drawn uniformly
+    and then one window of each drawn episode, so long episodes do not dominate. Batch `i` of epoch `e` only depends on
+    (seed, e, i), whatever order Keras asks for them in """
+    def __init__(self, X, Y, indices, groups, batch_size: int = 256, seed: int = 0, steps_per_epoch: int = None) -> None:
+        super().__init__()
+        self.X = X
+        self.Y = Y
+        self.batch_size = batch_size
+        self.seed = seed
+        self.epoch = 0
+        pool = np.asarray(indices)
+        groups = np.asarray(groups)[pool]
+        labels = class_labels(Y[pool])
+        self.classes = np.unique(labels)
+        if batch_size % len(self.classes) != 0:
+            raise ValueError(f'Batch size {batch_size} is not a multiple of the {len(self.classes)} classes')
+
+        # Per class: its windows sorted by episode, and the start and size of every episode inside them
+        self.pools, self.starts, self.counts = [], [], []
+        for c in self.classes:
+            class_pool = pool[labels == c]
+            class_groups = groups[labels == c]
+            order = np.argsort(class_groups, kind='stable')
+            _, starts, counts = np.unique(class_groups[order], return_index=True, return_counts=True)
+            self.pools.append(class_pool[order])
+            self.starts.append(starts)
+            self.counts.append(counts)
+
+        # By default an epoch has as many windows as undersampling would keep
+        self.steps_per_epoch = steps_per_epoch or len(self.classes) * min(len(p) for p in self.pools) // batch_size
+
+
+    @property
+    def shape(self):
+        """ Shape of the (virtual) array of windows of one epoch """
+        return (self.steps_per_epoch * self.batch_size,) + tuple(self.X.shape[1:])
+
+
+    def __len__(self) -> int:
+        return self.steps_per_epoch
+
+
+    def __getitem__(self, i: int):
+        rng = np.random.default_rng([self.seed, self.epoch, i])
+        per_class = self.batch_size // len(self.classes)
+        idx = []
+        for class_pool, starts, counts in zip(self.pools, self.starts, self.counts):
+            episodes = rng.integers(len(starts), size=per_class)
+            idx.append(class_pool[starts[episodes] + (rng.random(per_class) * counts[episodes]).astype(int)])
+        # Sorted indices read memory-mapped arrays sequentially, the order inside a batch does not matter
+        idx = np.sort(np.concatenate(idx))
+        return np.asarray(self.X[idx]), np.asarray(self.Y[idx])
+
+
+    def on_epoch_end(self):
+        self.epoch += 1
+
+
+def fit_inputs(X_train, Y_train, X_test, Y_test, batch_size: int) -> dict:
+    """ Data kwargs for `model.fit`: arrays with their batch size and steps, or `WindowSequence`s as they are """
+    if isinstance(X_train, tf.keras.utils.Sequence):
+        return {'x': X_train, 'validation_data': X_test}
+
+    return {
+        'x': X_train,
+        'y': Y_train,
+        'batch_size': batch_size,
+        'validation_data': (X_test, Y_test),
+        'steps_per_epoch': len(X_train) // batch_size,
+        'validation_steps': len(X_test) // batch_size
+    }
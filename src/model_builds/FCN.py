@@ -10,6 +10,9 @@ from tensorflow.keras.layers import Dense, Dropout, Activation, Conv1D, Flatten,
 from tensorflow.keras.optimizers import Adam, SGD
 from tensorflow.keras import regularizers
 
+from data_management.window_dataset import fit_inputs
+from utilities.training_callbacks import ThroughputLogger
+
 
 class FCN:
     def __init__(self, rolling_window_width) -> None:
@@ -22,8 +25,9 @@ class FCN:
         self.rollWinWidth = rolling_window_width
 
 
-    def build(self, verbose=False):
-        mirrored_strategy = tensorflow.distribute.MirroredStrategy()
+    def build(self, verbose=False, strategy=None):
+        # Any tf.distribute strategy can be passed (e.g. MultiWorkerMirroredStrategy), by default all local GPUs are used
+        mirrored_strategy = strategy if strategy is not None else tensorflow.distribute.MirroredStrategy()
         with mirrored_strategy.scope():
             self.model = Sequential()
 
@@ -74,7 +78,7 @@ class FCN:
         )
 
 
-    def fit(self, X_train, Y_train, X_test, Y_test, batch_size=2048, epochs=200, save_model=True):
+    def fit(self, X_train, Y_train, X_test, Y_test, batch_size=2048, epochs=200, save_model=True, extra_callbacks=[]):
         self.build(verbose=False)
 
         callbacks = [
@@ -83,22 +87,18 @@ class FCN:
                 patience=10,
                 restore_best_weights=True,
                 start_from_epoch=epochs*0.1
-            )
+            ),
+            ThroughputLogger(model_name=self.model_name, batch_size=batch_size, data=X_train)
         ]
+        callbacks += extra_callbacks
 
         with tensorflow.device('/GPU:0'):
             self.history = self.model.fit( 
-                # X_train, Y_train.reshape((-1,2)), 
-                X_train, Y_train, 
-                # validation_data  = (X_test, Y_test.reshape((-1,2)) ),
-                validation_data  = (X_test, Y_test),
-                batch_size       = batch_size, 
+                **fit_inputs(X_train, Y_train, X_test, Y_test, batch_size=batch_size),
                 epochs           = epochs, #250, #50, #250, # 2022-09-12: Trained for 250 total
                 verbose          = True, 
                 # validation_split = 0.2,
                 # steps_per_epoch  = int(trainWindows/batch_size), # https://stackoverflow.com/a/49924566
-                steps_per_epoch = len(X_train) // batch_size,
-                validation_steps = len(X_test) // batch_size,
                 callbacks        = callbacks
             )
         
@@ -10,6 +10,16 @@ from typing import List, Any
 
 from Transformer.Transformer import Transformer
 from Transformer.CustomSchedule import CustomSchedule
+from data_management.window_dataset import fit_inputs
+from utilities.training_callbacks import ThroughputLogger
+from YamlLoader import YamlLoader
+
+OOP_TRANSFORMER_CONFIG = '../config/oop_transformer_config.yaml'
+
+
+def load_oop_transformer_config(model_type: str = 'small', path: str = OOP_TRANSFORMER_CONFIG) -> dict:
+    """ `build` kwargs of the 'small' or 'big' architecture """
+    return YamlLoader().load_yaml(path)[model_type]
 
 
 class OOPTransformer:
@@ -35,9 +45,11 @@ class OOPTransformer:
             dropout_rate: float,
             mlp_dropout: float,
             mlp_units: List[int],
-            verbose: bool = False
+            verbose: bool = False,
+            strategy: Any = None
     ):
-        mirrored_strategy = tf.distribute.MirroredStrategy()
+        # Any tf.distribute strategy can be passed (e.g. MultiWorkerMirroredStrategy), by default all local GPUs are used
+        mirrored_strategy = strategy if strategy is not None else tf.distribute.MirroredStrategy()
         with mirrored_strategy.scope():
             self.model = Transformer(
                 num_layers=num_layers,
@@ -80,7 +92,8 @@ class OOPTransformer:
             Y_test: Any,
             epochs: int = 200,
             batch_size: int = 256,
-            save_model: bool = True
+            save_model: bool = True,
+            extra_callbacks: list = []
     ):
         callbacks = [
             tf.keras.callbacks.EarlyStopping(
@@ -88,18 +101,15 @@ class OOPTransformer:
                 patience=10,
                 restore_best_weights=True,
                 start_from_epoch=epochs*0.1
-            )
+            ),
+            ThroughputLogger(model_name=self.model_name, batch_size=batch_size, data=X_train)
         ]
+        callbacks += extra_callbacks
         self.history = self.model.fit(
-            x=X_train,
-            y=Y_train,
+            **fit_inputs(X_train, Y_train, X_test, Y_test, batch_size=batch_size),
             # validation_split=0.2,
             epochs=epochs,
-            batch_size=batch_size,
-            callbacks=callbacks,
-            validation_data=(X_test, Y_test),
-            steps_per_epoch=len(X_train) // batch_size,
-            validation_steps=len(X_test) // batch_size
+            callbacks=callbacks
         )
 
         self.last_attn_scores = self.model.encoder.enc_layers[-1].last_attn_scores
@@ -1,4 +1,5 @@
 import os, sys, pickle
+import contextlib
 sys.path.append(os.path.realpath('../'))
 print(sys.version)
 print(sys.path)
@@ -6,6 +7,9 @@ os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2' # INFO and WARNING messages are not pri
 import tensorflow as tf
 
 from data_management.data_preprocessing import DataPreprocessing
+from data_management.window_dataset import fit_inputs
+from utilities.training_callbacks import ThroughputLogger
+from utilities.utils import init_gpus_for_tf
 
 
 class BaseRNN:
@@ -18,49 +22,51 @@ class BaseRNN:
         self.imgs_path = f'../saved_data/imgs/{self.model_name}/'
         self.histories_path = f'../saved_data/histories/{self.model_name}_history'
 
-    def fit(self, X_train, Y_train, X_test, Y_test, batch_size=1024, epochs=200, save_model=True, verbose=False):
-        # mirrored_strategy = tf.distribute.MirroredStrategy()
-        # with mirrored_strategy.scope():
-        self.build_model(
-            input_shape=X_train.shape[1:],
-            dim=128,
-            dropout=0.2,
-            dense_dim=2
-        )
+    def build(self, input_shape, strategy=None, verbose=False):
+        """ Build and compile the model, inside `strategy`'s scope when one is given (e.g. MultiWorkerMirroredStrategy) """
+        with strategy.scope() if strategy is not None else contextlib.nullcontext():
+            self.build_model(
+                input_shape=input_shape,
+                dim=128,
+                dropout=0.2,
+                dense_dim=2
+            )
 
-        learning_rate = 1e-4
-        opt = tf.keras.optimizers.legacy.Adam(learning_rate)
-        opt = tf.keras.mixed_precision.LossScaleOptimizer(opt)
-        loss_object = tf.keras.losses.CategoricalCrossentropy()
-        metric = tf.keras.metrics.CategoricalAccuracy()
+            learning_rate = 1e-4
+            opt = tf.keras.optimizers.legacy.Adam(learning_rate)
+            opt = tf.keras.mixed_precision.LossScaleOptimizer(opt)
+            loss_object = tf.keras.losses.CategoricalCrossentropy()
+            metric = tf.keras.metrics.CategoricalAccuracy()
 
-        self.model.compile(
-            loss=loss_object,
-            optimizer=opt,
-            metrics=[metric]
-        )
+            self.model.compile(
+                loss=loss_object,
+                optimizer=opt,
+                metrics=[metric]
+            )
         if verbose:
             self.model.summary()
 
+    def fit(self, X_train, Y_train, X_test, Y_test, batch_size=1024, epochs=200, save_model=True, verbose=False, extra_callbacks=[]):
+        # mirrored_strategy = tf.distribute.MirroredStrategy()
+        # with mirrored_strategy.scope():
+        self.build(input_shape=X_train.shape[1:], verbose=verbose)
+
         callbacks = [
             tf.keras.callbacks.EarlyStopping(
                 monitor='val_loss',
                 patience=10,
                 restore_best_weights=True,
                 start_from_epoch=epochs*0.1
-            )
+            ),
+            ThroughputLogger(model_name=self.model_name, batch_size=batch_size, data=X_train)
         ]
+        callbacks += extra_callbacks
 
         self.history = self.model.fit(
-            x=X_train,
-            y=Y_train,
+            **fit_inputs(X_train, Y_train, X_test, Y_test, batch_size=batch_size),
             # validation_split=0.2,
             epochs=epochs,
-            batch_size=batch_size,
-            callbacks=callbacks,
-            validation_data=(X_test, Y_test),
-            steps_per_epoch=len(X_train) // batch_size,
-            validation_steps=len(X_test) // batch_size
+            callbacks=callbacks
         )
 
         if save_model:
@@ -113,21 +119,7 @@ class LSTM(BaseRNN):
 
 
 if __name__ == '__main__':
-    gpus = tf.config.experimental.list_physical_devices(device_type='GPU')
-    print( f"Found {len(gpus)} GPUs!" )
-    for i in range( len( gpus ) ):
-        try:
-            tf.config.experimental.set_memory_growth(device=gpus[i], enable=True)
-            tf.config.experimental.VirtualDeviceConfiguration( memory_limit = 1024*3 )
-            print( f"\t{tf.config.experimental.get_device_details( device=gpus[i] )}" )
-        except RuntimeError as e:
-            print( '\n', e, '\n' )
-
-    devices = tf.config.list_physical_devices()
-    print( "Tensorflow sees the following devices:" )
-    for dev in devices:
-        print( f"\t{dev}" )
-        print()
+    init_gpus_for_tf()
 
     dp = DataPreprocessing(sampling='none', data='reactive')
     dp.run(save_data=False, verbose=True)
@@ -1,6 +1,7 @@
 import json
 import os
 import sys
+import glob
 import json
 import numpy as np
 import matplotlib.pyplot as plt
@@ -137,8 +138,65 @@ def plot_model_sizes(sizes: dict, out_name: str = ''):
         plt.savefig(f'../saved_data/imgs/evaluation/{out_name}.png')
 
 
+def plot_latency_vs_size(sizes: dict, latency: dict, out_name: str = ''):
+    """ Batch latency curves and streaming latency against the number of parameters, from `benchmarks/inference_latency.py` """
+    fig_width = 600
+    plt.rcParams.update({
+        "font.family": "serif",
+        "axes.labelsize": 14,
+        "font.size": 14,
+        "legend.fontsize": 12,
+        "xtick.labelsize": 12,
+        "ytick.labelsize": 12
+    })
+
+    fig, (ax_batch, ax_stream) = plt.subplots(1, 2, figsize=set_size(2 * fig_width, subplots=(1, 2)))
+    models = [m for m in latency['models'] if m in sizes]
+    for model_name in models:
+        batch = latency['models'][model_name]['batch']
+        batch_sizes = sorted(int(b) for b in batch)
+        ax_batch.plot(
+            batch_sizes,
+            [batch[str(b)]['p50_ms'] for b in batch_sizes],
+            marker='o',
+            label=model_name_table[model_name].replace('\n', ' ')
+        )
+
+        streaming = latency['models'][model_name]['streaming']
+        ax_stream.errorbar(
+            sizes[model_name],
+            streaming['p50_ms'],
+            yerr=[[0], [streaming['p99_ms'] - streaming['p50_ms']]],
+            fmt='o',
+            capsize=4
+        )
+        ax_stream.annotate(model_name_table[model_name], xy=(sizes[model_name], streaming['p50_ms']), fontsize=10, ha='left', va='bottom')
+
+    ax_batch.set_xscale('log', base=2)
+    ax_batch.set_yscale('log')
+    ax_batch.set_xlabel('Batch size')
+    ax_batch.set_ylabel('p50 latency [ms]')
+    ax_batch.legend()
+    ax_stream.set_xlabel('Number of parameters')
+    ax_stream.set_ylabel('Streaming latency p50 - p99 [ms]')
+    fig.suptitle(f'Inference latency ({latency["n_threads"]} threads, commit {latency["commit"]})')
+    plt.tight_layout()
+
+    if out_name == '':
+        plt.savefig('../saved_data/imgs/evaluation/model_latency.png')
+    else:
+        plt.savefig(f'../saved_data/imgs/evaluation/{out_name}.png')
+
+
 if __name__ == '__main__':
     with open('../saved_data/model_sizes.json', 'r') as f:
         model_sizes = json.load(f)
 
     plot_model_sizes(sizes=model_sizes)
+
+    # Latest latency benchmark, if any was run
+    latency_files = sorted(glob.glob('../saved_data/benchmarks/inference_latency_*.json'), key=os.path.getmtime)
+    if len(latency_files) > 0:
+        with open(latency_files[-1], 'r') as f:
+            latency = json.load(f)
+        plot_latency_vs_size(sizes=model_sizes, latency=latency)
@@ -14,26 +14,14 @@ import tensorflow as tf
 from data_management.data_preprocessing import DataPreprocessing
 from model_builds.OOPTransformer import OOPTransformer
 from utilities.helper_functions import scan_output_for_decision
+from utilities.utils import init_gpus_for_tf
 
 
 MODE = 'load_data'    # modes: ['create_data', 'load_data']
 
 
 if __name__ == '__main__':
-    gpus = tf.config.experimental.list_physical_devices(device_type='GPU')
-    print( f"Found {len(gpus)} GPUs!" )
-    for i in range( len( gpus ) ):
-        try:
-            tf.config.experimental.set_memory_growth(device=gpus[i], enable=True)
-            tf.config.experimental.VirtualDeviceConfiguration( memory_limit = 1024*6 )
-            print( f"\t{tf.config.experimental.get_device_details( device=gpus[i] )}" )
-        except RuntimeError as e:
-            print( '\n', e, '\n' )
-
-    devices = tf.config.list_physical_devices()
-    print( "Tensorflow sees the following devices:" )
-    for dev in devices:
-        print( f"\t{dev}" )
+    init_gpus_for_tf()
 
     X_data, Y_data = None, None
 
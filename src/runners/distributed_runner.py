@@ -0,0 +1,129 @@
+import os, sys, json, time
+sys.path.append(os.path.realpath('../'))
+# print(sys.path)
+
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2' # INFO and WARNING messages are not printed
+
+import numpy as np
+from tabulate import tabulate
+
+from utilities.distributed_training import launch_local_workers, pin_worker, sharded_window_dataset
+from utilities.utils import atomic_write_json
+from data_management.balancing import load_train_indices, load_class_weight
+
+# Data-parallel training over local CPU worker processes with `MultiWorkerMirroredStrategy`.
+# Run without TF_CONFIG, this script is the launcher: it starts one copy of itself per worker for every entry of
+# WORKER_COUNTS and reports the samples/s of each, so the scaling with the number of workers can be checked
+MODEL_NAME = 'FCN'
+DATA = ['reactive', 'training']
+DATA_DIR = f'../../data/data_manager/{"_".join(DATA)}'
+WORKER_COUNTS = [1, 2, 4]
+CORES_PER_WORKER = max(1, (os.cpu_count() or 1) // max(WORKER_COUNTS))
+GLOBAL_BATCH_SIZE = 2048
+EPOCHS = 3
+SEED = 42
+RESULTS_PATH = '../saved_data/benchmarks'
+RESULTS_ENV = 'DIST_RESULTS_FILE'
+
+
+def build_model(model_name: str, strategy, X_sample):
+    """ Keras model of `model_name` created and compiled inside `strategy`'s scope """
+    if model_name == 'FCN':
+        from model_builds.FCN import FCN
+        net = FCN(rolling_window_width=X_sample.shape[1])
+        net.build(strategy=strategy)
+    elif model_name in ('RNN', 'GRU', 'LSTM'):
+        from model_builds import RNN
+        net = getattr(RNN, model_name)()
+        net.build(input_shape=X_sample.shape[1:], strategy=strategy)
+    elif model_name in ('OOP_Transformer', 'OOP_Transformer_small'):
+        from model_builds.OOPTransformer import OOPTransformer, load_oop_transformer_config
+        net = OOPTransformer(model_name=model_name)
+        net.build(
+            X_sample=X_sample,
+            **load_oop_transformer_config(model_type='small' if model_name.endswith('small') else 'big'),
+            strategy=strategy
+        )
+    else:
+        raise ValueError(f'Unknown model {model_name}')
+
+    return net.model
+
+
+def run_worker():
+    worker_index = pin_worker()
+    import tensorflow as tf
+
+    strategy = tf.distribute.MultiWorkerMirroredStrategy()
+    X_train = np.load(f'{DATA_DIR}/{"_".join(DATA)}_X_train.npy', mmap_mode='r')
+    Y_train = np.load(f'{DATA_DIR}/{"_".join(DATA)}_Y_train.npy', mmap_mode='r')
+    X_test = np.load(f'{DATA_DIR}/{"_".join(DATA)}_X_test.npy', mmap_mode='r')
+    Y_test = np.load(f'{DATA_DIR}/{"_".join(DATA)}_Y_test.npy', mmap_mode='r')
+    train_indices = load_train_indices(DATA_DIR, "_".join(DATA), len(X_train))
+    class_weight = load_class_weight(f'{DATA_DIR}/{"_".join(DATA)}_class_weight.json')
+
+    model = build_model(MODEL_NAME, strategy, np.asarray(X_train[:64], dtype='float32'))
+    train_ds = strategy.distribute_datasets_from_function(
+        lambda ctx: sharded_window_dataset(X_train, Y_train, GLOBAL_BATCH_SIZE, input_context=ctx, seed=SEED, indices=train_indices, class_weight=class_weight)
+    )
+    val_ds = strategy.distribute_datasets_from_function(
+        lambda ctx: sharded_window_dataset(X_test, Y_test, GLOBAL_BATCH_SIZE, input_context=ctx, shuffle=False)
+    )
+    steps_per_epoch = len(train_indices) // GLOBAL_BATCH_SIZE
+
+    # First epoch includes graph tracing and the collective setup, throughput is measured on the others
+    epoch_times = []
+    epoch_start = [0.0]
+    timer = tf.keras.callbacks.LambdaCallback(
+        on_epoch_begin=lambda epoch, logs: epoch_start.__setitem__(0, time.perf_counter()),
+        on_epoch_end=lambda epoch, logs: epoch_times.append(time.perf_counter() - epoch_start[0])
+    )
+    history = model.fit(
+        train_ds,
+        epochs=EPOCHS,
+        steps_per_epoch=steps_per_epoch,
+        validation_data=val_ds,
+        validation_steps=len(X_test) // GLOBAL_BATCH_SIZE,
+        callbacks=[timer],
+        verbose=2 if worker_index == 0 else 0
+    )
+
+    if worker_index == 0:
+        measured = epoch_times[1:] if len(epoch_times) > 1 else epoch_times
+        atomic_write_json(os.environ[RESULTS_ENV], {
+            'model': MODEL_NAME,
+            'n_workers': strategy.num_replicas_in_sync,
+            'global_batch_size': GLOBAL_BATCH_SIZE,
+            'epoch_times_s': epoch_times,
+            'samples_per_s': steps_per_epoch * GLOBAL_BATCH_SIZE / float(np.mean(measured)),
+            'history': {key: [float(v) for v in values] for key, values in history.history.items()}
+        })
+
+
+if __name__ == '__main__':
+    if 'TF_CONFIG' in os.environ:
+        run_worker()
+    else:
+        results = {}
+        for n_workers in WORKER_COUNTS:
+            print(f'\n====> Training {MODEL_NAME} on {n_workers} workers x {CORES_PER_WORKER} cores')
+            results_file = os.path.realpath(f'{RESULTS_PATH}/distributed_{MODEL_NAME}_{n_workers}_workers.json')
+            exit_codes = launch_local_workers(
+                script=os.path.realpath(__file__),
+                n_workers=n_workers,
+                cores_per_worker=CORES_PER_WORKER,
+                env={RESULTS_ENV: results_file}
+            )
+            if any(code != 0 for code in exit_codes):
+                print(f'--> Some workers failed: exit codes {exit_codes}')
+                continue
+            with open(results_file, 'r') as f:
+                results[n_workers] = json.load(f)
+
+        if len(results) > 0:
+            base = results[min(results)]['samples_per_s'] / min(results)
+            print(tabulate(
+                [[n, res['samples_per_s'], res['samples_per_s'] / (base * n)] for n, res in results.items()],
+                headers=['Workers', 'Samples/s', 'Scaling efficiency']
+            ))
+            atomic_write_json(f'{RESULTS_PATH}/distributed_scaling_{MODEL_NAME}.json', results, indent=4)
@@ -8,13 +8,16 @@ import tensorflow as tf
 import numpy as np
 import matplotlib.pyplot as plt
 
-from sklearn.model_selection import KFold
+from sklearn.model_selection import GroupKFold
 
-from utilities.utils import set_size
+from utilities.utils import set_size, init_gpus_for_tf, atomic_write_json
+from utilities.job_scheduler import run_jobs
 from data_management.data_preprocessing import DataPreprocessing
+from data_management.window_dataset import WindowSequence, BalancedBatchSequence
+from data_management.balancing import save_class_weight, load_class_weight
 from model_builds.FCN import FCN
 from model_builds.RNN import RNN, GRU, LSTM
-from model_builds.OOPTransformer import OOPTransformer
+from model_builds.OOPTransformer import OOPTransformer, load_oop_transformer_config
 
 
 
@@ -191,39 +194,12 @@ def build_oop_transformer(X_sample, model_type: str):
 
     transformer_net = OOPTransformer(model_name=name)
 
-    num_layers = 4
-    d_model = 6
-    ff_dim = 256
-    num_heads = 8
-    head_size = 256
-    dropout_rate = 0.2
-    mlp_dropout = 0.4
-    mlp_units = [128, 256, 64]
-    if model_type == 'small':
-        num_layers = 4
-        d_model = 6
-        ff_dim = 256
-        num_heads = 4
-        head_size = 128
-        dropout_rate = 0.2
-        mlp_dropout = 0.4
-        mlp_units = [128]
-
     transformer_net.build(
             X_sample=X_sample,
-            num_layers=num_layers,
-            d_model=d_model,
-            ff_dim=ff_dim,
-            num_heads=num_heads,
-            head_size=head_size,
-            dropout_rate=dropout_rate,
-            mlp_dropout=mlp_dropout,
-            mlp_units=mlp_units,
+            **load_oop_transformer_config(model_type=model_type),
             verbose=False
         )
 
-    transformer_net.compile()
-
     return transformer_net
 
 
@@ -244,6 +220,61 @@ def get_model(name: str, roll_win_width: int = 0, X_sample = None):
     return None
 
 
+def train_fold_job(model_name: str, fold: int, epochs: int = 200, batch_size: int = 256):
+    """ Train `model_name` on one k-fold split, run inside a worker process of `run_jobs` """
+    X = np.load(f'{KFOLD_DATA_DIR}/X.npy', mmap_mode='r')
+    Y = np.load(f'{KFOLD_DATA_DIR}/Y.npy', mmap_mode='r')
+    with np.load(f'{KFOLD_DATA_DIR}/folds.npz') as folds:
+        train = folds[f'train_{fold}']
+        test = folds[f'test_{fold}']
+
+    model = get_model(name=model_name,
+                      roll_win_width=X.shape[1],
+                      X_sample=np.asarray(X[:64]))
+    print(f'--> Training {model_name} on fold {fold + 1}...')
+    # Batches are gathered by index from the memory-mapped windows instead of copying X[train] and X[test].
+    # The train windows are re-balanced every epoch, so all of the majority class is used over the run.
+    if SAMPLING == 'batch':
+        train_data = BalancedBatchSequence(X, Y, train, groups=np.load(f'{KFOLD_DATA_DIR}/groups.npy'), batch_size=batch_size, seed=fold)
+    else:
+        train_data = WindowSequence(
+            X, Y, train, batch_size=batch_size, shuffle=True, seed=fold, balance=SAMPLING,
+            class_weight=load_class_weight(f'{KFOLD_DATA_DIR}/class_weight.json')
+        )
+    # Folds run concurrently, so their models are not saved (they would overwrite each other and the final models)
+    model.fit(
+        X_train=train_data,
+        Y_train=None,
+        X_test=WindowSequence(X, Y, test, batch_size=batch_size, shuffle=False),
+        Y_test=None,
+        epochs=epochs,
+        batch_size=batch_size,
+        save_model=False
+    )
+    history_path = f'{HISTORIES_DIR}/{model_name}_fold_{fold}.json'
+    atomic_write_json(history_path, model.history.history)
+    n_params = int(np.sum([np.prod(v.get_shape().as_list()) for v in model.model.trainable_variables]))
+    tf.keras.backend.clear_session()
+
+    return {'history_path': history_path, 'n_params': n_params, 'model_name': model.model_name}
+
+
+def collect_histories(manifest, models: list, num_folds: int):
+    """ Merge the per-job histories into {model: [history of each fold], 'num_folds': n} as `plot_histories_average` expects """
+    results = manifest.results()
+    histories = {model_name: [] for model_name in models}
+    for model_name in models:
+        for fold in range(num_folds):
+            job = results.get(f'{model_name}_fold_{fold}')
+            if job is None:
+                break
+            with open(job['history_path'], 'r') as f:
+                histories[model_name].append(json.load(f))
+    histories['num_folds'] = min(len(histories[model_name]) for model_name in models)
+
+    return histories
+
+
 MODELS_TO_RUN = [
     'FCN',
     'RNN',
@@ -252,105 +283,104 @@ MODELS_TO_RUN = [
     'OOP_Transformer',
     'OOP_Transformer_small'
     ]
+DATA = ['reactive', 'training']
+SAMPLING = 'under' # Or 'weighted' (every window, per-class sample weights) or 'batch' (class-balanced batches drawn from every window, stratified by episode)
 COMPUTE = True
 DATA_MODE = 'create'
 # DATA_MODE = 'load'
 SAVE_HISTORIES = True
 SAVE_MODEL_SIZE = True
+NUM_FOLDS = 5
+EPOCHS = 200
+# Same batch sizes as the default of each model's `fit`
+BATCH_SIZES = {
+    'FCN': 2048,
+    'RNN': 1024,
+    'GRU': 1024,
+    'LSTM': 1024,
+    'OOP_Transformer': 256,
+    'OOP_Transformer_small': 256
+}
+THREADS_PER_WORKER = 2
+N_WORKERS = max(1, (os.cpu_count() or 1) // THREADS_PER_WORKER)
+KFOLD_DIR = '../saved_data/kfold_crossvalidation'
+KFOLD_DATA_DIR = f'{KFOLD_DIR}/data'
+HISTORIES_DIR = f'{KFOLD_DIR}/histories'
+MANIFEST_PATH = f'{KFOLD_DIR}/manifest.json'
 
 if __name__ == "__main__":
-    gpus = tf.config.experimental.list_physical_devices(device_type='GPU')
-    print( f"Found {len(gpus)} GPUs!" )
-    for i in range( len( gpus ) ):
-        try:
-            tf.config.experimental.set_memory_growth(device=gpus[i], enable=True)
-            tf.config.experimental.VirtualDeviceConfiguration( memory_limit = 1024*3 )
-            print( f"\t{tf.config.experimental.get_device_details( device=gpus[i] )}" )
-        except RuntimeError as e:
-            print( '\n', e, '\n' )
-
-    devices = tf.config.list_physical_devices()
-    print( "Tensorflow sees the following devices:" )
-    for dev in devices:
-        print( f"\t{dev}" )
-
-    num_folds = 5
-
-    if SAVE_HISTORIES:
-        if not os.path.exists('../saved_data/kfold_crossvalidation/'):
-            os.makedirs('../saved_data/kfold_crossvalidation/')
+    init_gpus_for_tf()
+
+    num_folds = NUM_FOLDS
 
     if COMPUTE:
         if DATA_MODE == 'create':
-            dp = DataPreprocessing(sampling='under', data='reactive')
-            print(dp.datadir)
+            dp = DataPreprocessing(sampling=SAMPLING, data=DATA)
             dp.run(verbose=True)
 
-            # Define the K-fold Cross Validator
-            kfold = KFold(n_splits=num_folds, shuffle=True)
+            # Folds are split by episode: overlapping windows of one episode in both train and validation leak
+            kfold = GroupKFold(n_splits=num_folds)
 
             print('ALL OK')
 
             # Merge inputs and targets
-            # inputs = np.concatenate((dp.X_train_sampled, dp.X_test), axis=0)
-            # targets = np.concatenate((dp.Y_train_sampled, dp.Y_test), axis=0)
-            inputs = dp.X_train_sampled
-            targets = dp.Y_train_sampled
+            # inputs = np.concatenate((dp.X_train, dp.X_test), axis=0)
+            # targets = np.concatenate((dp.Y_train, dp.Y_test), axis=0)
+            inputs = dp.X_train
+            targets = dp.Y_train
             print(inputs.shape, targets.shape)
+
+            # Workers memory-map the data instead of receiving a pickled copy each.
+            # New data invalidates the finished jobs, so the manifest is reset
+            if not os.path.exists(KFOLD_DATA_DIR):
+                os.makedirs(KFOLD_DATA_DIR)
+            np.save(f'{KFOLD_DATA_DIR}/X.npy', inputs)
+            np.save(f'{KFOLD_DATA_DIR}/Y.npy', targets)
+            np.save(f'{KFOLD_DATA_DIR}/groups.npy', dp.train_groups)
+            if dp.class_weight is not None:
+                save_class_weight(f'{KFOLD_DATA_DIR}/class_weight.json', dp.class_weight)
+            elif os.path.exists(f'{KFOLD_DATA_DIR}/class_weight.json'):
+                os.remove(f'{KFOLD_DATA_DIR}/class_weight.json')
+            folds = {}
+            for fold, (train, test) in enumerate(kfold.split(inputs, targets, groups=dp.train_groups)):
+                folds[f'train_{fold}'] = train
+                # Validation keeps to the windows balanced once by `DataPreprocessing`
+                folds[f'test_{fold}'] = test[np.isin(test, dp.train_sample_indices)]
+            np.savez(f'{KFOLD_DATA_DIR}/folds.npz', **folds)
+            if os.path.exists(MANIFEST_PATH):
+                os.remove(MANIFEST_PATH)
         elif DATA_MODE == 'load':
+            # Resume: reuse the saved data and folds, only the jobs missing from the manifest are run
             pass
 
-        if os.path.exists('../saved_data/kfold_crossvalidation/histories.json'):
-            with open('../saved_data/kfold_crossvalidation/histories.json') as f:
-                histories = json.load(f)
-            print('\nLoaded histories from file\n')
-            for model_name in MODELS_TO_RUN:
-                histories[model_name] = []
-        else:
-            histories = {key: [] for key in MODELS_TO_RUN}
-        histories['num_folds'] = 0
-
-        model_n_params = {key: [] for key in MODELS_TO_RUN}
-        fold_no = 1
-        for train, test in kfold.split(inputs, targets):
-            print(f'\nFold {fold_no}/{num_folds}:')
-            for model_name in MODELS_TO_RUN:
-                model = get_model(name=model_name,
-                                roll_win_width=dp.rollWinWidth,
-                                X_sample=dp.X_train_sampled[:64])
-                print(f'--> Training {model_name}...')
-                model.fit(
-                    X_train=inputs[train],
-                    Y_train=targets[train],
-                    X_test=inputs[test],
-                    Y_test=targets[test],
-                    epochs=200,
-                    save_model=True
-                )
-                histories[model_name].append(model.history.history)
-
-                if fold_no == 1 and SAVE_MODEL_SIZE:
-                    model_n_params[model.model_name] = int(np.sum([np.prod(v.get_shape().as_list()) for v in model.model.trainable_variables]))
-
-                tf.keras.backend.clear_session()
-
-            if fold_no == 1 and SAVE_MODEL_SIZE:
-                with open('../saved_data/model_sizes_kfold.json', 'w') as f:
-                    json.dump(model_n_params, f)
-
-            fold_no += 1
-            histories['num_folds'] += 1
-
+        jobs = {
+            f'{model_name}_fold_{fold}': {'model_name': model_name, 'fold': fold, 'epochs': EPOCHS, 'batch_size': BATCH_SIZES[model_name]}
+            for fold in range(num_folds) for model_name in MODELS_TO_RUN
+        }
+        manifest = run_jobs(
+            job_func=train_fold_job,
+            jobs=jobs,
+            manifest_path=MANIFEST_PATH,
+            n_workers=N_WORKERS,
+            threads_per_worker=THREADS_PER_WORKER
+        )
 
-            if SAVE_HISTORIES:
-                with open('../saved_data/kfold_crossvalidation/histories.json', 'w') as f:
-                    json.dump(histories, f)
+        histories = collect_histories(manifest=manifest, models=MODELS_TO_RUN, num_folds=num_folds)
+        if SAVE_HISTORIES:
+            atomic_write_json(f'{KFOLD_DIR}/histories.json', histories)
 
+        if SAVE_MODEL_SIZE:
+            model_n_params = {}
+            for model_name in MODELS_TO_RUN:
+                job = manifest.results().get(f'{model_name}_fold_0')
+                if job is not None:
+                    model_n_params[job['model_name']] = job['n_params']
+            atomic_write_json('../saved_data/model_sizes_kfold.json', model_n_params)
 
         print()
         print(histories)
     else:
-        with open('../saved_data/kfold_crossvalidation/histories.json', 'r') as f:
+        with open(f'{KFOLD_DIR}/histories.json', 'r') as f:
             histories = json.load(f)
 
 
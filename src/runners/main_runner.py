@@ -15,10 +15,11 @@ from run_makespan_simulation import run_reactive_simulation, run_makespan_simula
 from data_management.data_preprocessing import DataPreprocessing
 from model_builds.FCN import FCN
 from model_builds.RNN import RNN, GRU, LSTM
-from model_builds.OOPTransformer import OOPTransformer
+from model_builds.OOPTransformer import OOPTransformer, load_oop_transformer_config
 from utilities.metrics_plots import compute_confusion_matrix, plot_roc_window_data, plot_equation_simulation_makespan_barplots, make_probabilities_plots, plot_monte_carlo_simulation_barplots
-from utilities.makespan_utils import get_makespan_for_model, get_mts_mtf, scan_output_for_decision, monitored_makespan, reactive_makespan, plot_simulation_makespans
-from utilities.utils import CounterDict
+from utilities.makespan_utils import get_makespan_for_model, get_makespan_tradeoff, get_mts_mtf, scan_output_for_decision, monitored_makespan, reactive_makespan, plot_simulation_makespans
+from utilities.utils import CounterDict, init_gpus_for_tf
+from utilities.results_store import ResultsStore, SIMULATION_SUMMARY
 from utilities.plot_classification_examples import plot_ft_classification_for_model
 
 SRC_PATH = os.path.dirname(os.path.realpath(__file__))
@@ -34,6 +35,9 @@ MODELS_TO_RUN = [
     'OOP_Transformer_small',
     'OOP_Transformer'
 ]
+# 95% CI half-width [s] at which makespan simulations stop early, setting it re-runs the simulations (None keeps the saved ones)
+SIMULATION_TOLERANCE = None
+SEED = 42
 
 
 def load_keras_model(model_name: str, makespan_models: dict, verbose: bool = True):
@@ -86,34 +90,9 @@ def build_oop_transformer(X_sample, model_type: str):
 
     transformer_net = OOPTransformer(model_name=name)
 
-    num_layers = 4
-    d_model = 6
-    ff_dim = 256
-    num_heads = 8
-    head_size = 256
-    dropout_rate = 0.2
-    mlp_dropout = 0.4
-    mlp_units = [128, 256, 64]
-    if model_type == 'small':
-        num_layers = 4
-        d_model = 6
-        ff_dim = 256
-        num_heads = 4
-        head_size = 128
-        dropout_rate = 0.2
-        mlp_dropout = 0.4
-        mlp_units = [128]
-
     transformer_net.build(
             X_sample=X_sample,
-            num_layers=num_layers,
-            d_model=d_model,
-            ff_dim=ff_dim,
-            num_heads=num_heads,
-            head_size=head_size,
-            dropout_rate=dropout_rate,
-            mlp_dropout=mlp_dropout,
-            mlp_units=mlp_units,
+            **load_oop_transformer_config(model_type=model_type),
             verbose=False
         )
 
@@ -138,20 +117,7 @@ def get_model(name: str, roll_win_width: int = 0, X_sample = None):
 
 
 if __name__ == '__main__':
-    gpus = tensorflow.config.experimental.list_physical_devices(device_type='GPU')
-    print( f"Found {len(gpus)} GPUs!" )
-    for i in range( len( gpus ) ):
-        try:
-            tensorflow.config.experimental.set_memory_growth(device=gpus[i], enable=True)
-            tensorflow.config.experimental.VirtualDeviceConfiguration( memory_limit = 1024*3 )
-            print( f"\t{tensorflow.config.experimental.get_device_details( device=gpus[i] )}" )
-        except RuntimeError as e:
-            print( '\n', e, '\n' )
-
-    devices = tensorflow.config.list_physical_devices()
-    print( "Tensorflow sees the following devices:" )
-    for dev in devices:
-        print( f"\t{dev}" )
+    init_gpus_for_tf()
 
     # Load data
     print('\nLoading data from files...', end='')
@@ -306,6 +272,20 @@ if __name__ == '__main__':
                     verbose=True
                 )
 
+    # To get the makespan over every confidence threshold and the makespan-optimal one:
+    get_tradeoff = False
+    if get_tradeoff:
+        for model_name, model in sim_models.items():
+            print(f'\n--> Computing trade-off curve for model {model_name}')
+            get_makespan_tradeoff(
+                model_name=model_name,
+                model=model,
+                episodes=test_data,
+                n_simulations=500,
+                seed=SEED,
+                verbose=True
+            )
+
     # To get simulated makespan:
     run_simulation = False
     sim_results = {k: {} for k in confidence_list}
@@ -315,8 +295,10 @@ if __name__ == '__main__':
                 models_to_run=sim_models,
                 data=test_data,
                 n_simulations = 500,
+                tolerance=SIMULATION_TOLERANCE,
                 confidence=confidence,
-                compute=False
+                # Without a tolerance only EMS of the saved results is refreshed from the equation, with one they are re-simulated
+                compute=SIMULATION_TOLERANCE is not None
             )
 
             plot_simulation_makespans(
@@ -349,8 +331,10 @@ if __name__ == '__main__':
             print(f'\nConfidence = {confidence}')
             print(tabulate(data_table, headers=headers))
 
-        with open('../saved_data/simulation_results.json', 'w') as f:
-            json.dump(sim_results, f)
+        store = ResultsStore()
+        for confidence in confidence_list:
+            for model_name in sim_models.keys():
+                store.append(SIMULATION_SUMMARY, model_name, sim_results[confidence][f'{model_name}_{int(confidence*100)}'], confidence=confidence)
 
     # PLotting:
     # Plot 3 episode examples and their classifications by the FCN, GRU and Small Transformer
@@ -0,0 +1,94 @@
+import os, sys, json
+sys.path.append(os.path.realpath('../'))
+print( sys.version )
+
+import numpy as np
+import matplotlib.pyplot as plt
+from tabulate import tabulate
+
+from utilities.makespan_simulation import EpisodeOutcomes, what_if_failure_rates, what_if_expected_makespan
+from utilities.results_store import ResultsStore, MAKESPAN_SIMULATION
+
+# NOTE: No model is loaded here, every what-if re-weights the per-episode outcome tables saved by `run_simulation`
+
+MODELS = ['FCN', 'GRU', 'Transformer']
+CONFIDENCE_LIST = [0.85, 0.9, 0.95, 0.99]
+P_FAILURES = np.round(np.linspace(0.05, 0.95, 19), 2)
+N_SIMULATIONS = 5000
+SEED = 42
+RESULTS_PATH = '../saved_data/what_if'
+IMGS_PATH = '../saved_data/imgs/simulation'
+
+
+def load_episode_outcomes(model_name: str, confidence: float):
+    sim_data = ResultsStore().latest(MAKESPAN_SIMULATION, model_name, confidence=confidence)
+    if sim_data is None:
+        return None
+    if 'episode_outcomes' not in sim_data:
+        print(f'--> The simulation of {model_name} at confidence {confidence} has no episode outcomes, re-run it')
+        return None
+
+    return EpisodeOutcomes.from_dict(sim_data['episode_outcomes'])
+
+
+def summarize(makespans) -> dict:
+    """ Mean and 5-95 percentiles of the simulated makespans for every failure rate """
+    return {
+        'mean': makespans.reduce(np.mean, 'simulation').values.tolist(),
+        'p5': np.percentile(makespans.values, 5, axis=1).tolist(),
+        'p95': np.percentile(makespans.values, 95, axis=1).tolist()
+    }
+
+
+def plot_what_if(results: dict, confidence: float, save: bool = True):
+    fig, ax = plt.subplots(figsize=(10, 6))
+    for name, res in results.items():
+        ax.plot(P_FAILURES, res['mean'], label=name)
+        ax.fill_between(P_FAILURES, res['p5'], res['p95'], alpha=0.2)
+    ax.set_xlabel('Probability of failure')
+    ax.set_ylabel('Simulated makespan [s]')
+    ax.set_title(f'Confidence {int(confidence * 100)}%')
+    ax.legend()
+    plt.tight_layout()
+    if save:
+        plt.savefig(f'{IMGS_PATH}/what_if_Pf_confidence_{int(confidence*100)}.png')
+        plt.close(fig)
+    else:
+        plt.show()
+
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(SEED)
+    what_if = {}
+    for confidence in CONFIDENCE_LIST:
+        results = {}
+        reactive_table = None
+        for model_name in MODELS:
+            table = load_episode_outcomes(model_name=model_name, confidence=confidence)
+            if table is None:
+                continue
+            # Every model classifies the same test episodes, any of them gives the reactive baseline
+            if reactive_table is None:
+                reactive_table = table.reactive()
+                results['Reactive'] = summarize(what_if_failure_rates(reactive_table, P_FAILURES, N_SIMULATIONS, rng))
+            try:
+                results[model_name] = summarize(what_if_failure_rates(table, P_FAILURES, N_SIMULATIONS, rng))
+                results[model_name]['EMS'] = what_if_expected_makespan(table, P_FAILURES).values.tolist()
+            except ValueError as e:
+                print(f'--> Skipping {model_name} at confidence {confidence}: {e}')
+        if len(results) == 0:
+            continue
+
+        print(f'Confidence {confidence}: mean simulated makespan [s]')
+        print(tabulate(
+            [[p_f] + [res['mean'][i] for res in results.values()] for i, p_f in enumerate(P_FAILURES)],
+            headers=['P_f'] + list(results.keys())
+        ))
+        print('\n')
+        plot_what_if(results=results, confidence=confidence)
+        what_if[confidence] = results
+
+    if not os.path.exists(RESULTS_PATH):
+        os.makedirs(RESULTS_PATH)
+    with open(f'{RESULTS_PATH}/failure_rate_what_if.json', 'w') as f:
+        json.dump({'p_failure': P_FAILURES.tolist(), 'n_simulations': N_SIMULATIONS, 'results': what_if}, f)
@@ -0,0 +1,28 @@
+import os, sys
+sys.path.append(os.path.realpath('../'))
+print( sys.version )
+
+from tabulate import tabulate
+
+from YamlLoader import YamlLoader
+from utilities.hyperparameter_search import run_search, SEARCH_DIR
+from utilities.trial_store import TrialStore
+
+SEARCH_CONFIG = '../config/oop_transformer_search.yaml'
+DATA = ['reactive', 'training']
+
+
+if __name__ == '__main__':
+    # Data must have been saved by `DataPreprocessing.run(save_data=True)`
+    best = run_search(config_path=SEARCH_CONFIG, data=DATA)
+
+    if best is None:
+        print('No trial completed')
+    else:
+        study = YamlLoader().load_yaml(SEARCH_CONFIG)['search']['study']
+        trials = TrialStore(f'{SEARCH_DIR}/trials.db').trials(study)
+        print(tabulate(
+            [[t['trial_id'], t['status'], t['rung'], t['epochs'], t['objective'], t['config']] for t in trials],
+            headers=['Trial', 'Status', 'Rung', 'Epochs', 'Objective', 'Config']
+        ))
+        print(f'\nBest trial {best["trial_id"]} (objective {best["objective"]}):\n{best["config"]}')
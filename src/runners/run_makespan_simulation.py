@@ -10,6 +10,7 @@ import tensorflow as tf
 from model_builds.OOPTransformer import OOPTransformer
 
 from utilities.makespan_utils import *
+from utilities.utils import init_gpus_for_tf, update_json
 
 
 MODELS_TO_RUN = [
@@ -22,6 +23,7 @@ MODELS_TO_RUN = [
     ]
 # MODE = 'create_data'
 MODE = 'load_data'
+MAKESPAN_RESULTS_PATH = '../saved_data/makespan/makespan_results.txt'
 
 
 def load_keras_model(model_name: str, makespan_models: dict, verbose: bool = True):
@@ -44,71 +46,76 @@ def load_keras_weights(model_build: OOPTransformer, model_name: str, makespan_mo
         print(f'{e}: model weights {model_name} do not exist!')
 
 
-def run_makespan_simulation(models_to_run: dict, data: list, confidence: float,  n_simulations: int = 100, compute: bool = True, save_dicts: bool = True):
-    with open('../saved_data/makespan/makespan_results.txt', 'r') as f:
-        res = json.loads(f.read())
+def empty_result() -> dict:
+    return {'metrics': {}, 'conf_mat': {}, 'times': {}, 'makespan_sim_hist': [], 'makespan_sim_avg': -1, 'makespan_sim_std': -1}
+
+
+def run_makespan_simulation(models_to_run: dict, data: list, confidence: float,  n_simulations: int = 100, tolerance: float = None, compute: bool = True, save_dicts: bool = True):
+    # Simulations run before touching the results file, only the keys of this run are merged into it afterwards
+    computed = {}
     if compute:
         for model_name, model in models_to_run.items():
-            if model_name not in res.keys():
-                res[model_name] = {'metrics': {}, 'conf_mat': {}, 'times': {}, 'makespan_sim_hist': [], 'makespan_sim_avg': -1, 'makespan_sim_std': -1}
             print(f'====> For model {model_name}:')
-            avg_mks, mks, metrics, conf_mat = run_simulation(
+            avg_mks, mks, metrics, conf_mat, ci = run_simulation(
                 model_name=model_name,
                 model=model,
                 episodes=data,
                 confidence=confidence,
                 n_simulations=n_simulations,
+                tolerance=tolerance,
                 verbose=True
             )
-            if f'{model_name}_{int(confidence*100)}' not in res.keys():
-                res[f'{model_name}_{int(confidence*100)}'] = {'metrics': {}, 'conf_mat': {}, 'times': {}, 'makespan_sim_hist': [], 'makespan_sim_avg': -1, 'makespan_sim_std': -1}
-            res[f'{model_name}_{int(confidence*100)}']['metrics'] = metrics
-            res[f'{model_name}_{int(confidence*100)}']['conf_mat'] = conf_mat
-            res[f'{model_name}_{int(confidence*100)}']['makespan_sim_hist'] = mks
-            res[f'{model_name}_{int(confidence*100)}']['makespan_sim_avg'] = avg_mks
-            res[f'{model_name}_{int(confidence*100)}']['makespan_sim_std'] = np.std(res[model_name]['makespan_sim_hist'])
+            computed[f'{model_name}_{int(confidence*100)}'] = {
+                'metrics': metrics,
+                'conf_mat': conf_mat,
+                'makespan_sim_hist': mks,
+                'makespan_sim_avg': avg_mks,
+                'makespan_sim_std': np.std(mks),
+                'makespan_sim_n': len(mks),
+                'confidence_intervals': ci
+            }
+
+    def update(res: dict) -> dict:
+        if compute:
+            for model_name in models_to_run.keys():
+                if model_name not in res.keys():
+                    res[model_name] = empty_result()
+                key = f'{model_name}_{int(confidence*100)}'
+                res[key] = {**res.get(key, empty_result()), **computed[key]}
+        else:
+            for model_name in models_to_run.keys():
+                if f'{model_name}_{int(confidence*100)}' not in res.keys():
+                    res[f'{model_name}_{int(confidence*100)}'] = empty_result()
+                print(f'====> Updating expected makespan from equation for {model_name}:')
+                metrics = res[f'{model_name}_{int(confidence*100)}']['metrics']
+                res[model_name]['metrics']['EMS'] = abs(monitored_makespan(
+                    MTS=float(metrics['MTS']) if metrics['MTS'] != 'N/A' else 0,
+                    MTF=float(metrics['MTF']) if metrics['MTF'] != 'N/A' else 0,
+                    MTN=float(metrics['MTN']) if metrics['MTN'] != 'N/A' else 0,
+                    P_TP=float(metrics['P_TP']) if metrics['P_TP'] != 'N/A' else 0,
+                    P_FN=float(metrics['P_FN']) if metrics['P_FN'] != 'N/A' else 0,
+                    P_TN=float(metrics['P_TN']) if metrics['P_TN'] != 'N/A' else 0,
+                    P_FP=float(metrics['P_FP']) if metrics['P_FP'] != 'N/A' else 0,
+                    P_NCF=float(metrics['P_NCF']) if metrics['P_NCS'] != 'N/A' else 0,
+                    P_NCS=float(metrics['P_NCS']) if metrics['P_NCF'] != 'N/A' else 0
+                ))
+
+        return res
+
+    if save_dicts:
+        # Locked read-merge-write, parallel runs (e.g. other confidences) keep each other's results
+        res = update_json(MAKESPAN_RESULTS_PATH, update)
     else:
-        for model_name, model in models_to_run.items():
-            if f'{model_name}_{int(confidence*100)}' not in res.keys():
-                res[f'{model_name}_{int(confidence*100)}'] = {'metrics': {}, 'conf_mat': {}, 'times': {}, 'makespan_sim_hist': [], 'makespan_sim_avg': -1, 'makespan_sim_std': -1}
-            print(f'====> Updating expected makespan from equation for {model_name}:')
-            res[model_name]['metrics']['EMS'] = abs(monitored_makespan(
-                MTS=float(res[f'{model_name}_{int(confidence*100)}']['metrics']['MTS']) if res[f'{model_name}_{int(confidence*100)}']['metrics']['MTS'] != 'N/A' else 0,
-                MTF=float(res[f'{model_name}_{int(confidence*100)}']['metrics']['MTF']) if res[f'{model_name}_{int(confidence*100)}']['metrics']['MTF'] != 'N/A' else 0,
-                MTN=float(res[f'{model_name}_{int(confidence*100)}']['metrics']['MTN']) if res[f'{model_name}_{int(confidence*100)}']['metrics']['MTN'] != 'N/A' else 0,
-                P_TP=float(res[f'{model_name}_{int(confidence*100)}']['metrics']['P_TP']) if res[f'{model_name}_{int(confidence*100)}']['metrics']['P_TP'] != 'N/A' else 0,
-                P_FN=float(res[f'{model_name}_{int(confidence*100)}']['metrics']['P_FN']) if res[f'{model_name}_{int(confidence*100)}']['metrics']['P_FN'] != 'N/A' else 0,
-                P_TN=float(res[f'{model_name}_{int(confidence*100)}']['metrics']['P_TN']) if res[f'{model_name}_{int(confidence*100)}']['metrics']['P_TN'] != 'N/A' else 0,
-                P_FP=float(res[f'{model_name}_{int(confidence*100)}']['metrics']['P_FP']) if res[f'{model_name}_{int(confidence*100)}']['metrics']['P_FP'] != 'N/A' else 0,
-                P_NCF=float(res[f'{model_name}_{int(confidence*100)}']['metrics']['P_NCF']) if res[f'{model_name}_{int(confidence*100)}']['metrics']['P_NCS'] != 'N/A' else 0,
-                P_NCS=float(res[f'{model_name}_{int(confidence*100)}']['metrics']['P_NCS']) if res[f'{model_name}_{int(confidence*100)}']['metrics']['P_NCF'] != 'N/A' else 0
-            ))
+        with open(MAKESPAN_RESULTS_PATH, 'r') as f:
+            res = update(json.load(f))
 
     print(f'res = {res}\n')
 
-    if save_dicts:
-        with open('../saved_data/makespan/makespan_results.txt', 'w') as f:
-            f.write(json.dumps(res))
-
     return res
 
 
 if __name__ == '__main__':
-    gpus = tf.config.experimental.list_physical_devices(device_type='GPU')
-    print( f"Found {len(gpus)} GPUs!" )
-    for i in range( len( gpus ) ):
-        try:
-            tf.config.experimental.set_memory_growth(device=gpus[i], enable=True)
-            tf.config.experimental.VirtualDeviceConfiguration( memory_limit = 1024*6 )
-            print( f"\t{tf.config.experimental.get_device_details( device=gpus[i] )}" )
-        except RuntimeError as e:
-            print( '\n', e, '\n' )
-
-    devices = tf.config.list_physical_devices()
-    print( "Tensorflow sees the following devices:" )
-    for dev in devices:
-        print( f"\t{dev}" )
-        print
+    init_gpus_for_tf()
 
     # print('LOADING MODELS...')
     # makespan_models = {}
@@ -8,13 +8,16 @@ os.environ['TF_FORCE_GPU_ALLOW_GROWTH'] = 'true'
 import numpy as np
 import tensorflow as tf
 
-from sklearn.model_selection import train_test_split
-
 from data_management.data_preprocessing import DataPreprocessing
+from data_management.balancing import load_train_indices, load_class_weight
+from data_management.validation_split import load_train_groups, validation_split, load_validation_episodes
 from model_builds.FCN import FCN
 from model_builds.RNN import RNN, GRU, LSTM
-from model_builds.OOPTransformer import OOPTransformer
+from model_builds.OOPTransformer import OOPTransformer, load_oop_transformer_config
 from utilities.metrics_plots import plot_acc_loss, plot_evaluation_on_test_window_data
+from utilities.utils import init_gpus_for_tf
+from utilities.makespan_utils import EpisodeWindowCache
+from utilities.training_callbacks import MakespanCheckpoint
 
 
 def load_keras_model(model_name: str, verbose: bool = True):
@@ -65,34 +68,9 @@ def build_oop_transformer(X_sample, model_type: str):
 
     transformer_net = OOPTransformer(model_name=name)
 
-    num_layers = 4
-    d_model = 6
-    ff_dim = 256
-    num_heads = 8
-    head_size = 256
-    dropout_rate = 0.2
-    mlp_dropout = 0.4
-    mlp_units = [128, 256, 64]
-    if model_type == 'small':
-        num_layers = 4
-        d_model = 6
-        ff_dim = 256
-        num_heads = 4
-        head_size = 128
-        dropout_rate = 0.2
-        mlp_dropout = 0.4
-        mlp_units = [128]
-
     transformer_net.build(
             X_sample=X_sample,
-            num_layers=num_layers,
-            d_model=d_model,
-            ff_dim=ff_dim,
-            num_heads=num_heads,
-            head_size=head_size,
-            dropout_rate=dropout_rate,
-            mlp_dropout=mlp_dropout,
-            mlp_units=mlp_units,
+            **load_oop_transformer_config(model_type=model_type),
             verbose=False
         )
 
@@ -124,6 +102,9 @@ DATA = ['reactive', 'training']
 DATA_DIR = f'../../data/data_manager/{"_".join(DATA)}'
 SAVE_DATA = True
 LOAD_DATA_FROM_FILES = True
+COMPUTE = True # ---------------- Train the models (False loads the saved ones and their histories)
+SAMPLING = 'under' # ------------- Balancing of newly created data, saved data keeps the one it was saved with
+SEED = 42
 MODELS_TO_RUN = [
     'FCN',
     'GRU',
@@ -132,6 +113,10 @@ MODELS_TO_RUN = [
     'OOP_Transformer',
     'OOP_Transformer_small'
     ]
+# Select the checkpoint on expected makespan over the validation episodes instead of on val_loss only
+MAKESPAN_CHECKPOINT = True
+MAKESPAN_CONFIDENCE = 0.95
+MAKESPAN_EVERY_N_EPOCHS = 5
 
 
 class hist_obj:
@@ -139,7 +124,7 @@ class hist_obj:
         self.history = h
 
 
-def run_model(model, X_train, Y_train, X_test, Y_test, X_window_test, Y_window_test, model_n_params, compute: bool = True):
+def run_model(model, X_train, Y_train, X_test, Y_test, X_window_test, Y_window_test, model_n_params, compute: bool = True, extra_callbacks: list = []):
     if compute:
         model_start_time = time.time()
         model.fit(
@@ -148,7 +133,8 @@ def run_model(model, X_train, Y_train, X_test, Y_test, X_window_test, Y_window_t
             X_test=X_test,
             Y_test=Y_test,
             epochs=200,
-            save_model=True
+            save_model=True,
+            extra_callbacks=extra_callbacks
         )
         model_training_time = (time.time() - model_start_time) / 60.0
         print(f'\n{model_name} training time = {model_training_time} minutes\n')
@@ -179,22 +165,9 @@ def run_model(model, X_train, Y_train, X_test, Y_test, X_window_test, Y_window_t
 
 
 if __name__ == '__main__':
-    gpus = tf.config.experimental.list_physical_devices(device_type='GPU')
-    print( f"Found {len(gpus)} GPUs!" )
-    for i in range( len( gpus ) ):
-        try:
-            tf.config.experimental.set_memory_growth(device=gpus[i], enable=True)
-            tf.config.experimental.VirtualDeviceConfiguration( memory_limit = 1024*6 )
-            print( f"\t{tf.config.experimental.get_device_details( device=gpus[i] )}" )
-        except RuntimeError as e:
-            print( '\n', e, '\n' )
-
-    devices = tf.config.list_physical_devices()
-    print( "Tensorflow sees the following devices:" )
-    for dev in devices:
-        print( f"\t{dev}" )
-
-    dp = DataPreprocessing(sampling='none', data=DATA)
+    init_gpus_for_tf()
+
+    dp = DataPreprocessing(sampling=SAMPLING, data=DATA)
     if LOAD_DATA_FROM_FILES:
         print(f'\nLoading data from files (using {DATA})...', end='')
         with open(f'{DATA_DIR}/{"_".join(DATA)}_X_train.npy', 'rb') as f:
@@ -214,6 +187,9 @@ if __name__ == '__main__':
 
         with open(f'{DATA_DIR}/{"_".join(DATA)}_Y_winTest.npy', 'rb') as f:
             Y_winTest = np.load(f, allow_pickle=True)
+        train_groups = load_train_groups(DATA_DIR, "_".join(DATA), len(X_train))
+        train_indices = load_train_indices(DATA_DIR, "_".join(DATA), len(X_train))
+        class_weight = load_class_weight(f'{DATA_DIR}/{"_".join(DATA)}_class_weight.json')
         roll_win_width = int(7.0 * 50)
         print('DONE\n')
         print(f'Number of test episodes = {len(X_winTest)}')
@@ -226,14 +202,26 @@ if __name__ == '__main__':
         Y_test = dp.Y_test
         X_winTest = dp.X_winTest
         Y_winTest = dp.Y_winTest
+        train_groups = dp.train_groups
+        train_indices = dp.train_sample_indices
+        class_weight = dp.class_weight
         roll_win_width = dp.rollWinWidth
         print('DONE\n')
 
     # From the previous we have 0.8 train split and 0.2 test split, now we need to separate
     # the train split into train-validation splits
 
-    # Generate train-validation split with 0.8 train and 0.2 validation
-    X_train, X_val, Y_train, Y_val = train_test_split(X_train, Y_train, train_size=0.8)
+    # Generate train-validation split with 0.8 train and 0.2 validation, by episode: overlapping windows of one
+    # episode in both splits leak, and the test episodes stay untouched until the reported evaluation
+    train_windows, val_windows, val_episodes = validation_split(train_groups, val_frac=0.2, seed=SEED)
+    if class_weight is not None:
+        # The model builds fit plain arrays here, which would silently drop the weights
+        raise ValueError("Data balanced with 'weighted' sampling needs sample weights, train it with `kfold_runner`, the search or `distributed_runner`")
+    # X_train holds every window, the balanced selection of `DataPreprocessing` is applied to both splits
+    train_windows = np.intersect1d(train_indices, train_windows)
+    val_windows = np.intersect1d(train_indices, val_windows)
+    X_train, X_val = X_train[train_windows], X_train[val_windows]
+    Y_train, Y_val = Y_train[train_windows], Y_train[val_windows]
 
     if os.path.exists('../saved_data/model_sizes.json'):
         with open('../saved_data/model_sizes.json', 'r') as f:
@@ -246,6 +234,15 @@ if __name__ == '__main__':
     with open('../saved_data/training_times.txt', 'r+') as f:
         f.truncate(0)
 
+    if COMPUTE and MAKESPAN_CHECKPOINT:
+        # Full episodes of the validation windows, the checkpoint never sees the test episodes
+        if LOAD_DATA_FROM_FILES:
+            val_data = load_validation_episodes(DATA_DIR, "_".join(DATA), val_episodes)
+        else:
+            val_data = [dp.data[dp.episode_rows[dp.train_indices[i]]] for i in val_episodes]
+        episode_cache = EpisodeWindowCache(val_data)
+        print(f'Cached {len(episode_cache)} validation episodes for the makespan checkpoint')
+
     preds_dict = {}
     overall_start_time = time.time()
     for model_name in MODELS_TO_RUN:
@@ -264,7 +261,13 @@ if __name__ == '__main__':
             X_window_test=X_winTest,
             Y_window_test=Y_winTest,
             model_n_params=model_n_params,
-            compute=False
+            compute=COMPUTE,
+            extra_callbacks=[MakespanCheckpoint(
+                cache=episode_cache,
+                confidence=MAKESPAN_CONFIDENCE,
+                every_n_epochs=MAKESPAN_EVERY_N_EPOCHS,
+                filepath=f'../saved_models/{model_name}_best_makespan/'
+            )] if COMPUTE and MAKESPAN_CHECKPOINT else []
         )
         preds_dict[model_name] = preds
 
@@ -1,17 +1,19 @@
 import os, sys, json
 sys.path.append(os.path.realpath('../'))
 print( sys.version )
-os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2' # INFO and WARNING messages are not printed
 
 import numpy as np
 from scipy import stats
 from tabulate import tabulate
 
-from run_makespan_simulation import run_reactive_simulation
-from utilities.makespan_utils import get_mts_mtf, reactive_makespan
+from utilities.makespan_equations import get_mts_mtf, reactive_makespan, run_reactive_simulation
+from utilities.bootstrap import bootstrap_mean, bootstrap_mean_difference
+from utilities.results_store import ResultsStore, MAKESPAN_SIMULATION
 
 DATA = ['reactive', 'training']
 DATA_DIR = f'../../data/instance_data/{"_".join(DATA)}'
+N_RESAMPLES = 10000
+SEED = 42
 
 if __name__ == '__main__':
     # Load data
@@ -26,14 +28,16 @@ if __name__ == '__main__':
     react_avg_mks, sim_mks = run_reactive_simulation(
         episodes=test_data,
         n_simulations=1000,
-        verbose=True
+        verbose=True,
+        seed=SEED
     )
-    print('\n')
+    print()
 
     # Preemptive
     confidence_levels = [0.85, 0.9, 0.95, 0.99]
     models = ['FCN', 'GRU', 'Transformer']
     data = {}
+    store = ResultsStore()
     for confidence in confidence_levels:
         headers = [f'Confidence {confidence}', 'Reactive', 'FCN', 'GRU', 'Transformer']
         data_table = [
@@ -44,12 +48,26 @@ if __name__ == '__main__':
         ]
         data[confidence] = {}
         data[confidence]['Reactive'] = sim_mks[:500]
-        data_dir = f'../saved_data/test_data_simulation_confidence_{int(confidence * 100)}'
         for model_name in models:
-            # Load data
-            with open(f'{data_dir}/{model_name}.json', 'r') as f:
-                 sim_data = json.load(f)
+            sim_data = store.latest(MAKESPAN_SIMULATION, model_name, confidence=confidence)
             data[confidence][model_name] = sim_data['simulation_makespan_list']
+            data[confidence][f'{model_name}_EMS_CI'] = sim_data.get('confidence_intervals', {}).get('variables', {}).get('EMS')
+
+        # Bootstrap CIs of the mean makespan and of its difference to reactive (an interval below 0 means faster than reactive)
+        ci_table = []
+        for model_name in ['Reactive'] + models:
+            mean_ci = bootstrap_mean(data[confidence][model_name], n_resamples=N_RESAMPLES, seed=SEED)
+            row = [model_name, mean_ci['estimate'], f'[{mean_ci["low"]:.3f}, {mean_ci["high"]:.3f}]']
+            ems_ci = data[confidence].get(f'{model_name}_EMS_CI')
+            row.append(f'{ems_ci["estimate"]:.3f} [{ems_ci["low"]:.3f}, {ems_ci["high"]:.3f}]' if ems_ci else 'N/A')
+            if model_name == 'Reactive':
+                row.append('-')
+            else:
+                diff_ci = bootstrap_mean_difference(data[confidence][model_name], data[confidence]['Reactive'], n_resamples=N_RESAMPLES, seed=SEED)
+                row.append(f'{diff_ci["estimate"]:.3f} [{diff_ci["low"]:.3f}, {diff_ci["high"]:.3f}]')
+            ci_table.append(row)
+        print(tabulate(ci_table, headers=[f'Confidence {confidence}', 'Mean makespan', '95% CI', 'EMS (95% CI)', 'Mean - Reactive (95% CI)']))
+        print('\n')
 
         # Perform Kruskal-Wallis test
         kw_test_result = stats.kruskal(
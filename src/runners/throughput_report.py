@@ -0,0 +1,79 @@
+import os, sys, json, glob
+sys.path.append(os.path.realpath('../'))
+# print(sys.path)
+
+import numpy as np
+from tabulate import tabulate
+
+# Summary of the logs written by `ThroughputLogger` (one per `fit`), compared with the previous run of the same model
+# and batch size so throughput regressions from changes to batching or windowing stand out
+THROUGHPUT_DIR = '../saved_data/throughput'
+REGRESSION_THRESHOLD = 0.10 # Relative drop of samples/s flagged as a regression
+SKIP_FIRST_EPOCH = True # The first epoch includes graph tracing
+
+
+def load_runs(log_dir: str) -> list:
+    """ All throughput logs, oldest first """
+    runs = []
+    for path in glob.glob(f'{log_dir}/*.json'):
+        with open(path, 'r') as f:
+            run = json.load(f)
+        if len(run['epochs']) > 0:
+            runs.append(run)
+
+    return sorted(runs, key=lambda run: run['started'])
+
+
+def summarize_run(run: dict) -> dict:
+    """ Median throughput and mean times over the measured epochs of one run """
+    epochs = run['epochs'][1:] if SKIP_FIRST_EPOCH and len(run['epochs']) > 1 else run['epochs']
+    def column(key):
+        return np.array([epoch[key] for epoch in epochs])
+
+    return {
+        'model': run['model'],
+        'run_id': run['run_id'],
+        'batch_size': run['batch_size'],
+        'epochs': len(run['epochs']),
+        'samples_per_s': float(np.median(column('samples_per_s'))),
+        'steps_per_s': float(np.median(column('steps_per_s'))),
+        'input_fraction': float(np.mean(column('input_fraction'))),
+        'epoch_time_s': float(np.mean(column('wall_time_s'))),
+        'peak_rss_mb': float(column('peak_rss_mb').max())
+    }
+
+
+def flag_regressions(summaries: list, threshold: float = REGRESSION_THRESHOLD) -> list:
+    """ Relative change of samples/s with respect to the previous run of the same model and batch size """
+    previous = {}
+    for summary in summaries:
+        key = (summary['model'], summary['batch_size'])
+        summary['change'] = None
+        summary['regression'] = False
+        if key in previous:
+            summary['change'] = summary['samples_per_s'] / previous[key]['samples_per_s'] - 1
+            summary['regression'] = summary['change'] < -threshold
+        previous[key] = summary
+
+    return summaries
+
+
+if __name__ == '__main__':
+    summaries = flag_regressions([summarize_run(run) for run in load_runs(THROUGHPUT_DIR)])
+    if len(summaries) == 0:
+        print(f'No throughput logs in {THROUGHPUT_DIR}')
+    else:
+        print(tabulate(
+            [
+                [
+                    s['model'], s['run_id'], s['batch_size'], s['epochs'], s['samples_per_s'], s['steps_per_s'],
+                    100 * s['input_fraction'], s['epoch_time_s'], s['peak_rss_mb'],
+                    '' if s['change'] is None else f'{100 * s["change"]:+.1f} %' + (' REGRESSION' if s['regression'] else '')
+                ]
+                for s in summaries
+            ],
+            headers=['Model', 'Run', 'Batch', 'Epochs', 'Samples/s', 'Steps/s', 'Input [%]', 'Epoch [s]', 'Peak RSS [MB]', 'vs previous'],
+            floatfmt='.1f'
+        ))
+        with open('../saved_data/throughput_summary.json', 'w') as f:
+            json.dump(summaries, f, indent=4)
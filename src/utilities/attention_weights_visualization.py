@@ -15,6 +15,7 @@ from data_management.data_preprocessing import DataPreprocessing
 from model_builds.OOPTransformer import OOPTransformer
 from utilities.utils import CounterDict
 from utilities.makespan_utils import *
+from utilities.plot_rendering import render_batch, attention_weights_jobs, attention_time_series_jobs
 
 
 class EpisodePerf:
@@ -51,101 +52,12 @@ def monitored_makespan( MTS, MTF, MTN, P_TP, P_FN, P_TN, P_FP, P_NCS, P_NCF ):
 
 
 def plot_attention_weights(attention_heads, episode_num, time_step, res, values):
-    for h, head in enumerate(attention_heads[0]):
-        fig, axes = plt.subplots(1, 1, figsize=(20, 10))
-
-        shw = axes.matshow(head)
-        bar = plt.colorbar(shw)
-
-        axes.set_title(f'Episode {episode_num}, Head {h+1}\nPredicted {res} at time {time_step} ms ({values})')
-
-        plt.tight_layout()
-        dir_path = f'../saved_data/imgs/attention/episode_{episode_num}/'
-        if not os.path.isdir(dir_path):
-            os.makedirs(dir_path)
-
-        plt.savefig(dir_path + f'attention_mat_ep_{episode_num}_head_{h}.png')
-        plt.clf()
-        plt.close("all")
+    render_batch(attention_weights_jobs(attention_heads, episode_num, time_step, res, values), n_workers=0)
 
 
 def plot_attention_on_time_series(episode, attention_heads, episode_num, time_step_ms, ts_s, ts_ms):
     print(f'Classification time step = {time_step_ms} ms')
-    
-    # Big-picture plot
-    fx = episode[:, 1]
-    fy = episode[:, 2]
-    fz = episode[:, 3]
-    tx = episode[:, 4]
-    ty = episode[:, 5]
-    tz = episode[:, 6]
-
-    fig, ax = plt.subplots(2, 1, figsize=(15, 8))
-    ax[0].plot(np.arange(0, episode.shape[0] * ts_ms, ts_ms), fx, linewidth=1, linestyle='solid', label='Force x')
-    ax[0].plot(np.arange(0, episode.shape[0] * ts_ms, ts_ms), fy, linewidth=1, linestyle='dotted', label='Force y')
-    ax[0].plot(np.arange(0, episode.shape[0] * ts_ms, ts_ms), fz, linewidth=1, linestyle='dashed', label='Force z')
-    ax[0].axvspan(time_step_ms - (350 * ts_ms), time_step_ms, color='gray', alpha=0.3)
-    ax[0].legend()
-
-    ax[1].plot(np.arange(0, episode.shape[0] * ts_ms, ts_ms), tx, linewidth=1, linestyle='solid', label='Torque x')
-    ax[1].plot(np.arange(0, episode.shape[0] * ts_ms, ts_ms), ty, linewidth=1, linestyle='dotted', label='Torque y')
-    ax[1].plot(np.arange(0, episode.shape[0] * ts_ms, ts_ms), tz, linewidth=1, linestyle='dashed', label='Torque z')
-    ax[1].axvspan(time_step_ms - (350 * ts_ms), time_step_ms, color='gray', alpha=0.3)
-    ax[1].legend()
-    plt.savefig(f'../saved_data/imgs/attention/episode_{episode_num}/ep_{episode_num}_big_picture.png')
-    plt.clf()
-    plt.close("all")
-
-    time_step = int(time_step_ms / 20.0)
-
-    # Zoomed plot with attention visualization
-    fx_trunc = episode[time_step - 350:time_step, 1]
-    fy_trunc = episode[time_step - 350:time_step, 2]
-    fz_trunc = episode[time_step - 350:time_step, 3]
-    tx_trunc = episode[time_step - 350:time_step, 4]
-    ty_trunc = episode[time_step - 350:time_step, 5]
-    tz_trunc = episode[time_step - 350:time_step, 6]
-
-    fig, ax = plt.subplots(2, 1, figsize=(15, 8))
-    ax[0].plot(fx_trunc, linewidth=1, color='gray', linestyle='solid', label='Force x')
-    ax[0].plot(fy_trunc, linewidth=1, color='gray', linestyle='dotted', label='Force y')
-    ax[0].plot(fz_trunc, linewidth=1, color='gray', linestyle='dashed', label='Force z')
-    ax[0].legend()
-
-    ax[1].plot(tx_trunc, linewidth=1, color='gray', linestyle='solid', label='Torque x')
-    ax[1].plot(ty_trunc, linewidth=1, color='gray', linestyle='dotted', label='Torque y')
-    ax[1].plot(tz_trunc, linewidth=1, color='gray', linestyle='dashed', label='Torque z')
-    ax[1].legend()
-
-    heads = [None for _ in range(attention_heads.shape[1])]
-    colors = ['blue', 'green', 'yellow', 'red']
-    for head_num in range(attention_heads.shape[1]):
-        head = np.array(attention_heads[0, head_num, :, :])
-        max_val = np.max(head)
-        max_val_coords = np.unravel_index(head.argmax(), head.shape)
-        max_val_row = head[:, max_val_coords[0]]
-        max_val_col = head[:, max_val_coords[1]]
-
-        # for i, value in enumerate(max_val_row):
-        #     if value >= 0.9 * max_val:
-        #         ax[0].axvspan(i, i, color=colors[head_num], alpha=0.7, label=f'Head {head_num}')
-        #         ax[1].axvspan(i, i, color=colors[head_num], alpha=0.7, label=f'Head {head_num}')
-
-        first = True
-        for i, value in enumerate(max_val_col):
-            if value >= 0.9 * max_val and first:
-                heads[head_num] = ax[0].axvspan(i, i, color=colors[head_num], alpha=0.7)
-                ax[1].axvspan(i, i, color=colors[head_num], alpha=0.7)
-                first = False
-            elif value >= 0.9 * max_val:
-                ax[0].axvspan(i, i, color=colors[head_num], alpha=0.7)
-                ax[1].axvspan(i, i, color=colors[head_num], alpha=0.7)
-
-    fig.legend(heads, ['Head 1', 'Head 2', 'Head 3', 'Head 4'])
-    fig.suptitle(f'Episode {episode_num}, Head {head_num}: At time step {max_val_coords[1]}, attention is focused on colored strips')
-    plt.savefig(f'../saved_data/imgs/attention/episode_{episode_num}/head_{head_num}_ep_{episode_num}_truncated.png')
-    plt.clf()
-    plt.close("all")
+    render_batch(attention_time_series_jobs(episode, attention_heads, episode_num, time_step_ms, ts_ms), n_workers=0)
 
 
 def clean_imgs_dir(directory='../saved_data/imgs/attention/'):
@@ -219,6 +131,7 @@ if __name__ == '__main__':
     FzCol = 3
     spikeThresh = 0.05
     ep_indices = [1, 6, 36, 61, 96]
+    plot_jobs = []
     for ep_index in ep_indices:
         with tf.device('/GPU:0'):
             print(f'----------------------------\nProcessing episode {ep_index}')
@@ -252,23 +165,26 @@ if __name__ == '__main__':
 
                     t_c_ms = (i * ts_ms)
 
-                    attn_weights = transformer_net.model.encoder.last_attn_scores
-                    plot_attention_weights(
+                    attn_weights = np.asarray(transformer_net.model.encoder.last_attn_scores)
+                    print(f'Classification time step = {t_c_ms} ms')
+                    plot_jobs += attention_weights_jobs(
                         attention_heads=attn_weights,
                         episode_num=ep_index,
                         time_step=t_c_ms,
                         res=ans,
                         values=row
                     )
-                    plot_attention_on_time_series(
+                    plot_jobs += attention_time_series_jobs(
                         episode=episode,
                         attention_heads=attn_weights,
                         episode_num=ep_index,
                         time_step_ms=t_c_ms,
-                        ts_s=ts_s,
                         ts_ms=ts_ms
                     )
 
+    # Every episode x head figure is rendered at once over a process pool
+    print(f'Rendered {len(render_batch(plot_jobs))} attention figures')
+
     # ep = None
     # episode_predictions = []
     # rolling_window_width = int(7.0 * 50)
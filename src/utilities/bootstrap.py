@@ -0,0 +1,93 @@
+import sys, os
+sys.path.append(os.path.realpath('../'))
+# print(sys.path)
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from utilities.makespan_simulation import EpisodeOutcomes, outcome_variables
+
+# NOTE: Resamples are evaluated in chunks, each with its own child of the seed's SeedSequence. The chunk size only
+#       depends on the number of samples, so results only depend on the seed and not on the number of threads
+
+MAX_CHUNK_SIZE = 1000
+CHUNK_MEMORY_BUDGET = 64 * 2 ** 20 # ---- Bytes of one chunk's (size, n) int64 draws and counts, one chunk per thread
+
+
+# Functions -----------------------------------------------------------------------
+def resample_counts(rng: np.random.Generator, n_resamples: int, n: int) -> np.ndarray:
+    """ (n_resamples, n) matrix with how many times each sample is drawn in every bootstrap resample """
+    idx = rng.integers(0, n, size=(n_resamples, n))
+    idx += np.arange(n_resamples)[:, None] * n
+
+    return np.bincount(idx.ravel(), minlength=n_resamples * n).reshape(n_resamples, n)
+
+
+def chunk_size(n: int, budget_bytes: int = CHUNK_MEMORY_BUDGET) -> int:
+    """ Resamples per chunk keeping the two (size, n) int64 matrices of `resample_counts` within `budget_bytes` """
+    return int(min(MAX_CHUNK_SIZE, max(1, budget_bytes // (16 * max(n, 1)))))
+
+
+def _run_chunked(func, n_resamples: int, n: int, seed, n_threads: int = None):
+    """ Evaluate `func(rng, size)` over chunks of resamples of `n` samples in a thread pool and concatenate the results """
+    size = chunk_size(n)
+    sizes = [size] * (n_resamples // size)
+    if n_resamples % size:
+        sizes.append(n_resamples % size)
+    rngs = [np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(len(sizes))]
+
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        chunks = list(executor.map(func, rngs, sizes))
+
+    if isinstance(chunks[0], dict):
+        return {key: np.concatenate([c[key] for c in chunks]) for key in chunks[0]}
+
+    return np.concatenate(chunks)
+
+
+def confidence_interval(estimate, replicates: np.ndarray, alpha: float = 0.05) -> dict:
+    """ Percentile interval of the bootstrap replicates (NaN replicates are ignored) """
+    replicates = np.asarray(replicates, dtype=float)
+    if np.all(np.isnan(replicates)):
+        return {'estimate': float(estimate), 'low': np.nan, 'high': np.nan, 'std': np.nan}
+    low, high = np.nanquantile(replicates, [alpha / 2, 1 - alpha / 2])
+
+    return {'estimate': float(estimate), 'low': float(low), 'high': float(high), 'std': float(np.nanstd(replicates))}
+
+
+def bootstrap_outcome_variables(table: EpisodeOutcomes, n_resamples: int = 10000, alpha: float = 0.05, seed = None, n_threads: int = None) -> dict:
+    """ Bootstrap CIs of EMS, MTP/MTN, MTS/MTF and every P_* by resampling the classified test episodes """
+    def func(rng, size):
+        return outcome_variables(table, weights=resample_counts(rng, size, len(table)))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        replicates = _run_chunked(func, n_resamples=n_resamples, n=len(table), seed=seed, n_threads=n_threads)
+        estimates = outcome_variables(table)
+
+    return {key: confidence_interval(estimates[key], replicates[key], alpha=alpha) for key in estimates}
+
+
+def bootstrap_mean(samples, n_resamples: int = 10000, alpha: float = 0.05, seed = None, n_threads: int = None) -> dict:
+    """ Bootstrap CI of the mean of `samples` (e.g. a list of simulated makespans) """
+    samples = np.asarray(samples, dtype=float)
+
+    def func(rng, size):
+        return resample_counts(rng, size, len(samples)) @ samples / len(samples)
+
+    replicates = _run_chunked(func, n_resamples=n_resamples, n=len(samples), seed=seed, n_threads=n_threads)
+
+    return confidence_interval(samples.mean(), replicates, alpha=alpha)
+
+
+def bootstrap_mean_difference(a, b, n_resamples: int = 10000, alpha: float = 0.05, seed = None, n_threads: int = None) -> dict:
+    """ Bootstrap CI of mean(a) - mean(b) for independent samples, an interval excluding 0 means a real difference """
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+
+    def func(rng, size):
+        return resample_counts(rng, size, len(a)) @ a / len(a) - resample_counts(rng, size, len(b)) @ b / len(b)
+
+    replicates = _run_chunked(func, n_resamples=n_resamples, n=max(len(a), len(b)), seed=seed, n_threads=n_threads)
+
+    return confidence_interval(a.mean() - b.mean(), replicates, alpha=alpha)
@@ -0,0 +1,262 @@
+import sys, os
+sys.path.append(os.path.realpath('../'))
+# print(sys.path)
+
+import numpy as np
+
+from utilities.makespan_engine import expected_makespan
+from utilities.results_store import weights_hash
+from utilities.makespan_simulation import OUTCOMES, SUCCESS_OUTCOMES, FAILURE_OUTCOMES, POSITIVE_OUTCOMES, NEGATIVE_OUTCOMES, EpisodeOutcomes, simulate_makespans
+
+# NOTE: NumPy only. Every model is evaluated from its per-window Pr(Fail) of all test episodes, concatenated into one
+#       array with the episode offsets, so curves for all thresholds come from sorts and cumulative sums instead of one
+#       sklearn call (and one `model.predict` per episode) per threshold
+
+WINDOW_PROBABILITIES_DIR = '../saved_data/window_probabilities'
+
+
+# Classes --------------------------------------------------------------------------
+class WindowProbabilities:
+    """ Pr(Fail) of every window of every episode: `probs[offsets[e]:offsets[e + 1]]` are the windows of episode `e`
+
+    `labels` is the class of every episode (0 = success, 1 = failure) """
+    def __init__(self, probs, offsets, labels) -> None:
+        self.probs = np.asarray(probs, dtype=float)
+        self.offsets = np.asarray(offsets, dtype=int)
+        self.labels = np.asarray(labels, dtype=int)
+        self.episode = np.repeat(np.arange(len(self.labels)), np.diff(self.offsets)) # Episode of every window
+
+
+    @classmethod
+    def from_predictions(cls, predictions: list, labels):
+        """ From the (n_windows, 2) softmax output of every episode """
+        lengths = [len(p) for p in predictions]
+        probs = np.concatenate([np.asarray(p)[:, 1] for p in predictions])
+
+        return cls(probs, np.concatenate(([0], np.cumsum(lengths))), labels)
+
+
+    @classmethod
+    def predict(cls, model, X_data: list, Y_data: list, batch_size: int = 4096):
+        """ Predict all windows of the test episodes in one call, `Y_data` are the one-hot window targets per episode """
+        lengths = [len(x) for x in X_data]
+        output = np.asarray(model.predict(np.concatenate(list(X_data)).astype('float32'), batch_size=batch_size, verbose=0))
+        labels = [int(np.argmax(y[0])) for y in Y_data]
+
+        return cls(output[:, 1], np.concatenate(([0], np.cumsum(lengths))), labels)
+
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+
+    def window_labels(self) -> np.ndarray:
+        return self.labels[self.episode]
+
+
+    def save(self, path: str):
+        if not os.path.exists(os.path.dirname(os.path.abspath(path))):
+            os.makedirs(os.path.dirname(os.path.abspath(path)))
+        np.savez(path, probs=self.probs, offsets=self.offsets, labels=self.labels)
+
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path) as f:
+            return cls(f['probs'], f['offsets'], f['labels'])
+
+
+# Functions -----------------------------------------------------------------------
+def binary_curves(scores, labels) -> dict:
+    """ ROC and precision-recall curves of `scores` (higher = positive) for every distinct threshold, from one sort
+
+    Same points as `sklearn.metrics.roc_curve(drop_intermediate=False)` / `precision_recall_curve`, with the ROC AUC
+    (trapezoidal) and the average precision """
+    scores = np.asarray(scores, dtype=float)
+    labels = np.asarray(labels, dtype=int)
+    order = np.argsort(-scores, kind='mergesort')
+    scores, labels = scores[order], labels[order]
+
+    # Last position of every distinct score: everything up to it is predicted positive at that threshold
+    last = np.r_[np.flatnonzero(np.diff(scores)), len(scores) - 1]
+    tps = np.cumsum(labels)[last]
+    fps = (last + 1) - tps
+    n_pos, n_neg = tps[-1], fps[-1]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        tpr = np.r_[0.0, tps / n_pos]
+        fpr = np.r_[0.0, fps / n_neg]
+        precision = tps / (tps + fps)
+        recall = tps / n_pos
+
+    return {
+        'thresholds': scores[last],
+        'fpr': fpr,
+        'tpr': tpr,
+        'roc_auc': float(np.trapz(tpr, fpr)),
+        'precision': precision,
+        'recall': recall,
+        'average_precision': float(np.sum(np.diff(np.r_[0.0, recall]) * precision))
+    }
+
+
+def first_crossings(wp: WindowProbabilities, thresholds) -> np.ndarray:
+    """ (n_thresholds, n_episodes) window of the first crossing of every threshold (confidence), -1 if never crossed
+
+    The window confidence is max(Pr(Pass), Pr(Fail)) in [0.5, 1]. Its running maximum per episode, shifted by 2 x the
+    episode number, is sorted over the whole array, so every first crossing is one `searchsorted` """
+    thresholds = np.asarray(thresholds, dtype=float)
+    confidence = np.maximum(wp.probs, 1.0 - wp.probs)
+    shifted = np.maximum.accumulate(confidence + 2.0 * wp.episode)
+    starts, ends = wp.offsets[:-1], wp.offsets[1:]
+
+    first = np.searchsorted(shifted, thresholds[:, None] + 2.0 * np.arange(len(wp))[None, :], side='left')
+    crossed = first < ends[None, :]
+
+    return np.where(crossed, first - starts[None, :], -1)
+
+
+def episode_decisions(wp: WindowProbabilities, thresholds) -> dict:
+    """ Episode-level decision at every threshold: window of the decision (-1 when not classified), predicted class
+    (-1 when not classified) and Pr(Fail) of the deciding window (NaN when not classified) """
+    first = first_crossings(wp, thresholds)
+    decided = first >= 0
+    score = np.where(decided, wp.probs[np.where(decided, first + wp.offsets[:-1][None, :], 0)], np.nan)
+    # As `scan_output_for_decision`: success ('P') only if Pr(Pass) > Pr(Fail)
+    predicted = np.where(decided, (score >= 0.5).astype(int), -1)
+
+    return {'window': first, 'predicted': predicted, 'score': score, 'decided': decided}
+
+
+def decision_curve(wp: WindowProbabilities, thresholds, window_width: int = int(7.0 * 50), ts_s: float = 20.0 / 1000.0) -> dict:
+    """ Episode-level first-crossing curve: for every threshold, the accuracy over the classified episodes, the
+    fraction not classified and the mean time to decision [s] (window end, from the episode start) """
+    thresholds = np.asarray(thresholds, dtype=float)
+    decisions = episode_decisions(wp, thresholds)
+    decided = decisions['decided']
+    n_decided = decided.sum(axis=1)
+    correct = (decisions['predicted'] == wp.labels[None, :]) & decided
+    decision_time = (window_width + decisions['window']) * ts_s
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {
+            'thresholds': thresholds,
+            'accuracy': correct.sum(axis=1) / n_decided,
+            'nc_rate': 1.0 - n_decided / len(wp),
+            'mean_decision_time': np.where(decided, decision_time, 0.0).sum(axis=1) / n_decided
+        }
+
+
+def evaluate(wp: WindowProbabilities, confidence: float = 0.9, thresholds = None) -> dict:
+    """ Every curve the evaluation plots use, computed once per model:
+        * 'window': ROC / PR over all windows
+        * 'episode': ROC / PR of the deciding window of the classified episodes at `confidence`
+        * 'decision': first-crossing curve over `thresholds` (default 0.5 to 1 in steps of 0.005) """
+    if thresholds is None:
+        thresholds = np.linspace(0.5, 1.0, 101)
+    decisions = episode_decisions(wp, [confidence])
+    decided = decisions['decided'][0]
+
+    return {
+        'window': binary_curves(wp.probs, wp.window_labels()),
+        'episode': binary_curves(decisions['score'][0][decided], wp.labels[decided]) if decided.any() else None,
+        'decision': decision_curve(wp, thresholds)
+    }
+
+
+def threshold_outcomes(wp: WindowProbabilities, thresholds, start_times, run_times, window_width: int = int(7.0 * 50), ts_s: float = 20.0 / 1000.0):
+    """ (n_thresholds, n_episodes) outcome codes (index into `OUTCOMES`) and decision times [s] of every episode at
+    every threshold, as `batched_episode_outcomes` classifies them at one confidence
+
+    `start_times` are the episode starts [s] of the windows in `wp`, `run_times` the full episode durations [s] """
+    thresholds = np.asarray(thresholds, dtype=float)
+    decisions = episode_decisions(wp, thresholds)
+    decided = decisions['decided']
+    p_fail = np.where(decided, decisions['score'], 0.0)
+
+    # 'T'/'F': the true class has at least the threshold, 'P'/'N': Pr(Pass) > Pr(Fail)
+    correct = np.where(wp.labels[None, :] == 0, 1.0 - p_fail, p_fail) >= thresholds[:, None]
+    positive = (1.0 - p_fail) > p_fail
+    codes = np.array([OUTCOMES.index(o) for o in ('FN', 'FP', 'TN', 'TP')])
+    not_classified = np.where(wp.labels == 0, OUTCOMES.index('NCS'), OUTCOMES.index('NCF'))
+    outcome = np.where(decided, codes[2 * correct + positive], not_classified[None, :])
+
+    start_times = np.asarray(start_times, dtype=float)
+    decision_time = np.where(decided, start_times[None, :] + (window_width + decisions['window']) * ts_s, np.nan)
+
+    return outcome, decision_time
+
+
+def makespan_tradeoff(wp: WindowProbabilities, start_times, run_times, thresholds = None, window_width: int = int(7.0 * 50), ts_s: float = 20.0 / 1000.0, n_simulations: int = 0, rng: np.random.Generator = None) -> dict:
+    """ Decision time vs. accuracy trade-off of one model over every threshold (confidence), from one pass over `wp`
+
+    For every threshold: mean time to decision [s], outcome rates P_TP ... P_NCF, the makespan variables and the
+    equation makespan 'EMS' (as `outcome_variables`). With `n_simulations` > 0 also the mean Monte Carlo makespan
+    'simulated_makespan' of `simulate_makespans` (NaN where no episode ever finishes the task).
+    'optimal_threshold' holds the threshold of the lowest makespan of each variant (None if there is none) """
+    if thresholds is None:
+        thresholds = np.linspace(0.5, 1.0, 101)
+    thresholds = np.asarray(thresholds, dtype=float)
+    run_times = np.asarray(run_times, dtype=float)
+    outcome, decision_time = threshold_outcomes(wp, thresholds, start_times, run_times, window_width=window_width, ts_s=ts_s)
+
+    def masked_mean(values, outcomes):
+        mask = np.isin(outcome, [OUTCOMES.index(o) for o in outcomes])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(mask, values, 0.0).sum(axis=1) / mask.sum(axis=1)
+
+    decided = ~np.isnan(decision_time)
+    curve = {
+        'thresholds': thresholds,
+        'mean_decision_time': masked_mean(np.nan_to_num(decision_time), OUTCOMES[:4]),
+        'MTP': masked_mean(np.nan_to_num(decision_time), POSITIVE_OUTCOMES),
+        'MTN': masked_mean(np.nan_to_num(decision_time), NEGATIVE_OUTCOMES),
+        'MTS': masked_mean(np.broadcast_to(run_times, outcome.shape), SUCCESS_OUTCOMES),
+        'MTF': masked_mean(np.broadcast_to(run_times, outcome.shape), FAILURE_OUTCOMES),
+    }
+    for i, o in enumerate(OUTCOMES):
+        curve[f'P_{o}'] = (outcome == i).mean(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        curve['accuracy'] = np.isin(outcome, [OUTCOMES.index('TP'), OUTCOMES.index('TN')]).sum(axis=1) / decided.sum(axis=1)
+    curve['EMS'] = expected_makespan(
+        **{key: curve[key] for key in ('MTS', 'MTF', 'MTN', 'P_TP', 'P_FN', 'P_TN', 'P_FP', 'P_NCS', 'P_NCF')},
+        equation='auto'
+    )
+    variants = {'equation': curve['EMS']}
+
+    if n_simulations > 0:
+        rng = rng if rng is not None else np.random.default_rng()
+        simulated = np.full(len(thresholds), np.nan)
+        for t in range(len(thresholds)):
+            table = EpisodeOutcomes(outcome[t], decision_time[t], run_times)
+            try:
+                simulated[t] = simulate_makespans(table=table, n_simulations=n_simulations, rng=rng)[0].mean()
+            except ValueError:
+                continue
+        curve['simulated_makespan'] = simulated
+        variants['simulation'] = simulated
+
+    curve['optimal_threshold'] = {}
+    for variant, makespans in variants.items():
+        makespans = np.where(np.isfinite(makespans), makespans, np.inf)
+        best = int(np.argmin(makespans))
+        curve['optimal_threshold'][variant] = float(thresholds[best]) if np.isfinite(makespans[best]) else None
+
+    return curve
+
+
+def cached_window_probabilities(model_name: str, model, X_data: list, Y_data: list, cache_dir: str = WINDOW_PROBABILITIES_DIR, recompute: bool = False):
+    """ `WindowProbabilities` of `model` on the test episodes, predicted once and then read from `cache_dir`
+
+    The file is keyed on the weights of the model, and only reused if it holds the same episodes and window counts
+    as `X_data`, so retrained models or another test set are predicted again """
+    path = f'{cache_dir}/{model_name}_{weights_hash(model)}.npz'
+    offsets = np.concatenate(([0], np.cumsum([len(x) for x in X_data])))
+    if os.path.exists(path) and not recompute:
+        wp = WindowProbabilities.load(path)
+        if np.array_equal(wp.offsets, offsets):
+            return wp
+    wp = WindowProbabilities.predict(model, X_data, Y_data)
+    wp.save(path)
+
+    return wp
@@ -0,0 +1,122 @@
+import sys, os, json, socket
+import subprocess
+sys.path.append(os.path.realpath('../'))
+# print(sys.path)
+
+import numpy as np
+
+# NOTE: The launcher side (ports, TF_CONFIG, subprocesses) does not import TensorFlow, only the workers do
+
+WORKER_CORES_ENV = 'DIST_WORKER_CORES'
+
+
+# Functions -----------------------------------------------------------------------
+def free_ports(n: int) -> list:
+    """ `n` currently free localhost ports """
+    sockets = []
+    for _ in range(n):
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.bind(('localhost', 0))
+        sockets.append(s)
+    ports = [s.getsockname()[1] for s in sockets]
+    for s in sockets:
+        s.close()
+
+    return ports
+
+
+def localhost_tf_configs(n_workers: int) -> list:
+    """ TF_CONFIG of every worker of a `MultiWorkerMirroredStrategy` cluster running on this machine """
+    cluster = {'worker': [f'localhost:{port}' for port in free_ports(n_workers)]}
+    return [json.dumps({'cluster': cluster, 'task': {'type': 'worker', 'index': i}}) for i in range(n_workers)]
+
+
+def worker_cores(index: int, cores_per_worker: int) -> list:
+    """ Disjoint block of cores for worker `index` """
+    return list(range(index * cores_per_worker, (index + 1) * cores_per_worker))
+
+
+def launch_local_workers(script: str, n_workers: int, cores_per_worker: int, env: dict = {}, verbose: bool = True) -> list:
+    """ Run `script` once per worker with its TF_CONFIG and cores, wait for all of them and return their exit codes """
+    processes = []
+    for index, tf_config in enumerate(localhost_tf_configs(n_workers)):
+        worker_env = {
+            **os.environ,
+            **env,
+            'TF_CONFIG': tf_config,
+            WORKER_CORES_ENV: ','.join(str(c) for c in worker_cores(index, cores_per_worker)),
+            'TF_CPP_MIN_LOG_LEVEL': '2'
+        }
+        processes.append(subprocess.Popen([sys.executable, script], cwd=os.path.dirname(script), env=worker_env))
+        if verbose:
+            print(f'--> Launched worker {index} on cores {worker_env[WORKER_CORES_ENV]}')
+
+    return [p.wait() for p in processes]
+
+
+def pin_worker():
+    """ Pin this worker process to the cores it was launched with and size TensorFlow's thread pools to them
+
+    Returns the worker index in the cluster """
+    from utilities.utils import limit_tf_threads
+
+    cores = [int(c) for c in os.environ[WORKER_CORES_ENV].split(',')]
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+    limit_tf_threads(len(cores))
+
+    return json.loads(os.environ['TF_CONFIG'])['task']['index']
+
+
+def sharded_window_dataset(X, Y, global_batch_size: int, input_context = None, shuffle: bool = True, seed: int = 0, indices = None, class_weight: dict = None):
+    """ tf.data pipeline over (memory-mapped) window arrays, each worker only reads its own shard of indices
+
+    To be used through `strategy.distribute_datasets_from_function`, which passes `input_context`. Batches repeat forever,
+    so `fit` needs `steps_per_epoch = len(indices) // global_batch_size`. `indices` defaults to all windows.
+    With `class_weight` batches also carry the weight of every window's class """
+    import tensorflow as tf
+
+    batch_size = global_batch_size
+    n_windows = len(X) if indices is None else len(indices)
+    indices = tf.data.Dataset.range(len(X)) if indices is None else tf.data.Dataset.from_tensor_slices(np.asarray(indices, dtype='int64'))
+    n_pipelines = 1
+    if input_context is not None:
+        batch_size = input_context.get_per_replica_batch_size(global_batch_size)
+        n_pipelines = input_context.num_input_pipelines
+        indices = indices.shard(n_pipelines, input_context.input_pipeline_id)
+    if shuffle:
+        indices = indices.shuffle(n_windows // n_pipelines, seed=seed, reshuffle_each_iteration=True)
+
+    weight_of_class = None
+    if class_weight is not None:
+        weight_of_class = np.zeros(max(class_weight) + 1, dtype='float32')
+        for c, w in class_weight.items():
+            weight_of_class[c] = w
+
+    def gather(idx):
+        # Sorted indices read memory-mapped arrays sequentially, the order inside a batch does not matter
+        idx = np.sort(idx)
+        return np.asarray(X[idx], dtype='float32'), np.asarray(Y[idx], dtype='float32')
+
+    def gather_weighted(idx):
+        x, y = gather(idx)
+        return x, y, weight_of_class[y.argmax(axis=1)]
+
+    def load_batch(idx):
+        if weight_of_class is None:
+            x, y = tf.numpy_function(gather, [idx], [tf.float32, tf.float32])
+        else:
+            x, y, w = tf.numpy_function(gather_weighted, [idx], [tf.float32, tf.float32, tf.float32])
+        x = tf.ensure_shape(x, [batch_size] + list(X.shape[1:]))
+        y = tf.ensure_shape(y, [batch_size] + list(Y.shape[1:]))
+        if weight_of_class is None:
+            return x, y
+        return x, y, tf.ensure_shape(w, [batch_size])
+
+    return (
+        indices
+        .batch(batch_size, drop_remainder=True)
+        .map(load_batch, num_parallel_calls=tf.data.AUTOTUNE)
+        .repeat()
+        .prefetch(tf.data.AUTOTUNE)
+    )
@@ -10,10 +10,15 @@ import matplotlib.pyplot as plt
 import tensorflow as tf
 
 from utilities.utils import set_size
+from utilities.plot_rendering import render_batch, probability_job
 
 # Some helper functions
 def graph_episode_output( res, index, ground_truth, out_decision, net, imgs_path, ts_ms = 20, save_fig=False ):
-    """ Graph the result of `simulate_episode_input` """
+    """ Graph the result of `simulate_episode_input`, saved figures are rendered with `plot_rendering` """
+    if save_fig:
+        render_batch([probability_job(res, index, ground_truth, out_decision, net, imgs_path, ts_ms=ts_ms)], n_workers=0)
+        return
+
     # Setup
     # plt.style.use('seaborn')
     # From Latex \textwidth
@@ -45,12 +50,7 @@ def graph_episode_output( res, index, ground_truth, out_decision, net, imgs_path
     plt.axis('tight')
     plt.title(f'Probabilities for {net}: episode {index}\nGT = {ground_truth} | Decision = {out_decision}')
     
-    if save_fig:
-        plt.savefig(imgs_path + f'{net}_prob_{index}.png')
-        plt.clf()
-        plt.close('all')
-    else:
-        plt.show()
+    plt.show()
     
     
 def scan_output_for_decision( output, trueLabel, threshold = 0.95 ):
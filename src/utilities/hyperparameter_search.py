@@ -0,0 +1,210 @@
+import sys, os, json, math
+sys.path.append(os.path.realpath('../'))
+# print(sys.path)
+
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2' # INFO and WARNING messages are not printed
+
+import numpy as np
+import tensorflow as tf
+
+from YamlLoader import YamlLoader
+from data_management.window_dataset import WindowSequence
+from data_management.balancing import load_train_indices, load_class_weight
+from data_management.validation_split import VALIDATION_FRAC, load_train_groups, validation_split, load_validation_episodes
+from model_builds.OOPTransformer import OOPTransformer
+from utilities.job_scheduler import run_jobs
+from utilities.makespan_utils import get_episode_outcomes
+from utilities.makespan_simulation import simulate_makespans
+from utilities.trial_store import TrialStore
+from utilities.utils import atomic_write_json
+
+SEARCH_DIR = '../saved_data/hyperparameter_search'
+
+
+# Classes --------------------------------------------------------------------------
+class TrialReporter(tf.keras.callbacks.Callback):
+    """ Reports val_loss after every epoch and stops the trial once it is worse than the median of the other trials """
+    def __init__(self, store: TrialStore, study: str, trial_id: int, pruning: dict) -> None:
+        super().__init__()
+        self.store = store
+        self.study = study
+        self.trial_id = trial_id
+        self.pruning = pruning
+        self.best_val_loss = float('inf')
+        self.last_epoch = 0
+        self.pruned = False
+
+
+    def on_epoch_end(self, epoch, logs=None):
+        val_loss = float(logs['val_loss'])
+        self.last_epoch = epoch + 1
+        self.best_val_loss = min(self.best_val_loss, val_loss)
+        self.store.report(self.study, self.trial_id, self.last_epoch, val_loss)
+
+        if self.pruning.get('enabled', False) and self.last_epoch >= self.pruning.get('warmup_epochs', 0):
+            others = self.store.epoch_values(self.study, self.last_epoch, exclude_trial=self.trial_id)
+            if len(others) >= self.pruning.get('min_trials', 1) and val_loss > np.median(others):
+                print(f'--> Pruning trial {self.trial_id} at epoch {self.last_epoch}: val_loss {val_loss:.4f} > median {np.median(others):.4f}')
+                self.pruned = True
+                self.model.stop_training = True
+
+
+# Functions -----------------------------------------------------------------------
+def sample_config(space: dict, rng: np.random.Generator) -> dict:
+    """ One random configuration of the YAML search space """
+    config = {}
+    for name, dist in space.items():
+        (kind, values), = dist.items()
+        if kind == 'choice':
+            config[name] = values[rng.integers(len(values))]
+        elif kind == 'uniform':
+            config[name] = float(rng.uniform(*values))
+        elif kind == 'log_uniform':
+            config[name] = float(np.exp(rng.uniform(np.log(values[0]), np.log(values[1]))))
+        elif kind == 'int':
+            config[name] = int(rng.integers(values[0], values[1] + 1))
+        else:
+            raise ValueError(f'Unknown distribution {kind} for {name}')
+
+    return config
+
+
+def rung_schedule(search: dict) -> list:
+    """ Cumulative epochs of every rung, e.g. [5, 15, 45] for min 5, max 45 and reduction factor 3 """
+    if search['strategy'] == 'random':
+        return [search['max_epochs']]
+    elif search['strategy'] == 'successive_halving':
+        eta = search['reduction_factor']
+        n_rungs = int(math.floor(math.log(search['max_epochs'] / search['min_epochs'], eta) + 1e-9)) + 1
+        return [min(search['max_epochs'], int(round(search['min_epochs'] * eta ** r))) for r in range(n_rungs)]
+
+    raise ValueError(f'Unknown search strategy {search["strategy"]}')
+
+
+def simulated_makespan_objective(model: tf.keras.Model, episodes: list, confidence: float, n_simulations: int, seed: int) -> float:
+    """ Mean simulated makespan of `model` over the validation episodes, infinite when no episode ever finishes the task """
+    table = get_episode_outcomes(model=model, episodes=episodes, confidence=confidence)
+    try:
+        makespans, _ = simulate_makespans(table=table, n_simulations=n_simulations, rng=np.random.default_rng(seed))
+    except ValueError:
+        return float('inf')
+
+    return float(makespans.mean())
+
+
+def run_trial(study: str, db_path: str, trial_id: int, rung: int, config: dict, start_epoch: int, epochs: int, search: dict, pruning: dict, data_dir: str, data_prefix: str):
+    """ Train one trial up to `epochs` (continuing from `start_epoch`), run inside a worker process of `run_jobs` """
+    store = TrialStore(db_path)
+    X_train = np.load(f'{data_dir}/{data_prefix}_X_train.npy', mmap_mode='r')
+    Y_train = np.load(f'{data_dir}/{data_prefix}_Y_train.npy', mmap_mode='r')
+    train_indices = load_train_indices(data_dir, data_prefix, len(X_train))
+    # Validation episodes come out of the train split (same split for every trial), the test split is never loaded
+    train_windows, val_windows, val_episodes = validation_split(
+        load_train_groups(data_dir, data_prefix, len(X_train)),
+        val_frac=search.get('validation_frac', VALIDATION_FRAC),
+        seed=search['seed']
+    )
+
+    oop_transformer = OOPTransformer(model_name=f'{study}_trial_{trial_id}')
+    oop_transformer.build(X_sample=np.asarray(X_train[:64]), **config, verbose=False)
+    weights_path = f'{SEARCH_DIR}/{study}/trial_{trial_id}/'
+    # Promoted trials continue from the weights of the previous rung instead of training from scratch
+    if start_epoch > 0:
+        oop_transformer.model.load_weights(weights_path).expect_partial()
+
+    reporter = TrialReporter(store=store, study=study, trial_id=trial_id, pruning=pruning)
+    store.update_trial(study, trial_id, 'running', rung, start_epoch)
+    oop_transformer.model.fit(
+        WindowSequence(
+            X_train, Y_train, np.intersect1d(train_indices, train_windows), batch_size=search['batch_size'], shuffle=True, seed=trial_id,
+            class_weight=load_class_weight(f'{data_dir}/{data_prefix}_class_weight.json')
+        ),
+        # Validation keeps to the windows balanced once by `DataPreprocessing`, as the k-fold folds
+        validation_data=WindowSequence(X_train, Y_train, np.intersect1d(train_indices, val_windows), batch_size=search['batch_size'], shuffle=False),
+        epochs=epochs,
+        initial_epoch=start_epoch,
+        callbacks=[reporter],
+        verbose=0
+    )
+    oop_transformer.model.save_weights(filepath=weights_path)
+
+    status = 'pruned' if reporter.pruned else 'complete'
+    objective = reporter.best_val_loss
+    if search['objective'] == 'simulated_makespan' and status == 'complete':
+        objective = simulated_makespan_objective(
+            model=oop_transformer.model,
+            episodes=load_validation_episodes(data_dir, data_prefix, val_episodes),
+            confidence=search['confidence'],
+            n_simulations=search['n_simulations'],
+            seed=search['seed']
+        )
+    store.update_trial(study, trial_id, status, rung, reporter.last_epoch, objective)
+    tf.keras.backend.clear_session()
+
+    return {'trial_id': trial_id, 'status': status, 'objective': objective, 'epochs': reporter.last_epoch}
+
+
+def run_search(config_path: str, data: list, verbose: bool = True):
+    """ Random search or successive halving over the YAML search space, trials of a rung run in parallel processes
+
+    Completed jobs are kept in a manifest, so an interrupted search resumes where it stopped. Returns the best trial """
+    conf = YamlLoader().load_yaml(config_path)
+    search = conf['search']
+    pruning = conf.get('pruning', {'enabled': False})
+    study = search['study']
+    study_dir = f'{SEARCH_DIR}/{study}'
+    db_path = f'{SEARCH_DIR}/trials.db'
+    data_prefix = '_'.join(data)
+    data_dir = f'../../data/data_manager/{data_prefix}'
+
+    store = TrialStore(db_path)
+    # Configurations only depend on the seed, resuming samples the same trials again
+    rng = np.random.default_rng(search['seed'])
+    configs = [sample_config(conf['space'], rng) for _ in range(search['n_trials'])]
+    for trial_id, config in enumerate(configs):
+        store.add_trial(study, trial_id, config)
+
+    schedule = rung_schedule(search)
+    survivors = list(range(search['n_trials']))
+    start_epoch = 0
+    for rung, epochs in enumerate(schedule):
+        if verbose:
+            print(f'\n====> Rung {rung + 1}/{len(schedule)}: {len(survivors)} trials up to {epochs} epochs')
+        jobs = {
+            f'trial_{trial_id}_rung_{rung}': {
+                'study': study,
+                'db_path': db_path,
+                'trial_id': trial_id,
+                'rung': rung,
+                'config': configs[trial_id],
+                'start_epoch': start_epoch,
+                'epochs': epochs,
+                'search': search,
+                'pruning': pruning,
+                'data_dir': data_dir,
+                'data_prefix': data_prefix
+            }
+            for trial_id in survivors
+        }
+        manifest = run_jobs(
+            job_func=run_trial,
+            jobs=jobs,
+            manifest_path=f'{study_dir}/manifest.json',
+            n_workers=search['n_workers'],
+            threads_per_worker=search['threads_per_worker'],
+            verbose=verbose
+        )
+
+        results = manifest.results()
+        completed = sorted(
+            [results[job_id] for job_id in jobs if job_id in results and results[job_id]['status'] == 'complete'],
+            key=lambda r: r['objective']
+        )
+        survivors = [r['trial_id'] for r in completed[:max(1, len(survivors) // search.get('reduction_factor', 1))]]
+        start_epoch = epochs
+
+    best = store.best_trial(study)
+    if best is not None:
+        atomic_write_json(f'{study_dir}/best_trial.json', best, indent=4)
+
+    return best
@@ -0,0 +1,84 @@
+import sys, os, json, time
+import traceback
+import multiprocessing as mp
+sys.path.append(os.path.realpath('../'))
+# print(sys.path)
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from utilities.utils import atomic_write_json
+
+# NOTE: Jobs run in 'spawn'ed processes (TensorFlow is not fork safe), so `job_func` must be a module level function
+#       and its kwargs picklable. Only the parent process writes the manifest, workers write their own result files
+
+
+# Classes --------------------------------------------------------------------------
+class JobManifest:
+    """ JSON record of finished jobs: {job_id: {'status', 'result', 'elapsed_s', 'error'}}, rewritten atomically """
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.jobs = {}
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self.jobs = json.load(f)
+
+
+    def is_done(self, job_id: str) -> bool:
+        return self.jobs.get(job_id, {}).get('status') == 'done'
+
+
+    def record(self, job_id: str, status: str, result = None, elapsed_s: float = None, error: str = None):
+        self.jobs[job_id] = {'status': status, 'result': result, 'elapsed_s': elapsed_s, 'error': error}
+        atomic_write_json(self.path, self.jobs, indent=4)
+
+
+    def results(self) -> dict:
+        return {job_id: job['result'] for job_id, job in self.jobs.items() if job['status'] == 'done'}
+
+
+# Functions -----------------------------------------------------------------------
+def _init_worker(threads_per_worker: int):
+    """ Runs once in every worker before any job """
+    from utilities.utils import init_gpus_for_tf, limit_tf_threads
+    limit_tf_threads(threads_per_worker)
+    init_gpus_for_tf(verbose=False)
+
+
+def _run_job(job_func, job_id: str, kwargs: dict):
+    t0 = time.perf_counter()
+    try:
+        return job_id, 'done', job_func(**kwargs), time.perf_counter() - t0, None
+    except Exception:
+        return job_id, 'failed', None, time.perf_counter() - t0, traceback.format_exc()
+
+
+def run_jobs(job_func, jobs: dict, manifest_path: str, n_workers: int = None, threads_per_worker: int = 1, verbose: bool = True):
+    """ Run `job_func(**kwargs)` for every {job_id: kwargs} in `jobs` concurrently, skipping the ones the manifest has as done
+
+    Every finished job is recorded straight away, so a crash only loses the jobs that were running.
+    Returns the manifest """
+    manifest = JobManifest(manifest_path)
+    pending = {job_id: kwargs for job_id, kwargs in jobs.items() if not manifest.is_done(job_id)}
+    if verbose:
+        print(f'{len(jobs) - len(pending)}/{len(jobs)} jobs already done, running {len(pending)}')
+    if len(pending) == 0:
+        return manifest
+
+    if n_workers is None:
+        n_workers = max(1, (os.cpu_count() or 1) // threads_per_worker)
+    with ProcessPoolExecutor(
+        max_workers=min(n_workers, len(pending)),
+        mp_context=mp.get_context('spawn'),
+        initializer=_init_worker,
+        initargs=(threads_per_worker,)
+    ) as executor:
+        futures = [executor.submit(_run_job, job_func, job_id, kwargs) for job_id, kwargs in pending.items()]
+        for n_done, future in enumerate(as_completed(futures), start=1):
+            job_id, status, result, elapsed_s, error = future.result()
+            manifest.record(job_id, status, result=result, elapsed_s=elapsed_s, error=error)
+            if verbose:
+                print(f'--> [{n_done}/{len(pending)}] {job_id} {status} in {elapsed_s:.1f} s')
+                if error is not None:
+                    print(error)
+
+    return manifest
@@ -0,0 +1,304 @@
+import sys, os, json
+import operator
+sys.path.append(os.path.realpath('../'))
+# print(sys.path)
+
+import numpy as np
+
+from utilities.makespan_equations import monitored_makespan, monitored_makespan_alternative, reactive_makespan
+from utilities.results_store import ResultsStore, RESULTS_DB, MAKESPAN_EQUATION
+
+# NOTE: NumPy only, the whole engine works by broadcasting so grids of millions of points are evaluated at once
+
+MAKESPAN_VARIABLES = ('MTS', 'MTF', 'MTN', 'P_TP', 'P_FN', 'P_TN', 'P_FP', 'P_NCS', 'P_NCF')
+SUCCESS_PROBABILITIES = ('P_TP', 'P_FN', 'P_NCS') # ---- Outcomes of actually successful episodes, scale with p_success
+FAILURE_PROBABILITIES = ('P_TN', 'P_FP', 'P_NCF') # ---- Outcomes of actually failed episodes, scale with p_failure
+
+
+# Classes --------------------------------------------------------------------------
+class LabelledArray:
+    """ Minimal xarray-like container: N-d `values` with named `dims` and one coordinate array per dim """
+    def __init__(self, values, dims, coords: dict, name: str = '') -> None:
+        self.values = np.asarray(values)
+        self.dims = tuple(dims)
+        self.coords = {dim: np.asarray(coords[dim]) for dim in self.dims}
+        self.name = name
+        if self.values.ndim != len(self.dims):
+            raise ValueError(f'Got {self.values.ndim} dimensional values for dims {self.dims}')
+        for axis, dim in enumerate(self.dims):
+            if self.values.shape[axis] != len(self.coords[dim]):
+                raise ValueError(f'Dim {dim} has {self.values.shape[axis]} values but {len(self.coords[dim])} coordinates')
+
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+
+    def __repr__(self) -> str:
+        dims = ', '.join(f'{dim}: {len(self.coords[dim])}' for dim in self.dims)
+        return f'<LabelledArray {self.name} ({dims})>'
+
+
+    def _coord_index(self, dim: str, value):
+        coord = self.coords[dim]
+        if np.issubdtype(coord.dtype, np.number):
+            matches = np.flatnonzero(np.isclose(coord, value))
+        else:
+            matches = np.flatnonzero(coord == value)
+        if len(matches) == 0:
+            raise KeyError(f'{value} not found in coordinates of {dim}')
+        return int(matches[0])
+
+
+    def isel(self, **indexers):
+        """ Select by position along the given dims, integer indexers drop the dim """
+        index = []
+        dims = []
+        coords = {}
+        for dim in self.dims:
+            if dim in indexers:
+                i = indexers[dim]
+                index.append(i)
+                if not np.isscalar(i):
+                    dims.append(dim)
+                    coords[dim] = self.coords[dim][i]
+            else:
+                index.append(slice(None))
+                dims.append(dim)
+                coords[dim] = self.coords[dim]
+        values = self.values[tuple(index)]
+        if len(dims) == 0:
+            return values.item()
+
+        return LabelledArray(values, dims, coords, name=self.name)
+
+
+    def sel(self, **indexers):
+        """ Select by coordinate value along the given dims """
+        return self.isel(**{dim: self._coord_index(dim, value) for dim, value in indexers.items()})
+
+
+    def transpose(self, *dims):
+        return LabelledArray(
+            np.transpose(self.values, [self.dims.index(dim) for dim in dims]),
+            dims,
+            self.coords,
+            name=self.name
+        )
+
+
+    def reduce(self, func, dim: str):
+        """ Apply a NumPy reduction (e.g. `np.nanmin`) along `dim` """
+        axis = self.dims.index(dim)
+        dims = [d for d in self.dims if d != dim]
+        values = func(self.values, axis=axis)
+        if len(dims) == 0:
+            return np.asarray(values).item()
+
+        return LabelledArray(values, dims, {d: self.coords[d] for d in dims}, name=self.name)
+
+
+    def coord_of(self, func, dim: str):
+        """ Coordinate of `dim` picked by an arg-reduction (e.g. `np.nanargmin`), useful to find optima """
+        axis = self.dims.index(dim)
+        # All-NaN slices (e.g. a model without results at some confidence) give NaN instead of raising
+        all_nan = np.all(np.isnan(self.values), axis=axis)
+        filled = np.where(np.expand_dims(all_nan, axis), 0.0, self.values)
+        picked = self.coords[dim][func(filled, axis=axis)]
+        if np.issubdtype(picked.dtype, np.number):
+            picked = np.where(all_nan, np.nan, picked)
+        dims = [d for d in self.dims if d != dim]
+        if len(dims) == 0:
+            return picked.item()
+
+        return LabelledArray(picked, dims, {d: self.coords[d] for d in dims}, name=f'{self.name}_{dim}')
+
+
+    def _broadcast_with(self, other):
+        """ Align both operands over the union of their dims (matching dims must share coordinates) """
+        dims = list(self.dims) + [dim for dim in other.dims if dim not in self.dims]
+        coords = {**other.coords, **self.coords}
+        for dim in set(self.dims) & set(other.dims):
+            if not np.array_equal(self.coords[dim], other.coords[dim]):
+                raise ValueError(f'Cannot align dim {dim} with different coordinates')
+
+        def expand(arr: 'LabelledArray'):
+            order = [arr.dims.index(dim) for dim in dims if dim in arr.dims]
+            values = np.transpose(arr.values, order)
+            shape = [len(coords[dim]) if dim in arr.dims else 1 for dim in dims]
+            return values.reshape(shape)
+
+        return expand(self), expand(other), dims, coords
+
+
+    def _binary_op(self, other, op, reflected=False):
+        if isinstance(other, LabelledArray):
+            lhs, rhs, dims, coords = self._broadcast_with(other)
+        else:
+            lhs, rhs, dims, coords = self.values, other, self.dims, self.coords
+        if reflected:
+            lhs, rhs = rhs, lhs
+
+        return LabelledArray(op(lhs, rhs), dims, coords, name=self.name)
+
+
+    def __add__(self, other):
+        return self._binary_op(other, operator.add)
+
+    def __radd__(self, other):
+        return self._binary_op(other, operator.add, reflected=True)
+
+    def __sub__(self, other):
+        return self._binary_op(other, operator.sub)
+
+    def __rsub__(self, other):
+        return self._binary_op(other, operator.sub, reflected=True)
+
+    def __mul__(self, other):
+        return self._binary_op(other, operator.mul)
+
+    def __rmul__(self, other):
+        return self._binary_op(other, operator.mul, reflected=True)
+
+    def __truediv__(self, other):
+        return self._binary_op(other, operator.truediv)
+
+    def __rtruediv__(self, other):
+        return self._binary_op(other, operator.truediv, reflected=True)
+
+
+    def to_dict(self) -> dict:
+        """ JSON serializable representation """
+        return {
+            'name': self.name,
+            'dims': list(self.dims),
+            'coords': {dim: coord.tolist() for dim, coord in self.coords.items()},
+            'values': self.values.tolist()
+        }
+
+
+    @classmethod
+    def from_dict(cls, d: dict):
+        return cls(np.asarray(d['values'], dtype=float), d['dims'], d['coords'], name=d['name'])
+
+
+# Functions -----------------------------------------------------------------------
+def expected_makespan(MTS, MTF, MTN, P_TP, P_FN, P_TN, P_FP, P_NCS, P_NCF, equation: str = 'monitored'):
+    """ Broadcasting version of the closed form makespan, `equation` in ('monitored', 'alternative', 'auto')
+    'auto' uses the alternative equation wherever MTN >= MTF, as `run_simulation` does """
+    args = [np.asarray(v, dtype=float) for v in (MTS, MTF, MTN, P_TP, P_FN, P_TN, P_FP, P_NCS, P_NCF)]
+    if equation == 'monitored':
+        return monitored_makespan(*args)
+    elif equation == 'alternative':
+        return monitored_makespan_alternative(*args)
+    elif equation == 'auto':
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(
+                args[2] >= args[1],
+                np.abs(monitored_makespan_alternative(*args)),
+                np.abs(monitored_makespan(*args))
+            )
+
+    raise ValueError(f'Unknown makespan equation {equation}')
+
+
+def rescale_probabilities(variables: dict, p_failure, p_failure_ref: float):
+    """ Re-weight the outcome probabilities measured at failure rate `p_failure_ref` to `p_failure` (array-like) """
+    p_failure = np.asarray(p_failure, dtype=float)
+    success_scale = (1.0 - p_failure) / (1.0 - p_failure_ref)
+    failure_scale = p_failure / p_failure_ref
+    rescaled = dict(variables)
+    for key in SUCCESS_PROBABILITIES:
+        rescaled[key] = np.asarray(variables[key], dtype=float) * success_scale
+    for key in FAILURE_PROBABILITIES:
+        rescaled[key] = np.asarray(variables[key], dtype=float) * failure_scale
+
+    return rescaled
+
+
+def stack_model_variables(model_variables: dict, confidence_list: list):
+    """ {model: {confidence: variables}} -> {variable: array of shape (n_models, n_confidences)}, NaN when missing """
+    models = list(model_variables.keys())
+    stacked = {key: np.full((len(models), len(confidence_list)), np.nan) for key in MAKESPAN_VARIABLES}
+    for i, model_name in enumerate(models):
+        for j, confidence in enumerate(confidence_list):
+            variables = model_variables[model_name].get(confidence)
+            if variables is None:
+                continue
+            for key in MAKESPAN_VARIABLES:
+                value = variables.get(key, np.nan)
+                stacked[key][i, j] = float(value) if value not in ('N/A', 'Inf') else np.nan
+
+    return stacked
+
+
+def makespan_sweep(model_variables: dict, confidence_list: list, sweep: dict = None, overrides: dict = None, p_failure_ref: float = None, equation: str = 'monitored'):
+    """ Evaluate the expected makespan over the grid (model, confidence, *sweep dims)
+
+    `model_variables` is {model: {confidence: variables}} as saved in the makespan/simulation JSONs.
+    `sweep` maps extra dim names to coordinate arrays, a dim is either 'p_failure' (outcome probabilities
+    are re-weighted from `p_failure_ref`) or one of `MAKESPAN_VARIABLES` (which is replaced by the sweep values).
+    `overrides` replaces variables by fixed values for every model (e.g. the dataset's MTS and MTF). """
+    sweep = {} if sweep is None else sweep
+    overrides = {} if overrides is None else overrides
+    models = list(model_variables.keys())
+    sweep_dims = list(sweep.keys())
+    dims = ['model', 'confidence'] + sweep_dims
+    n_extra = len(sweep_dims)
+
+    stacked = stack_model_variables(model_variables=model_variables, confidence_list=confidence_list)
+    variables = {key: value.reshape(value.shape + (1,) * n_extra) for key, value in stacked.items()}
+    for key, value in overrides.items():
+        variables[key] = np.asarray(value, dtype=float)
+
+    for axis, dim in enumerate(sweep_dims):
+        shape = [1] * len(dims)
+        shape[2 + axis] = len(sweep[dim])
+        values = np.asarray(sweep[dim], dtype=float).reshape(shape)
+        if dim == 'p_failure':
+            if p_failure_ref is None:
+                raise ValueError('Sweeping over p_failure needs the reference failure rate `p_failure_ref`')
+            variables = rescale_probabilities(variables=variables, p_failure=values, p_failure_ref=p_failure_ref)
+        elif dim in MAKESPAN_VARIABLES:
+            variables[dim] = values
+        else:
+            raise ValueError(f'Cannot sweep over {dim}')
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values = expected_makespan(**{key: variables[key] for key in MAKESPAN_VARIABLES}, equation=equation)
+    shape = [len(models), len(confidence_list)] + [len(sweep[dim]) for dim in sweep_dims]
+
+    return LabelledArray(
+        np.broadcast_to(values, shape),
+        dims,
+        {'model': models, 'confidence': confidence_list, **sweep},
+        name='expected_makespan'
+    )
+
+
+def reactive_sweep(MTS, MTF, p_failure):
+    """ Reactive (no monitoring) makespan over an array of failure probabilities """
+    p_failure = np.asarray(p_failure, dtype=float)
+    return LabelledArray(
+        reactive_makespan(MTS=MTS, MTF=MTF, ps=1.0 - p_failure, pf=p_failure),
+        ['p_failure'],
+        {'p_failure': p_failure},
+        name='reactive_makespan'
+    )
+
+
+def load_model_variables(models: list, confidence_list: list, results_db: str = RESULTS_DB, verbose: bool = False):
+    """ Read the 'variables' of the latest equation makespan result of every model/confidence into {model: {confidence: variables}} """
+    store = ResultsStore(results_db)
+    model_variables = {model_name: {} for model_name in models}
+    for confidence in confidence_list:
+        for model_name in models:
+            result = store.latest(MAKESPAN_EQUATION, model_name, confidence=confidence)
+            if result is None:
+                if verbose:
+                    print(f'--> No results for {model_name} at confidence {confidence}')
+                continue
+            model_variables[model_name][confidence] = result['variables']
+
+    return model_variables
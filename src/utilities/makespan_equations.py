@@ -0,0 +1,92 @@
+import sys, os
+sys.path.append(os.path.realpath('../'))
+# print(sys.path)
+
+import numpy as np
+
+from data_management.episode_index import as_episode_index
+
+# NOTE: This module must stay free of TensorFlow (and plotting) imports so that the pure NumPy analysis
+#       paths (makespan equations, reactive simulation, statistics) start up quickly
+
+
+# Classes --------------------------------------------------------------------------
+class EpisodePerf:
+    """ Container class for per-episode performance """
+    def __init__( self, trueLabel = -1, answer = 'NC', runTime = float('nan'),
+                  TTP = float('nan'), TTN = float('nan'), TTS = float('nan'), TTF = float('nan') ):
+        self.trueLabel = trueLabel
+        self.answer    = answer
+        self.runTime   = runTime
+        self.TTP       = TTP
+        self.TTN       = TTN
+        self.TTS       = TTS
+        self.TTF       = TTF
+
+
+# Functions -----------------------------------------------------------------------
+def scan_output_for_decision( output, trueLabel, threshold = 0.90 ):
+    for i, row in enumerate( output ):
+        if np.amax( row ) >= threshold:
+            if np.dot( row, trueLabel[i] ) >= threshold:
+                ans = 'T'
+            else:
+                ans = 'F'
+            if row[0] > row[1]:
+                ans += 'P'
+            else:
+                ans += 'N'
+            return ans, i, row
+    return 'NC', output.shape[0], row
+
+
+def monitored_makespan( MTS, MTF, MTN, P_TP, P_FN, P_TN, P_FP, P_NCS, P_NCF ):
+    """ Closed form makespan for monitored case, symbolic simplification from Mathematica """
+    return (1 + MTF*(P_FP + P_NCF) + MTS*(P_NCS + P_TP) + MTN*(P_FN + P_TN) ) / (1 - P_FN - P_FP - P_TN - P_NCF)
+
+def monitored_makespan_alternative( MTS, MTF, MTN, P_TP, P_FN, P_TN, P_FP, P_NCS, P_NCF ):
+    """ Closed form makespan for monitored case, symbolic simplification from Mathematica """
+    return (1 + MTF*(P_FP + P_NCF) + MTS*(P_NCS + P_TP) + MTF*(P_FN + P_TN) ) / (1 - P_FN - P_FP - P_TN)
+
+def reactive_makespan(MTS, MTF, ps, pf):
+    return -(MTF * pf + MTS * ps + 1) / (pf - 1)
+
+
+def get_mts_mtf(data):
+    """ Mean time to success and to failure [s], and the success and failure rates
+
+    `data` is a list of episodes or their `EpisodeIndex` """
+    index = as_episode_index(data)
+    run_times = index.run_times()
+    success = index.success
+
+    MTS = run_times[success].mean() # Mean Time to Success
+    MTF = run_times[~success].mean() # Mean Time to Failure
+
+    return MTS, MTF, success.mean(), 1.0 - success.mean()
+
+
+def run_reactive_simulation(episodes: list, n_simulations: int = 100, verbose: bool = False, seed: int = None):
+    """ Reactive makespan simulation: episodes are drawn uniformly and run to the end until one succeeds
+
+    The number of failed draws before the success is geometric with the success rate, so all simulations are sampled
+    at once from the empirical durations instead of one draw at a time. `episodes` is a list of episodes or their
+    `EpisodeIndex`. Returns the mean makespan and the makespan of every simulation """
+    index = as_episode_index(episodes)
+    rng = np.random.default_rng(seed)
+    run_times = index.run_times()
+    success_times = run_times[index.success]
+    failure_times = run_times[~index.success]
+    if len(success_times) == 0:
+        raise ValueError('No episode ever succeeds, the reactive makespan is infinite')
+
+    n_failures = rng.geometric(len(success_times) / len(run_times), size=n_simulations) - 1
+    mks = rng.choice(success_times, size=n_simulations)
+    if n_failures.sum() > 0:
+        failed = rng.choice(failure_times, size=n_failures.sum())
+        mks += np.bincount(np.repeat(np.arange(n_simulations), n_failures), weights=failed, minlength=n_simulations)
+
+    if verbose:
+        print(f'Ran {n_simulations} reactive simulations, mean makespan = {mks.mean():.3f} [s]')
+
+    return mks.mean(), mks.tolist()
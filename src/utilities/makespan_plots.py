@@ -0,0 +1,420 @@
+import sys, os
+sys.path.append(os.path.realpath('../'))
+# print(sys.path)
+
+import numpy as np
+import seaborn as sns
+import matplotlib.pyplot as plt
+
+from utilities.utils import set_size
+from utilities.results_store import ResultsStore, MAKESPAN_EQUATION, MAKESPAN_SIMULATION
+
+# NOTE: Plots built from the results saved in the ResultsStore only, kept free of TensorFlow imports
+
+
+# Plotting ----------------------------------------------------------------------------
+def plot_mts_ems(res: dict, models_to_use: list, save_plots: bool = True):
+    # Setup
+    # plt.style.use('seaborn')
+    # From Latex \textwidth
+    fig_width = 800
+    tex_fonts = {
+        # Use LaTeX to write all text
+        # "text.usetex": True,
+        "font.family": "serif",
+        # Use 10pt font in plots, to match 10pt font in document
+        "axes.labelsize": 14,
+        "font.size": 14,
+        # Make the legend/label fonts a little smaller
+        "legend.fontsize": 12,
+        "xtick.labelsize": 12,
+        "ytick.labelsize": 12
+    }
+    plt.rcParams.update(tex_fonts)
+
+    mts_time_reduction = 1 - (res['VanillaTransformer']['metrics']['MTS'][0] / res['FCN']['metrics']['MTS'][0])
+    mts_textstr = ''.join(f'Mean Time to Success is decreased by {mts_time_reduction*100:.2f}%\nwith Transformer')
+
+    ems_time_reduction = 1 - (res['VanillaTransformer']['metrics']['EMS'][0] / res['FCN']['metrics']['EMS'][0])
+    ems_textstr = ''.join(f'Makespan is decreased by {ems_time_reduction*100:.2f}%\nwith Transformer')
+
+    props = dict(boxstyle='round', facecolor='wheat', alpha=0.5)
+
+
+    fig, axes = plt.subplots(1, 1, figsize=set_size(fig_width))
+    # fig.tight_layout()
+    for model_name in res.keys():
+        if model_name in models_to_use:
+            axes.bar([model_name], res[model_name]['metrics']['MTS'], label=model_name)
+
+    axes.set_xlabel('Model')
+    axes.set_ylabel('Mean time to Success [s]')
+    axes.text(0.55, 0.75, mts_textstr, transform=axes.transAxes, alpha=0.5, bbox=props, fontsize=20)
+
+    if save_plots:
+        plt.savefig('../saved_data/imgs/makespan_prediction/mts_barplots.png')
+        plt.clf()
+    else:
+        plt.plot()
+
+    fig, axes = plt.subplots(1, 1, figsize=set_size(fig_width))
+    # fig.tight_layout()
+    for model_name in res.keys():
+        if model_name in models_to_use:
+            axes.bar([model_name], res[model_name]['metrics']['EMS'], alpha=0.5, label=model_name)
+
+    # axes[1].legend()
+    axes.set_xlabel('Model')
+    axes.set_ylabel('Expected Makespan [s]')
+    axes.text(0.55, 0.75, ems_textstr, transform=axes.transAxes, bbox=props, fontsize=20)
+
+
+    if save_plots:
+        plt.savefig('../saved_data/imgs/makespan_prediction/ems_barplots.png')
+        plt.clf()
+    else:
+        plt.plot()
+
+
+def plot_model_confusion_matrix(model_name: str, conf_mat: dict, save_plot: bool = True):
+    # Setup
+    # plt.style.use('seaborn')
+    # From Latex \textwidth
+    fig_width = 600
+    tex_fonts = {
+        # Use LaTeX to write all text
+        # "text.usetex": True,
+        "font.family": "serif",
+        # Use 10pt font in plots, to match 10pt font in document
+        "axes.labelsize": 14,
+        "font.size": 14,
+        # Make the legend/label fonts a little smaller
+        "legend.fontsize": 12,
+        "xtick.labelsize": 12,
+        "ytick.labelsize": 12
+    }
+    plt.rcParams.update(tex_fonts)
+
+    arr = [
+        [conf_mat['TP'], conf_mat['FP']],
+        [conf_mat['FN'], conf_mat['TN']]
+    ]
+
+    sns.set(font_scale=2)
+    if save_plot:
+        if model_name == 'VanillaTransformer':
+            nc_textstr = ''.join(f'Transformer has a {conf_mat["NC"]*100:.2f}% NC rate')
+        else:
+            nc_textstr = ''.join(f'{model_name} has a {conf_mat["NC"]*100:.2f}% NC rate')
+        props = dict(boxstyle='round', facecolor='green', alpha=0.75)
+        conf_mat_plot = sns.heatmap(arr, annot=True).get_figure()
+        conf_mat_plot.text(0.43, 0.95, nc_textstr, bbox=props, fontsize=20, horizontalalignment='center', verticalalignment='top')
+        conf_mat_plot.savefig(f'../saved_data/imgs/makespan_prediction/{model_name}_confusion_matrix.png')
+        plt.clf()
+    else:
+        sns.heatmap(arr, annot=True)
+
+    # NC percentage visualization through stacked plots
+    x = ['No classification', 'Actual Positives', 'Actual negatives']
+    fig, axes = plt.subplots(1, 1, figsize=set_size(fig_width))
+    fig.tight_layout()
+    if save_plot:
+        nc = [conf_mat['NC'], 0, 0]
+        tp = np.array([0, conf_mat['TP'], 0])
+        fn = np.array([0, conf_mat['FN'], 0])
+        fp = np.array([0, 0, conf_mat['FP']])
+        tn = np.array([0, 0, conf_mat['TN']])
+        axes.bar(x, nc, label='NC')
+        axes.bar(x, tp, bottom=nc, label='TP')
+        axes.bar(x, fp, bottom=nc+tp, label='FP')
+        axes.bar(x, fn, bottom=nc+tp+fp, label='FN')
+        axes.bar(x, tn, bottom=nc+tp+fp+fn, label='TN')
+        axes.legend()
+        plt.savefig(f'../saved_data/imgs/makespan_prediction/{model_name}_stacked_classification_barplots.png')
+        plt.clf()
+    else:
+        plt.show()
+
+
+def plot_runtimes(res: dict, models_to_use: list, save_plots: bool = True):
+    # Setup
+    # plt.style.use('seaborn')
+    # From Latex \textwidth
+    fig_width = 600
+    tex_fonts = {
+        # Use LaTeX to write all text
+        # "text.usetex": True,
+        "font.family": "serif",
+        # Use 10pt font in plots, to match 10pt font in document
+        "axes.labelsize": 14,
+        "font.size": 14,
+        # Make the legend/label fonts a little smaller
+        "legend.fontsize": 12,
+        "xtick.labelsize": 12,
+        "ytick.labelsize": 12
+    }
+    plt.rcParams.update(tex_fonts)
+
+    ems_hits = np.sum([1 if vt < fcn else 0 for vt, fcn in zip(res['VanillaTransformer']['times'], res['FCN']['times'])])
+    ems_performance = (ems_hits * 100) / len(res['VanillaTransformer']['times'])
+    ems_textstr = ''.join(f'Runtime is lower for {ems_performance:.2f}% of the episodes with Transformer')
+
+    props = dict(boxstyle='round', facecolor='wheat', alpha=0.5)
+
+    fig, axes = plt.subplots(1, 1, figsize=set_size(fig_width))
+    fig.tight_layout()
+    axes.title.set_text('Runtimes for each model')
+    runtimes = []
+    for model_name in res.keys():
+        if model_name in models_to_use:
+            runtimes.append(res[model_name]['times'])
+
+    axes.hist(runtimes, alpha=0.5, label=list(res.keys()), bins=10)
+    axes.legend()
+    axes.set_xlabel('Runtime [s]')
+    axes.set_ylabel('Count')
+    axes.text(0.2, 0.75, ems_textstr, transform=axes.transAxes, bbox=props, fontsize=20)
+
+    if save_plots:
+        plt.savefig('../saved_data/imgs/makespan_prediction/runtime_histogram.png')
+        plt.clf()
+    else:
+        plt.plot()
+
+
+def plot_simulation_makespans(models: dict, confidence:float, reactive_mks: list = [], plot_reactive: bool =False, save_plots: bool = True):
+    img_path = f'../saved_data/imgs/makespan_prediction/makespan_simulation_histogram_confidence_{int(confidence * 100)}.png'
+    store = ResultsStore()
+
+    makespans = {'reactive': reactive_mks}
+    for model_name in models.keys():
+        makespans[model_name] = store.latest(MAKESPAN_SIMULATION, model_name, confidence=confidence)['simulation_makespan_list']
+
+    # Setup
+    # From Latex \textwidth
+    fig_width = 600
+    tex_fonts = {
+        # Use LaTeX to write all text
+        # "text.usetex": True,
+        "font.family": "serif",
+        # Use 10pt font in plots, to match 10pt font in document
+        "axes.labelsize": 14,
+        "font.size": 14,
+        # Make the legend/label fonts a little smaller
+        "legend.fontsize": 12,
+        "xtick.labelsize": 12,
+        "ytick.labelsize": 12
+    }
+    plt.rcParams.update(tex_fonts)
+
+    # textstr_dict = dict.fromkeys(models, None)
+    # means_textstr_dict = dict.fromkeys(models, None)
+    means_textstr_dict = {model_name: None for model_name in models.keys()}
+    if plot_reactive and reactive_mks != []:
+        means_textstr_dict = {**{'Reactive': ''.join(f'Reactive: {np.mean(reactive_mks):.2f} \u00B1 {np.std(reactive_mks):.2f}')}, **means_textstr_dict}
+    for model_name in models.keys():
+        if model_name == 'Transformer':
+            name = 'Small Transformer'
+        else:
+            name = model_name
+        means_textstr_dict[model_name] = ''.join(f'{name}: {np.mean(makespans[model_name]):.2f} \u00B1 {np.std(makespans[model_name]):.2f}')
+
+    props = dict(boxstyle='round', facecolor='wheat', alpha=0.5)
+
+    fig, axes = plt.subplots(1, 1, figsize=set_size(fig_width))
+    # plt.tight_layout()
+    # axes.title.set_text(f'Simulated makespans for each model\n(N = {len(makespans[list(makespans.keys())[0]])}, confidence = {int(confidence * 100)}%)')
+    runtimes = []
+    if plot_reactive and reactive_mks != []:
+        runtimes.append(reactive_mks)
+    for model_name in models.keys():
+        runtimes.append(makespans[model_name])
+
+
+    labels = []
+    if plot_reactive and reactive_mks != []:
+        labels.append('Reactive') 
+    for model_name in list(models.keys()):
+        if model_name == 'Transformer':
+            labels.append('Small Transformer')
+        else:
+            labels.append(model_name)
+
+    axes.hist(runtimes, alpha=0.5, label=labels, bins=10)
+    axes.legend()
+    axes.set_xlabel('Episode Makespan [s]')
+    axes.set_ylabel('Count [Episodes]')
+
+
+    x = 0.15
+    y = 0.9
+    # for model_name, textstr in textstr_dict.items():
+    #     if textstr is not None:
+    #         axes.text(x, y, textstr, transform=axes.transAxes, bbox=props, fontsize=20)
+    #         y -= 0.11
+
+    for model_name, textstr in means_textstr_dict.items():
+        if textstr is not None:
+            axes.text(x, y, textstr, transform=axes.transAxes, bbox=props, fontsize=17)
+            y -= 0.11
+
+    if save_plots:
+        plt.savefig(img_path)
+        plt.clf()
+    else:
+        plt.plot()
+
+
+def plot_equation_simulation_makespan_barplots(models: dict, confidence: float, reactive_eq: float, reactive_sim: list, plot_reactive: bool = True, save: bool = True):
+    img_path = f'../saved_data/imgs/equation_simulation_makespans_barplot_confidence_{int(confidence * 100)}.png'
+    store = ResultsStore()
+
+    makespans = {model_name: {'eq': None, 'sim': []} for model_name in models.keys()}
+    for model_name in models.keys():
+        makespans[model_name]['eq'] = store.latest(MAKESPAN_EQUATION, model_name, confidence=confidence)['predicted_makespan']
+        makespans[model_name]['sim'] = store.latest(MAKESPAN_SIMULATION, model_name, confidence=confidence)['simulation_makespan_list']
+
+    fig_width = 800
+    tex_fonts = {
+        # Use LaTeX to write all text
+        # "text.usetex": True,
+        "font.family": "serif",
+        # Use 10pt font in plots, to match 10pt font in document
+        "axes.titlesize": 17,
+        "axes.labelsize": 14,
+        "font.size": 14,
+        # Make the legend/label fonts a little smaller
+        "legend.fontsize": 14,
+        "xtick.labelsize": 14,
+        "ytick.labelsize": 14
+    }
+    plt.rcParams.update(tex_fonts)
+
+    fig, axes = plt.subplots(1, 1, figsize=set_size(fig_width, subplots=(1, 1)))
+
+    width = 0.25
+    if plot_reactive:
+        r = np.arange(len(list(models.keys())) + 1)
+    else:
+        r = np.arange(len(list(models.keys())) )
+
+    eq_heights = []
+    if plot_reactive and reactive_eq:
+        eq_heights.append(reactive_eq)
+    for v in makespans.values():
+        eq_heights.append(v['eq'])
+
+    sim_heights = []
+    sim_errors = []
+    if plot_reactive and reactive_sim != []:
+        sim_heights.append(np.mean(reactive_sim))
+        sim_errors.append(np.std(reactive_sim))
+    for v in makespans.values():
+        sim_heights.append(np.mean(v['sim']))
+        sim_errors.append(np.std(v['sim']))
+
+    axes.bar(
+        x=r,
+        height=eq_heights,
+        width=width,
+        label='Equation makespans [s]',
+        alpha=0.5
+    )
+
+    axes.bar(
+        x=r + width,
+        height=sim_heights,
+        yerr=sim_errors,
+        width=width,
+        label='Simulation makespans [s]',
+        alpha=0.5,
+        capsize=10
+    )
+
+    labels = []
+    if plot_reactive and reactive_eq and reactive_sim != []:
+        labels.append('Reactive')
+    for model_name in makespans.keys():
+        if model_name == 'Transformer':
+            labels.append('Small Transformer')
+        else:
+            labels.append(model_name)
+    plt.xticks(r + width/2, labels)
+    plt.tight_layout()
+    plt.legend()
+    plt.savefig(img_path)
+    plt.clf()
+    plt.close('all')
+
+
+def plot_monte_carlo_simulation_barplots(models: dict, confidence: float, save: bool = True):
+    img_path = f'../saved_data/imgs/monte_carlo_simulation_barplot_confidence_{int(confidence * 100)}.png'
+    store = ResultsStore()
+
+    makespans = {model_name: {'sim_eq': None, 'sim': []} for model_name in models.keys()}
+    for model_name in models.keys():
+        data = store.latest(MAKESPAN_SIMULATION, model_name, confidence=confidence)
+        makespans[model_name]['sim'] = data['simulation_makespan_list']
+        makespans[model_name]['sim_eq'] = data['equation_predicted_makespan']
+
+    fig_width = 800
+    tex_fonts = {
+        # Use LaTeX to write all text
+        # "text.usetex": True,
+        "font.family": "serif",
+        # Use 10pt font in plots, to match 10pt font in document
+        "axes.titlesize": 17,
+        "axes.labelsize": 14,
+        "font.size": 14,
+        # Make the legend/label fonts a little smaller
+        "legend.fontsize": 14,
+        "xtick.labelsize": 14,
+        "ytick.labelsize": 14
+    }
+    plt.rcParams.update(tex_fonts)
+
+    fig, axes = plt.subplots(1, 1, figsize=set_size(fig_width, subplots=(1, 1)))
+
+    width = 0.25
+    r = np.arange(len(list(models.keys())) )
+
+    eq_heights = []
+    for v in makespans.values():
+        eq_heights.append(v['sim_eq'])
+
+    sim_heights = []
+    sim_errors = []
+    for v in makespans.values():
+        sim_heights.append(np.mean(v['sim']))
+        sim_errors.append(np.std(v['sim']))
+
+    axes.bar(
+        x=r,
+        height=eq_heights,
+        width=width,
+        label='Equation makespans [s]',
+        alpha=0.5
+    )
+
+    axes.bar(
+        x=r + width,
+        height=sim_heights,
+        yerr=sim_errors,
+        width=width,
+        label='Simulation makespans [s]',
+        alpha=0.5,
+        capsize=10
+    )
+
+    labels = []
+    for model_name in makespans.keys():
+        if model_name == 'Transformer':
+            labels.append('Small Transformer')
+        else:
+            labels.append(model_name)
+    plt.xticks(r + width/2, labels)
+    plt.tight_layout()
+    plt.legend()
+    plt.savefig(img_path)
+    plt.clf()
+    plt.close('all')
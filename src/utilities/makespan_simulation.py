@@ -0,0 +1,245 @@
+import sys, os
+sys.path.append(os.path.realpath('../'))
+# print(sys.path)
+
+from statistics import NormalDist
+
+import numpy as np
+
+from utilities.makespan_engine import LabelledArray, expected_makespan
+
+# NOTE: NumPy only. Classifying an episode is deterministic, so each episode is classified once into an
+#       `EpisodeOutcomes` table and every simulation/resampling afterwards only draws from that table
+
+OUTCOMES = ('TP', 'FN', 'TN', 'FP', 'NCS', 'NCF')
+SUCCESS_OUTCOMES = ('TP', 'FN', 'NCS') # ---- Actually successful episodes
+FAILURE_OUTCOMES = ('TN', 'FP', 'NCF') # ---- Actually failed episodes
+POSITIVE_OUTCOMES = ('TP', 'FP') # --------- Classified as success before the episode ended
+NEGATIVE_OUTCOMES = ('TN', 'FN') # --------- Classified as failure, the episode is aborted at decision time
+WIN_OUTCOMES = ('TP', 'NCS') # ------------- The task is finished after this episode
+
+
+# Classes --------------------------------------------------------------------------
+class EpisodeOutcomes:
+    """ Per-episode classification table: outcome code, decision time and full run time (both in seconds) """
+    def __init__(self, outcome, decision_time, run_time) -> None:
+        self.outcome = np.asarray(outcome, dtype=np.int8) # ---------------- Index into `OUTCOMES`
+        self.decision_time = np.asarray(decision_time, dtype=float) # ------- NaN when not classified
+        self.run_time = np.asarray(run_time, dtype=float)
+
+
+    def __len__(self) -> int:
+        return len(self.outcome)
+
+
+    @classmethod
+    def from_answers(cls, answers: list, decision_times: list, run_times: list):
+        """ Build the table from the answers of `scan_output_for_decision` ('NCS'/'NCF' for no classification) """
+        return cls([OUTCOMES.index(ans) for ans in answers], decision_times, run_times)
+
+
+    def mask(self, outcomes: tuple) -> np.ndarray:
+        return np.isin(self.outcome, [OUTCOMES.index(o) for o in outcomes])
+
+
+    def one_hot(self) -> np.ndarray:
+        """ (n_episodes, n_outcomes) indicator matrix """
+        return np.eye(len(OUTCOMES))[self.outcome]
+
+
+    def makespan_cost(self) -> np.ndarray:
+        """ Time each episode adds to the makespan: negative classifications abort the episode at decision time """
+        return np.where(self.mask(NEGATIVE_OUTCOMES), self.decision_time, self.run_time)
+
+
+    def wins(self) -> np.ndarray:
+        return self.mask(WIN_OUTCOMES)
+
+
+    def reactive(self):
+        """ The same episodes without monitoring: every episode runs to the end and only real successes finish the task """
+        failure = self.mask(FAILURE_OUTCOMES)
+        outcome = np.where(failure, OUTCOMES.index('NCF'), OUTCOMES.index('NCS'))
+
+        return EpisodeOutcomes(outcome, np.full(len(self), np.nan), self.run_time)
+
+
+    def to_dict(self) -> dict:
+        """ JSON serializable representation """
+        return {
+            'outcome': [OUTCOMES[o] for o in self.outcome],
+            'decision_time': [None if np.isnan(t) else float(t) for t in self.decision_time],
+            'run_time': self.run_time.tolist()
+        }
+
+
+    @classmethod
+    def from_dict(cls, d: dict):
+        return cls.from_answers(
+            answers=d['outcome'],
+            decision_times=[np.nan if t is None else t for t in d['decision_time']],
+            run_times=d['run_time']
+        )
+
+
+# Functions -----------------------------------------------------------------------
+def outcome_variables(table: EpisodeOutcomes, weights = None) -> dict:
+    """ Makespan variables (MTS, MTF, MTP, MTN, P_*) and the equation makespan EMS of a weighted episode table
+
+    `weights` are per-episode counts, either (n_episodes,) or (n_resamples, n_episodes) to evaluate many
+    resamples at once. Without weights every episode counts once """
+    if weights is None:
+        weights = np.ones(len(table))
+    weights = np.asarray(weights, dtype=float)
+
+    counts = weights @ table.one_hot()
+    total = weights.sum(axis=-1)
+    decision_time = np.nan_to_num(table.decision_time)
+
+    def weighted_mean(values, mask):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return (weights @ (values * mask)) / (weights @ mask.astype(float))
+
+    variables = {
+        'MTP': weighted_mean(decision_time, table.mask(POSITIVE_OUTCOMES)),
+        'MTN': weighted_mean(decision_time, table.mask(NEGATIVE_OUTCOMES)),
+        'MTS': weighted_mean(table.run_time, table.mask(SUCCESS_OUTCOMES)),
+        'MTF': weighted_mean(table.run_time, table.mask(FAILURE_OUTCOMES)),
+    }
+    for i, outcome in enumerate(OUTCOMES):
+        variables[f'P_{outcome}'] = counts[..., i] / total
+
+    variables['EMS'] = expected_makespan(
+        **{key: variables[key] for key in ('MTS', 'MTF', 'MTN', 'P_TP', 'P_FN', 'P_TN', 'P_FP', 'P_NCS', 'P_NCF')},
+        equation='auto'
+    )
+
+    return variables
+
+
+def simulate_makespans(table: EpisodeOutcomes, n_simulations: int, rng: np.random.Generator, probabilities = None):
+    """ Vectorized Monte Carlo makespan: episodes are drawn until one wins (TP or NCS)
+
+    The number of losing draws before the winning one is geometric, so every simulation is sampled at once.
+    `probabilities` optionally replaces the uniform episode sampling distribution (see `failure_rate_probabilities`).
+    Returns the makespans and how many times each episode was drawn """
+    n_episodes = len(table)
+    cost = table.makespan_cost()
+    wins = table.wins()
+    win_idx = np.flatnonzero(wins)
+    lose_idx = np.flatnonzero(~wins)
+    if len(win_idx) == 0:
+        raise ValueError('No episode in the table ever finishes the task')
+
+    if probabilities is None:
+        p_win = len(win_idx) / n_episodes
+        p_winners = None
+        p_losers = None
+    else:
+        probabilities = np.asarray(probabilities, dtype=float) / np.sum(probabilities)
+        p_win = probabilities[win_idx].sum()
+        if p_win == 0:
+            raise ValueError('The sampling probabilities never pick an episode that finishes the task')
+        p_winners = probabilities[win_idx] / p_win
+        p_losers = probabilities[lose_idx] / (1 - p_win) if p_win < 1 else None
+    n_losses = rng.geometric(p_win, size=n_simulations) - 1
+    winners = rng.choice(win_idx, size=n_simulations, p=p_winners)
+    if n_losses.sum() > 0:
+        losers = rng.choice(lose_idx, size=n_losses.sum(), p=p_losers)
+    else:
+        losers = np.zeros(0, dtype=int)
+
+    # Sum the losing draws of every simulation
+    sim_of_loser = np.repeat(np.arange(n_simulations), n_losses)
+    makespans = cost[winners] + np.bincount(sim_of_loser, weights=cost[losers], minlength=n_simulations)
+    draw_counts = np.bincount(winners, minlength=n_episodes) + np.bincount(losers, minlength=n_episodes)
+
+    return makespans, draw_counts
+
+
+def failure_rate_probabilities(table: EpisodeOutcomes, p_failure) -> np.ndarray:
+    """ Episode sampling probabilities under failure rate `p_failure` (scalar or array, adds a leading dim)
+
+    Actually failed episodes share `p_failure` and successful ones share `1 - p_failure`, so the classification of each
+    episode is reused as is (importance re-weighting of the test set) """
+    failure = table.mask(FAILURE_OUTCOMES)
+    n_failure = failure.sum()
+    n_success = len(table) - n_failure
+    if n_failure == 0 or n_success == 0:
+        raise ValueError('Re-weighting the failure rate needs both successful and failed episodes')
+    p_failure = np.asarray(p_failure, dtype=float)[..., None]
+
+    return np.where(failure, p_failure / n_failure, (1.0 - p_failure) / n_success)
+
+
+def what_if_failure_rates(table: EpisodeOutcomes, p_failures, n_simulations: int, rng: np.random.Generator) -> LabelledArray:
+    """ Simulated makespan distributions, dims (p_failure, simulation), for every failure rate in `p_failures` """
+    p_failures = np.asarray(p_failures, dtype=float)
+    probabilities = failure_rate_probabilities(table, p_failures)
+    values = np.stack([
+        simulate_makespans(table=table, n_simulations=n_simulations, rng=rng, probabilities=p)[0] for p in probabilities
+    ])
+
+    return LabelledArray(
+        values,
+        ['p_failure', 'simulation'],
+        {'p_failure': p_failures, 'simulation': np.arange(n_simulations)},
+        name='simulated_makespan'
+    )
+
+
+def what_if_expected_makespan(table: EpisodeOutcomes, p_failures) -> LabelledArray:
+    """ Equation makespan (EMS) of the re-weighted episode table for every failure rate in `p_failures` """
+    p_failures = np.asarray(p_failures, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variables = outcome_variables(table, weights=failure_rate_probabilities(table, p_failures) * len(table))
+
+    return LabelledArray(variables['EMS'], ['p_failure'], {'p_failure': p_failures}, name='expected_makespan')
+
+
+def run_until_precision(sample_batch, tolerance: float, alpha: float = 0.05, batch_size: int = 100, min_samples: int = 100, max_samples: int = 100000):
+    """ Draw batches from `sample_batch(n)` until the (1 - alpha) CI half-width of the running mean is below `tolerance`
+
+    Only running sums are tracked between batches. Returns all samples and the final half-width """
+    z = NormalDist().inv_cdf(1 - alpha / 2)
+    batches = []
+    n = 0
+    total = 0.0
+    total_sq = 0.0
+    half_width = np.inf
+    while n < max_samples:
+        batch = np.asarray(sample_batch(min(batch_size, max_samples - n)), dtype=float)
+        batches.append(batch)
+        n += len(batch)
+        total += batch.sum()
+        total_sq += (batch ** 2).sum()
+        if n > 1:
+            variance = max(total_sq - total ** 2 / n, 0.0) / (n - 1)
+            half_width = z * np.sqrt(variance / n)
+        if n >= min_samples and half_width <= tolerance:
+            break
+
+    return np.concatenate(batches), half_width
+
+
+def simulate_makespans_adaptive(table: EpisodeOutcomes, tolerance: float, rng: np.random.Generator, alpha: float = 0.05, batch_size: int = 100, min_simulations: int = 100, max_simulations: int = 100000):
+    """ `simulate_makespans` in batches until the CI half-width of the mean makespan (in seconds) is below `tolerance`
+
+    Returns the makespans, the episode draw counts and the final half-width """
+    draw_counts = np.zeros(len(table), dtype=int)
+
+    def sample_batch(n):
+        makespans, counts = simulate_makespans(table=table, n_simulations=n, rng=rng)
+        draw_counts[:] += counts
+        return makespans
+
+    makespans, half_width = run_until_precision(
+        sample_batch,
+        tolerance=tolerance,
+        alpha=alpha,
+        batch_size=batch_size,
+        min_samples=min_simulations,
+        max_samples=max_simulations
+    )
+
+    return makespans, draw_counts, half_width
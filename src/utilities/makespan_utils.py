@@ -1,81 +1,22 @@
 import sys, os, json
-import random
 sys.path.append(os.path.realpath('../'))
 # print(sys.path)
 
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2' # INFO and WARNING messages are not printed
 
 import numpy as np
-import seaborn as sns
 import tensorflow as tf
-import matplotlib.pyplot as plt
-
-from utilities.utils import CounterDict, set_size
-
-# Classes --------------------------------------------------------------------------
-class EpisodePerf:
-    """ Container class for per-episode performance """
-    def __init__( self, trueLabel = -1, answer = 'NC', runTime = float('nan'),
-                  TTP = float('nan'), TTN = float('nan'), TTS = float('nan'), TTF = float('nan') ):
-        self.trueLabel = trueLabel
-        self.answer    = answer
-        self.runTime   = runTime
-        self.TTP       = TTP
-        self.TTN       = TTN
-        self.TTS       = TTS
-        self.TTF       = TTF
-
-# Functions -----------------------------------------------------------------------
-def scan_output_for_decision( output, trueLabel, threshold = 0.90 ):
-    for i, row in enumerate( output ):
-        if np.amax( row ) >= threshold:
-            if np.dot( row, trueLabel[i] ) >= threshold:
-                ans = 'T'
-            else:
-                ans = 'F'
-            if row[0] > row[1]:
-                ans += 'P'
-            else:
-                ans += 'N'
-            return ans, i, row
-    return 'NC', output.shape[0], row
-
-
-def monitored_makespan( MTS, MTF, MTN, P_TP, P_FN, P_TN, P_FP, P_NCS, P_NCF ):
-    """ Closed form makespan for monitored case, symbolic simplification from Mathematica """
-    return (1 + MTF*(P_FP + P_NCF) + MTS*(P_NCS + P_TP) + MTN*(P_FN + P_TN) ) / (1 - P_FN - P_FP - P_TN - P_NCF)
-
-def monitored_makespan_alternative( MTS, MTF, MTN, P_TP, P_FN, P_TN, P_FP, P_NCS, P_NCF ):
-    """ Closed form makespan for monitored case, symbolic simplification from Mathematica """
-    return (1 + MTF*(P_FP + P_NCF) + MTS*(P_NCS + P_TP) + MTF*(P_FN + P_TN) ) / (1 - P_FN - P_FP - P_TN)
-
-def reactive_makespan(MTS, MTF, ps, pf):
-    return -(MTF * pf + MTS * ps + 1) / (pf - 1)
-
-
-def get_mts_mtf(data):
-    MTS = 0
-    MTF = 0
-    N_success = 0
-    N_failure = 0
-    ts_s      = 20.0/1000.0
-    rolling_window_width = int(7.0 * 50)
-    for ep_index, episode in enumerate(data):
-        episode_len_s = episode.shape[0] * ts_s
-        raw_label = episode[0:rolling_window_width, :][0, 7]
-        if raw_label == 0.0:
-            MTF += episode_len_s
-            N_failure += 1
-        elif raw_label == 1.0:
-            MTS += episode_len_s
-            N_success += 1
-
-    MTS /= N_success # Mean Time to Success
-    MTF /= N_failure # Mean Time to Failure
-
-    return MTS, MTF, N_success/len(data), N_failure/len(data)
 
+from utilities.utils import CounterDict
+from data_management.episode_index import EpisodeIndex, as_episode_index
+from utilities.results_store import ResultsStore, MAKESPAN_EQUATION, MAKESPAN_SIMULATION, MAKESPAN_TRADEOFF, weights_hash
+from utilities.makespan_equations import EpisodePerf, scan_output_for_decision, monitored_makespan, monitored_makespan_alternative, reactive_makespan, get_mts_mtf, run_reactive_simulation
+from utilities.makespan_simulation import OUTCOMES, EpisodeOutcomes, outcome_variables, simulate_makespans, simulate_makespans_adaptive
+from utilities.classification_metrics import WindowProbabilities, makespan_tradeoff
+from utilities.bootstrap import bootstrap_outcome_variables, bootstrap_mean
+from utilities.makespan_plots import plot_mts_ems, plot_model_confusion_matrix, plot_runtimes, plot_simulation_makespans
 
+# Functions -----------------------------------------------------------------------
 def make_predictions(model_name: str, model: tf.keras.Model, trunc_data, verbose: bool = False):
     episode_predictions = []
     rolling_window_width = int(7.0 * 50)
@@ -130,34 +71,6 @@ def classify(model: tf.keras.Model, episode: np.ndarray, true_label: float, wind
     return ans, (window_width * ts_s) + (t_c * ts_s)
 
 
-def run_reactive_simulation(episodes: list, n_simulations: int = 100, verbose: bool = False):
-    total_time = 0
-    mks = []
-    for i in range(n_simulations):
-        if verbose:
-            # print(f'Simulation {i+1}/{n_simulations}:')
-            sys.stdout.write("\rSimulation %d/%d" % (i+1, n_simulations))
-            sys.stdout.flush()
-        win = False
-        makespan = 0
-        while not win:
-            ep = random.choice(episodes)
-            episode_time = ep.shape[0] * (20.0 / 1000.0)
-            true_label = 0.0
-            if ep[0, 7] == 0.0:
-                true_label = 1.0
-            # If true_label == failure
-            if true_label == 1.0:
-                makespan += episode_time
-            # If true_label == success
-            elif true_label == 0.0:
-                makespan += episode_time
-                win = True
-        total_time += makespan
-        mks.append(makespan)
-    return total_time / n_simulations, mks
-
-
 def get_makespan_for_model(model_name: str, model: tf.keras.Model, episodes: list, confidence: float = 0.9, verbose: bool = False):
     perf = CounterDict()
     rolling_window_width = int(7.0 * 50)
@@ -166,58 +79,44 @@ def get_makespan_for_model(model_name: str, model: tf.keras.Model, episodes: lis
     MTP = 0.0
     MTN = 0.0
 
-    MTS, MTF, p_success, p_failure = get_mts_mtf(data=episodes)
+    index = EpisodeIndex.from_episodes(episodes, window_width=rolling_window_width)
+    MTS, MTF, p_success, p_failure = get_mts_mtf(data=index)
 
     N_positive_classif = 0.0
     N_negative_classif = 0.0
 
-    # Params for selecting first F_z hit
-    winWidth    = 10
-    FzCol       =  3
-    spikeThresh = 0.05
-
     episode_count = 0
 
-    for ep in episodes:
-        episode_time = ep.shape[0] * ts_s
-        N = ep.shape[0]
-        chopDex = 0
-        for bgn in range( int(1.5*50), N-winWidth+1 ):
-            end     = bgn+winWidth
-            FzSlice = ep[ bgn:end, FzCol ].flatten()
-            if np.abs( np.amax( FzSlice ) - np.amin( FzSlice ) ) >= spikeThresh:
-                chopDex = end
-                break
-        if (chopDex * ts_s) < 15.0:
-            ep_matrix = ep[chopDex:, :]
-            if len(ep_matrix) - rolling_window_width + 1 > rolling_window_width:
-                episode_count += 1
-                true_label = 0.0
-                if ep_matrix[0, 7] == 0.0:
-                    true_label = 1.0
-                ans, t_c = classify(
-                    model=model,
-                    episode=ep_matrix,
-                    true_label=true_label,
-                    window_width=rolling_window_width,
-                    confidence=confidence,
-                    ts_s=ts_s
-                )
-
-                if ans == 'NC':
-                    perf.count(ans)
-                    if true_label == 1.0:
-                        perf.count('NCF')
-                    elif true_label == 0.0:
-                        perf.count('NCS')
-                else:
-                    perf.count(ans)
-                    if ans in ('TN', 'FN'):
-                        MTN += t_c + (chopDex * ts_s)
-                        N_negative_classif += 1
-                    elif ans in ('TP', 'FP'):
-                        MTP += t_c + (chopDex * ts_s)
-                        N_positive_classif += 1
+    # Episodes start at the end of their first F_z hit
+    chopDexs = index.decision_start
+    for ep_i in np.flatnonzero(index.classifiable(ts_s=ts_s)):
+        chopDex = chopDexs[ep_i]
+        ep_matrix = episodes[ep_i][chopDex:, :]
+        episode_count += 1
+        true_label = float(index.label[ep_i])
+        ans, t_c = classify(
+            model=model,
+            episode=ep_matrix,
+            true_label=true_label,
+            window_width=rolling_window_width,
+            confidence=confidence,
+            ts_s=ts_s
+        )
+
+        if ans == 'NC':
+            perf.count(ans)
+            if true_label == 1.0:
+                perf.count('NCF')
+            elif true_label == 0.0:
+                perf.count('NCS')
+        else:
+            perf.count(ans)
+            if ans in ('TN', 'FN'):
+                MTN += t_c + (chopDex * ts_s)
+                N_negative_classif += 1
+            elif ans in ('TP', 'FP'):
+                MTP += t_c + (chopDex * ts_s)
+                N_positive_classif += 1
 
     print(f'Episodes computed = {episode_count}/{len(episodes)} ({(episode_count / len(episodes))*100:.2f})')
 
@@ -265,110 +164,169 @@ def get_makespan_for_model(model_name: str, model: tf.keras.Model, episodes: lis
             'predicted_makespan': predicted_makespan
         }
 
-        path = f'../saved_data/test_data_makespan_confidence_{int(confidence*100)}'
-        if not os.path.exists(path):
-            os.makedirs(path)
-
-        with open(f'{path}/{model_name}.json', 'w') as f:
-            json.dump(result, f)
-    elif os.path.exists(f'../saved_data/test_data_makespan_confidence_{int(confidence*100)}/{model_name}.json'):
-        os.remove(f'../saved_data/test_data_makespan_confidence_{int(confidence*100)}/{model_name}.json')
-
+        ResultsStore().append(MAKESPAN_EQUATION, model_name, result, confidence=confidence, weights_hash=weights_hash(model))
+    else:
+        # Without a result the previous one of this model is no longer the latest
+        ResultsStore().append(MAKESPAN_EQUATION, model_name, None, confidence=confidence, weights_hash=weights_hash(model))
+
+
+class EpisodeWindowCache:
+    """ Classification windows of every usable episode, prepared once as strided views (no copies)
+
+    Uses the same episode start (first F_z hit), filtering and windows as `classify`, so it can be re-evaluated
+    cheaply with any model, e.g. every few epochs during training """
+    def __init__(self, episodes: list, window_width: int = int(7.0 * 50), ts_s: float = 20.0 / 1000.0, index: EpisodeIndex = None) -> None:
+        self.window_width = window_width
+        self.ts_s = ts_s
+        self.windows = [] # ------------ (n_windows, window_width, 6) view per episode
+        self.label_index = [] # -------- Index of the true class in the model output (0 = success)
+        self.start_times = [] # -------- Episode start (first F_z hit) [s]
+        self.run_times = [] # ---------- Full episode duration [s]
+
+        # `index` can be passed when the episodes were already indexed
+        if index is None:
+            index = EpisodeIndex.from_episodes(episodes, window_width=window_width)
+        chopDexs = index.decision_start
+        run_times = index.run_times(ts_s=ts_s)
+        for i in np.flatnonzero(index.classifiable(ts_s=ts_s)):
+            ep_matrix = episodes[i][chopDexs[i]:, :]
+            n_windows = len(ep_matrix) - window_width + 1
+            # Window i covers ep_matrix[i:i + window_width] for i < n_windows - window_width, as in `classify`
+            windows = np.lib.stride_tricks.sliding_window_view(ep_matrix[:, 1:7], window_width, axis=0)
+            self.windows.append(windows.transpose(0, 2, 1)[:n_windows - window_width])
+            self.label_index.append(int(index.label[i]))
+            self.start_times.append(chopDexs[i] * ts_s)
+            self.run_times.append(run_times[i])
+
+
+    def __len__(self) -> int:
+        return len(self.windows)
+
+
+def batched_episode_outcomes(model: tf.keras.Model, cache: EpisodeWindowCache, confidence: float = 0.9, chunk_size: int = 32):
+    """ `EpisodeOutcomes` of every cached episode, equivalent to classifying them one by one with `classify`
+
+    Episodes are advanced together `chunk_size` windows at a time in one batch, and an episode is no longer
+    predicted once it crossed the confidence, so most windows are never evaluated """
+    n_episodes = len(cache)
+    first_crossing = np.full(n_episodes, -1)
+    crossing_rows = np.zeros((n_episodes, 2))
+    n_windows = np.array([len(w) for w in cache.windows])
+    undecided = np.arange(n_episodes)
+    start = 0
+    while len(undecided) > 0:
+        active = undecided[n_windows[undecided] > start]
+        if len(active) == 0:
+            break
+        chunks = [cache.windows[e][start:start + chunk_size] for e in active]
+        batch = np.concatenate(chunks).astype('float32')
+        probs = np.asarray(model.predict_on_batch(batch))
+
+        bounds = np.cumsum([0] + [len(c) for c in chunks])
+        crossed = np.amax(probs, axis=1) >= confidence
+        for k, e in enumerate(active):
+            hits = np.flatnonzero(crossed[bounds[k]:bounds[k + 1]])
+            if len(hits) > 0:
+                first_crossing[e] = start + hits[0]
+                crossing_rows[e] = probs[bounds[k] + hits[0]]
+        undecided = active[first_crossing[active] < 0]
+        start += chunk_size
+
+    answers = []
+    decision_times = []
+    for e in range(n_episodes):
+        if first_crossing[e] < 0:
+            answers.append('NCS' if cache.label_index[e] == 0 else 'NCF')
+            decision_times.append(np.nan)
+            continue
+        row = crossing_rows[e]
+        ans = 'T' if row[cache.label_index[e]] >= confidence else 'F'
+        ans += 'P' if row[0] > row[1] else 'N'
+        answers.append(ans)
+        decision_times.append(cache.start_times[e] + (cache.window_width + first_crossing[e]) * cache.ts_s)
+
+    return EpisodeOutcomes.from_answers(answers=answers, decision_times=decision_times, run_times=cache.run_times)
+
+
+def get_episode_outcomes(model: tf.keras.Model, episodes: list, confidence: float = 0.9, verbose: bool = False):
+    """ Classify every usable episode once into an `EpisodeOutcomes` table (classification is deterministic) """
+    cache = EpisodeWindowCache(episodes)
+    if verbose:
+        print(f'Classifying {len(cache)}/{len(episodes)} usable episodes')
+
+    return batched_episode_outcomes(model=model, cache=cache, confidence=confidence)
+
+
+def cache_window_probabilities(model: tf.keras.Model, cache: EpisodeWindowCache, batch_size: int = 4096):
+    """ `WindowProbabilities` of every window of every cached episode, so any confidence is evaluated without the model """
+    predictions = [np.asarray(model.predict(windows.astype('float32'), batch_size=batch_size, verbose=0)) for windows in cache.windows]
+
+    return WindowProbabilities.from_predictions(predictions, cache.label_index)
+
+
+def get_makespan_tradeoff(model_name: str, model: tf.keras.Model, episodes: list, thresholds = None, n_simulations: int = 0, seed: int = None, verbose: bool = False):
+    """ Makespan of every confidence threshold at once (see `makespan_tradeoff`), instead of one
+    `get_makespan_for_model` / `run_simulation` run per confidence. Returns the curve with the makespan-optimal thresholds """
+    cache = EpisodeWindowCache(episodes)
+    if verbose:
+        print(f'Predicting {len(cache)}/{len(episodes)} usable episodes')
+    with tf.device('/GPU:0'):
+        wp = cache_window_probabilities(model=model, cache=cache)
+
+    curve = makespan_tradeoff(
+        wp,
+        start_times=cache.start_times,
+        run_times=cache.run_times,
+        thresholds=thresholds,
+        window_width=cache.window_width,
+        ts_s=cache.ts_s,
+        n_simulations=n_simulations,
+        rng=np.random.default_rng(seed)
+    )
+    if verbose:
+        for variant, threshold in curve['optimal_threshold'].items():
+            print(f'Makespan-optimal threshold ({variant}) = {threshold}')
+
+    document = {key: value.tolist() if isinstance(value, np.ndarray) else value for key, value in curve.items()}
+    ResultsStore().append(MAKESPAN_TRADEOFF, model_name, document, weights_hash=weights_hash(model))
+
+    return curve
+
+
+def run_simulation(model_name: str, model: tf.keras.Model, episodes: list, confidence: float = 0.9, n_simulations: int = 1000, tolerance: float = None, n_resamples: int = 10000, seed: int = None, verbose: bool = False):
+    """ Monte Carlo makespan simulation plus bootstrap CIs of the makespan variables and of the mean simulated makespan
+    With a `tolerance` (in seconds) simulations run in batches until the 95% CI half-width of the mean makespan is below it,
+    `n_simulations` is then the maximum number of simulations """
+    table = get_episode_outcomes(model=model, episodes=episodes, confidence=confidence, verbose=verbose)
+    seed_seq = np.random.SeedSequence(seed)
+    sim_seed, bootstrap_seed, mean_seed = seed_seq.spawn(3)
+
+    if tolerance is None:
+        mks, draw_counts = simulate_makespans(table=table, n_simulations=n_simulations, rng=np.random.default_rng(sim_seed))
+    else:
+        mks, draw_counts, half_width = simulate_makespans_adaptive(
+            table=table,
+            tolerance=tolerance,
+            rng=np.random.default_rng(sim_seed),
+            max_simulations=n_simulations
+        )
+        print(f'Used {len(mks)}/{n_simulations} simulations (95% CI half-width = {half_width:.3f} [s], tolerance = {tolerance} [s])')
+    mks = mks.tolist()
+    total_time = sum(mks)
+    n_simulations = len(mks)
 
-def run_simulation(model_name: str, model: tf.keras.Model, episodes: list, confidence: float = 0.9, n_simulations: int = 1000, verbose: bool = False):
+    # Outcomes are counted over every drawn episode, as if each one had been classified when drawn
     perf = CounterDict()
-    N_posCls  = 0 # --------- Number of positive classifications
-    N_negCls  = 0 # --------- Number of negative classifications
-    N_success = 0 # --------- Number of true task successes
-    N_failure = 0 # --------- Number of true task failures
-    MTP       = 0.0 # ------- Mean Time to Positive Classification
-    MTN       = 0.0 # ------- Mean Time to Negative Classification
-    MTS       = 0.0 # ------- Mean Time to Success
-    MTF       = 0.0 # ------- Mean Time to Failure
-
-    timed_episodes = []
-    rolling_window_width = int(7.0 * 50)
-    ts_s = 20.0 / 1000.0
-    total_time = 0
-    mks = []
-
-    # Params for selecting first F_z hit
-    winWidth    = 10
-    FzCol       =  3
-    spikeThresh = 0.05
-
-    for i in range(n_simulations):
-        if verbose:
-            print(f'Simulation {i+1}/{n_simulations}:')
-        win = False
-        makespan = 0
-        while not win:
-            ep = random.choice(episodes)
-            episode_time = ep.shape[0] * ts_s
-            N = ep.shape[0]
-            chopDex = 0
-            for bgn in range( int(1.5*50), N-winWidth+1 ):
-                end     = bgn+winWidth
-                FzSlice = ep[ bgn:end, FzCol ].flatten()
-                if np.abs( np.amax( FzSlice ) - np.amin( FzSlice ) ) >= spikeThresh:
-                    chopDex = end
-                    break
-            if (chopDex * ts_s) < 15.0:
-                ep_matrix = ep[chopDex:, :]
-                if len(ep_matrix) - rolling_window_width + 1 > rolling_window_width:
-                    true_label = 0.0
-                    if ep_matrix[0, 7] == 0.0:
-                        true_label = 1.0
-                    ans, t_c = classify(
-                        model=model,
-                        episode=ep_matrix,
-                        true_label=true_label,
-                        window_width=rolling_window_width,
-                        confidence=confidence,
-                        ts_s=ts_s
-                    )
-
-                    episode_obj = EpisodePerf()
-                    episode_obj.trueLabel = true_label
-                    episode_obj.answer = ans
-                    episode_obj.runTime = episode_time
-
-                    if ans == 'NC':
-                        if true_label == 1.0:
-                            makespan += episode_time
-                            perf.count('NCF')
-                        elif true_label == 0.0:
-                            makespan += episode_time
-                            win = True
-                            perf.count('NCS')
-                    else:
-                        perf.count(ans)
-                        if ans in ('TN', 'FN'):
-                            makespan += t_c + (chopDex * ts_s)
-                            MTN += t_c + (chopDex * ts_s)
-                            episode_obj.TTN = t_c + (chopDex * ts_s)
-                            N_negCls += 1
-                        elif ans in ('TP', 'FP'):
-                            if ans == 'TP':
-                                win = 1
-                            makespan += episode_time
-                            MTP += t_c + (chopDex * ts_s)
-                            episode_obj.TTP = t_c + (chopDex * ts_s)
-                            N_posCls += 1
-
-                    if true_label == 1.0:
-                        MTF += episode_time
-                        N_failure += 1
-                    elif true_label == 0.0:
-                        MTS += episode_time
-                        N_success += 1
-
-                    timed_episodes.append(episode_obj)
-        total_time += makespan
-        mks.append(makespan)
+    for outcome, count in zip(OUTCOMES, draw_counts @ table.one_hot()):
+        if count > 0:
+            perf[outcome] = int(count)
+    n_drawn = int(draw_counts.sum())
+
+    simulation_ci = bootstrap_mean(mks, n_resamples=n_resamples, seed=mean_seed)
+    print(f'Simulated makespan [s] = {simulation_ci["estimate"]:.3f} (95% CI [{simulation_ci["low"]:.3f}, {simulation_ci["high"]:.3f}])')
 
     # At certain confidence thresholds, RNN can only output NC so we have to prevent that case
-    if N_posCls != 0 and N_negCls != 0:
+    if (perf['TP'] + perf['FP']) != 0 and (perf['TN'] + perf['FN']) != 0:
         confMatx = {
             # Actual Positives
             'TP' : (perf['TP'] if ('TP' in perf) else 0) / ((perf['TP'] if ('TP' in perf) else 0) + (perf['FN'] if ('FN' in perf) else 0)),
@@ -376,69 +334,23 @@ def run_simulation(model_name: str, model: tf.keras.Model, episodes: list, confi
             # Actual Negatives
             'TN' : (perf['TN'] if ('TN' in perf) else 0) / ((perf['TN'] if ('TN' in perf) else 0) + (perf['FP'] if ('FP' in perf) else 0)),
             'FP' : (perf['FP'] if ('FP' in perf) else 0) / ((perf['TN'] if ('TN' in perf) else 0) + (perf['FP'] if ('FP' in perf) else 0)),
-            'NC' : (perf['NCS'] + perf['NCF'] if ('NCS' in perf and 'NCF' in perf) else 0) / len(timed_episodes),
+            'NC' : (perf['NCS'] + perf['NCF'] if ('NCS' in perf and 'NCF' in perf) else 0) / n_drawn,
         }
 
-        MTP /= N_posCls #- Mean Time to Positive Classification
-        MTN /= N_negCls #- Mean Time to Negative Classification
-        MTS /= N_success
-        MTF /= N_failure
-        # MTS, MTF, _, _ = get_mts_mtf(trunc_data=episodes)
-
-        print( f"MTP: {MTP} [s]" )
-        print( f"MTN: {MTN} [s]" )
-        print( f"MTS: {MTS} [s]" )
-        print( f"MTF: {MTF} [s]" )
-
-        if MTN >= MTF:
-            EMS = abs(monitored_makespan_alternative(
-                MTF = MTF,
-                MTN = MTN,
-                MTS = MTS,
-                P_TP = perf['TP'] / len(timed_episodes),
-                P_FN = perf['FN'] / len(timed_episodes),
-                P_TN = perf['TN'] / len(timed_episodes),
-                P_FP = perf['FP'] / len(timed_episodes),
-                P_NCS = perf['NCS'] / len(timed_episodes),
-                P_NCF = perf['NCF'] / len(timed_episodes)
-            ))
-        else:
-            EMS = abs(monitored_makespan(
-                MTF = MTF,
-                MTN = MTN,
-                MTS = MTS,
-                P_TP = perf['TP'] / len(timed_episodes),
-                P_FN = perf['FN'] / len(timed_episodes),
-                P_TN = perf['TN'] / len(timed_episodes),
-                P_FP = perf['FP'] / len(timed_episodes),
-                P_NCS = perf['NCS'] / len(timed_episodes),
-                P_NCF = perf['NCF'] / len(timed_episodes)
-            ))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            metrics = {key: float(value) for key, value in outcome_variables(table, weights=draw_counts).items()}
+        EMS = metrics['EMS']
 
+        print( f"MTP: {metrics['MTP']} [s]" )
+        print( f"MTN: {metrics['MTN']} [s]" )
+        print( f"MTS: {metrics['MTS']} [s]" )
+        print( f"MTF: {metrics['MTF']} [s]" )
         print('Expected makespan [s] = ', end='')
         print( EMS, end=' [s]\n' )
-        metrics = {
-            'EMS': EMS,
-            'MTP': MTP,
-            'MTN': MTN,
-            'MTS': MTS,
-            'MTF': MTF,
-            'P_TP': perf['TP'] / len(timed_episodes),
-            'P_FN': perf['FN'] / len(timed_episodes),
-            'P_TN': perf['TN'] / len(timed_episodes),
-            'P_FP': perf['FP'] / len(timed_episodes),
-            'P_NCS': perf['NCS'] / len(timed_episodes),
-            'P_NCF': perf['NCF'] / len(timed_episodes)
-        }
 
-        result = {
-            'perf': perf,
-            'conf_mat': confMatx,
-            'variables': metrics,
-            'equation_predicted_makespan': EMS,
-            'simulation_makespan': total_time / n_simulations,
-            'simulation_makespan_list': mks
-        }
+        # CIs come from resampling the test episodes themselves, i.e. the uncertainty of the test set
+        variables_ci = bootstrap_outcome_variables(table, n_resamples=n_resamples, seed=bootstrap_seed)
+        print(f'Expected makespan 95% CI [s] = [{variables_ci["EMS"]["low"]:.3f}, {variables_ci["EMS"]["high"]:.3f}]')
     else:
         confMatx = {
             # Actual Positives
@@ -447,7 +359,7 @@ def run_simulation(model_name: str, model: tf.keras.Model, episodes: list, confi
             # Actual Negatives
             'TN' : 0,
             'FP' : 0,
-            'NC' : (perf['NCS'] + perf['NCF'] if ('NCS' in perf and 'NCF' in perf) else 0) / len(timed_episodes),
+            'NC' : (perf['NCS'] + perf['NCF'] if ('NCS' in perf and 'NCF' in perf) else 0) / n_drawn,
         }
 
         metrics = {
@@ -463,277 +375,22 @@ def run_simulation(model_name: str, model: tf.keras.Model, episodes: list, confi
             'P_NCS': 0.5,
             'P_NCF': 0.5
         }
-
-        result = {
-            'perf': perf,
-            'conf_mat': confMatx,
-            'variables': metrics,
-            'equation_predicted_makespan': 'N/A',
-            'simulation_makespan': total_time / n_simulations,
-            'simulation_makespan_list': mks
-        }
-
-    path = f'../saved_data/test_data_simulation_confidence_{int(confidence*100)}'
-    if not os.path.exists(path):
-        os.makedirs(path)
-
-    with open(f'{path}/{model_name}.json', 'w') as f:
-        json.dump(result, f)
-
-    return total_time / n_simulations, mks, metrics, confMatx
-
-
-# Plotting ----------------------------------------------------------------------------
-def plot_mts_ems(res: dict, models_to_use: list, save_plots: bool = True):
-    # Setup
-    # plt.style.use('seaborn')
-    # From Latex \textwidth
-    fig_width = 800
-    tex_fonts = {
-        # Use LaTeX to write all text
-        # "text.usetex": True,
-        "font.family": "serif",
-        # Use 10pt font in plots, to match 10pt font in document
-        "axes.labelsize": 14,
-        "font.size": 14,
-        # Make the legend/label fonts a little smaller
-        "legend.fontsize": 12,
-        "xtick.labelsize": 12,
-        "ytick.labelsize": 12
-    }
-    plt.rcParams.update(tex_fonts)
-
-    mts_time_reduction = 1 - (res['VanillaTransformer']['metrics']['MTS'][0] / res['FCN']['metrics']['MTS'][0])
-    mts_textstr = ''.join(f'Mean Time to Success is decreased by {mts_time_reduction*100:.2f}%\nwith Transformer')
-
-    ems_time_reduction = 1 - (res['VanillaTransformer']['metrics']['EMS'][0] / res['FCN']['metrics']['EMS'][0])
-    ems_textstr = ''.join(f'Makespan is decreased by {ems_time_reduction*100:.2f}%\nwith Transformer')
-
-    props = dict(boxstyle='round', facecolor='wheat', alpha=0.5)
-
-
-    fig, axes = plt.subplots(1, 1, figsize=set_size(fig_width))
-    # fig.tight_layout()
-    for model_name in res.keys():
-        if model_name in models_to_use:
-            axes.bar([model_name], res[model_name]['metrics']['MTS'], label=model_name)
-
-    axes.set_xlabel('Model')
-    axes.set_ylabel('Mean time to Success [s]')
-    axes.text(0.55, 0.75, mts_textstr, transform=axes.transAxes, alpha=0.5, bbox=props, fontsize=20)
-
-    if save_plots:
-        plt.savefig('../saved_data/imgs/makespan_prediction/mts_barplots.png')
-        plt.clf()
-    else:
-        plt.plot()
-
-    fig, axes = plt.subplots(1, 1, figsize=set_size(fig_width))
-    # fig.tight_layout()
-    for model_name in res.keys():
-        if model_name in models_to_use:
-            axes.bar([model_name], res[model_name]['metrics']['EMS'], alpha=0.5, label=model_name)
-
-    # axes[1].legend()
-    axes.set_xlabel('Model')
-    axes.set_ylabel('Expected Makespan [s]')
-    axes.text(0.55, 0.75, ems_textstr, transform=axes.transAxes, bbox=props, fontsize=20)
-
-
-    if save_plots:
-        plt.savefig('../saved_data/imgs/makespan_prediction/ems_barplots.png')
-        plt.clf()
-    else:
-        plt.plot()
-
-
-def plot_model_confusion_matrix(model_name: str, conf_mat: dict, save_plot: bool = True):
-    # Setup
-    # plt.style.use('seaborn')
-    # From Latex \textwidth
-    fig_width = 600
-    tex_fonts = {
-        # Use LaTeX to write all text
-        # "text.usetex": True,
-        "font.family": "serif",
-        # Use 10pt font in plots, to match 10pt font in document
-        "axes.labelsize": 14,
-        "font.size": 14,
-        # Make the legend/label fonts a little smaller
-        "legend.fontsize": 12,
-        "xtick.labelsize": 12,
-        "ytick.labelsize": 12
+        EMS = 'N/A'
+        variables_ci = {}
+
+    ci = {'simulation_makespan': simulation_ci, 'variables': variables_ci, 'n_resamples': n_resamples, 'alpha': 0.05}
+    result = {
+        'perf': perf,
+        'conf_mat': confMatx,
+        'variables': metrics,
+        'equation_predicted_makespan': EMS,
+        'simulation_makespan': total_time / n_simulations,
+        'simulation_makespan_list': mks,
+        'n_simulations': n_simulations,
+        'confidence_intervals': ci,
+        'episode_outcomes': table.to_dict()
     }
-    plt.rcParams.update(tex_fonts)
-
-    arr = [
-        [conf_mat['TP'], conf_mat['FP']],
-        [conf_mat['FN'], conf_mat['TN']]
-    ]
 
-    sns.set(font_scale=2)
-    if save_plot:
-        if model_name == 'VanillaTransformer':
-            nc_textstr = ''.join(f'Transformer has a {conf_mat["NC"]*100:.2f}% NC rate')
-        else:
-            nc_textstr = ''.join(f'{model_name} has a {conf_mat["NC"]*100:.2f}% NC rate')
-        props = dict(boxstyle='round', facecolor='green', alpha=0.75)
-        conf_mat_plot = sns.heatmap(arr, annot=True).get_figure()
-        conf_mat_plot.text(0.43, 0.95, nc_textstr, bbox=props, fontsize=20, horizontalalignment='center', verticalalignment='top')
-        conf_mat_plot.savefig(f'../saved_data/imgs/makespan_prediction/{model_name}_confusion_matrix.png')
-        plt.clf()
-    else:
-        sns.heatmap(arr, annot=True)
-
-    # NC percentage visualization through stacked plots
-    x = ['No classification', 'Actual Positives', 'Actual negatives']
-    fig, axes = plt.subplots(1, 1, figsize=set_size(fig_width))
-    fig.tight_layout()
-    if save_plot:
-        nc = [conf_mat['NC'], 0, 0]
-        tp = np.array([0, conf_mat['TP'], 0])
-        fn = np.array([0, conf_mat['FN'], 0])
-        fp = np.array([0, 0, conf_mat['FP']])
-        tn = np.array([0, 0, conf_mat['TN']])
-        axes.bar(x, nc, label='NC')
-        axes.bar(x, tp, bottom=nc, label='TP')
-        axes.bar(x, fp, bottom=nc+tp, label='FP')
-        axes.bar(x, fn, bottom=nc+tp+fp, label='FN')
-        axes.bar(x, tn, bottom=nc+tp+fp+fn, label='TN')
-        axes.legend()
-        plt.savefig(f'../saved_data/imgs/makespan_prediction/{model_name}_stacked_classification_barplots.png')
-        plt.clf()
-    else:
-        plt.show()
-
-
-def plot_runtimes(res: dict, models_to_use: list, save_plots: bool = True):
-    # Setup
-    # plt.style.use('seaborn')
-    # From Latex \textwidth
-    fig_width = 600
-    tex_fonts = {
-        # Use LaTeX to write all text
-        # "text.usetex": True,
-        "font.family": "serif",
-        # Use 10pt font in plots, to match 10pt font in document
-        "axes.labelsize": 14,
-        "font.size": 14,
-        # Make the legend/label fonts a little smaller
-        "legend.fontsize": 12,
-        "xtick.labelsize": 12,
-        "ytick.labelsize": 12
-    }
-    plt.rcParams.update(tex_fonts)
-
-    ems_hits = np.sum([1 if vt < fcn else 0 for vt, fcn in zip(res['VanillaTransformer']['times'], res['FCN']['times'])])
-    ems_performance = (ems_hits * 100) / len(res['VanillaTransformer']['times'])
-    ems_textstr = ''.join(f'Runtime is lower for {ems_performance:.2f}% of the episodes with Transformer')
-
-    props = dict(boxstyle='round', facecolor='wheat', alpha=0.5)
-
-    fig, axes = plt.subplots(1, 1, figsize=set_size(fig_width))
-    fig.tight_layout()
-    axes.title.set_text('Runtimes for each model')
-    runtimes = []
-    for model_name in res.keys():
-        if model_name in models_to_use:
-            runtimes.append(res[model_name]['times'])
-
-    axes.hist(runtimes, alpha=0.5, label=list(res.keys()), bins=10)
-    axes.legend()
-    axes.set_xlabel('Runtime [s]')
-    axes.set_ylabel('Count')
-    axes.text(0.2, 0.75, ems_textstr, transform=axes.transAxes, bbox=props, fontsize=20)
-
-    if save_plots:
-        plt.savefig('../saved_data/imgs/makespan_prediction/runtime_histogram.png')
-        plt.clf()
-    else:
-        plt.plot()
-
-
-def plot_simulation_makespans(models: dict, confidence:float, reactive_mks: list = [], plot_reactive: bool =False, save_plots: bool = True):
-    img_path = f'../saved_data/imgs/makespan_prediction/makespan_simulation_histogram_confidence_{int(confidence * 100)}.png'
-    sim_file_dir = f'../saved_data/test_data_simulation_confidence_{int(confidence * 100)}'
-
-    makespans = {'reactive': reactive_mks}
-    for model_name in models.keys():
-        with open(f'{sim_file_dir}/{model_name}.json', 'r') as f:
-            data = json.load(f)
-        makespans[model_name] = data['simulation_makespan_list']
-
-    # Setup
-    # From Latex \textwidth
-    fig_width = 600
-    tex_fonts = {
-        # Use LaTeX to write all text
-        # "text.usetex": True,
-        "font.family": "serif",
-        # Use 10pt font in plots, to match 10pt font in document
-        "axes.labelsize": 14,
-        "font.size": 14,
-        # Make the legend/label fonts a little smaller
-        "legend.fontsize": 12,
-        "xtick.labelsize": 12,
-        "ytick.labelsize": 12
-    }
-    plt.rcParams.update(tex_fonts)
-
-    # textstr_dict = dict.fromkeys(models, None)
-    # means_textstr_dict = dict.fromkeys(models, None)
-    means_textstr_dict = {model_name: None for model_name in models.keys()}
-    if plot_reactive and reactive_mks != []:
-        means_textstr_dict = {**{'Reactive': ''.join(f'Reactive: {np.mean(reactive_mks):.2f} \u00B1 {np.std(reactive_mks):.2f}')}, **means_textstr_dict}
-    for model_name in models.keys():
-        if model_name == 'Transformer':
-            name = 'Small Transformer'
-        else:
-            name = model_name
-        means_textstr_dict[model_name] = ''.join(f'{name}: {np.mean(makespans[model_name]):.2f} \u00B1 {np.std(makespans[model_name]):.2f}')
-
-    props = dict(boxstyle='round', facecolor='wheat', alpha=0.5)
-
-    fig, axes = plt.subplots(1, 1, figsize=set_size(fig_width))
-    # plt.tight_layout()
-    # axes.title.set_text(f'Simulated makespans for each model\n(N = {len(makespans[list(makespans.keys())[0]])}, confidence = {int(confidence * 100)}%)')
-    runtimes = []
-    if plot_reactive and reactive_mks != []:
-        runtimes.append(reactive_mks)
-    for model_name in models.keys():
-        runtimes.append(makespans[model_name])
-
-
-    labels = []
-    if plot_reactive and reactive_mks != []:
-        labels.append('Reactive') 
-    for model_name in list(models.keys()):
-        if model_name == 'Transformer':
-            labels.append('Small Transformer')
-        else:
-            labels.append(model_name)
-
-    axes.hist(runtimes, alpha=0.5, label=labels, bins=10)
-    axes.legend()
-    axes.set_xlabel('Episode Makespan [s]')
-    axes.set_ylabel('Count [Episodes]')
-
-
-    x = 0.15
-    y = 0.9
-    # for model_name, textstr in textstr_dict.items():
-    #     if textstr is not None:
-    #         axes.text(x, y, textstr, transform=axes.transAxes, bbox=props, fontsize=20)
-    #         y -= 0.11
-
-    for model_name, textstr in means_textstr_dict.items():
-        if textstr is not None:
-            axes.text(x, y, textstr, transform=axes.transAxes, bbox=props, fontsize=17)
-            y -= 0.11
-
-    if save_plots:
-        plt.savefig(img_path)
-        plt.clf()
-    else:
-        plt.plot()
+    ResultsStore().append(MAKESPAN_SIMULATION, model_name, result, confidence=confidence, weights_hash=weights_hash(model))
 
+    return total_time / n_simulations, mks, metrics, confMatx, ci
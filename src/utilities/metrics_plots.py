@@ -11,9 +11,12 @@ from matplotlib.colors import rgb2hex
 import tensorflow as tf
 import seaborn as sns
 
-from sklearn import metrics
 from utilities.utils import CounterDict, set_size
-from helper_functions import scan_output_for_decision, graph_episode_output
+from helper_functions import scan_output_for_decision
+from utilities.makespan_plots import plot_equation_simulation_makespan_barplots, plot_monte_carlo_simulation_barplots
+from utilities.results_store import ResultsStore, CONF_MAT, ROC, weights_hash
+from utilities.plot_rendering import render_batch, probability_job
+from utilities.classification_metrics import binary_curves, evaluate, cached_window_probabilities
 
 
 def plot_acc_loss(history, imgs_path, save_plot=True):
@@ -65,6 +68,7 @@ def plot_acc_loss(history, imgs_path, save_plot=True):
 def plot_evaluation_on_test_window_data(model: tf.keras.Model, model_name: str, X_data: list, Y_data: list, confidence: float = 0.90, simulation: bool = False, verbose: bool = True):
     perf = CounterDict()
     list_of_res = []
+    plot_jobs = []
 
     for epNo in range(len(X_data)):
         if verbose:
@@ -73,16 +77,15 @@ def plot_evaluation_on_test_window_data(model: tf.keras.Model, model_name: str,
             pred = model.predict(X_data[epNo])
             ans, aDx = scan_output_for_decision(pred, Y_data[epNo][0], threshold=confidence)
             list_of_res.append(get_decision(pred, Y_data[epNo][0], threshold=confidence))
-            graph_episode_output(
+            plot_jobs.append(probability_job(
                 res=pred,
                 index=epNo,
                 ground_truth=Y_data[epNo][0],
                 out_decision=(ans, aDx),
                 imgs_path=model.imgs_path,
                 net=model_name,
-                ts_ms = 20,
-                save_fig=True
-            )
+                ts_ms = 20
+            ))
             print()
 
             perf.count( ans )
@@ -93,6 +96,8 @@ def plot_evaluation_on_test_window_data(model: tf.keras.Model, model_name: str,
                 elif all(Y_data[epNo][0] == tf.keras.utils.to_categorical(1.0, num_classes=2)):
                     perf.count('NCF')
 
+    # Figures are rendered together once all episodes are predicted
+    render_batch(plot_jobs)
     print( '\n', model.file_name, '\n', perf )
 
     try:
@@ -113,10 +118,7 @@ def plot_evaluation_on_test_window_data(model: tf.keras.Model, model_name: str,
         plot = False
 
     print(f'For model {model_name}:\n{confMatx}')
-    with open(f'../saved_data/test_conf_mats/{model_name}_test_data_perf_at_{confidence}.json', 'w') as f:
-        json.dump(perf, f)
-    with open(f'../saved_data/test_conf_mats/{model_name}_test_data_conf_mat_at_{confidence}.json', 'w') as f:
-        json.dump(confMatx, f)
+    ResultsStore().append(CONF_MAT, model_name, {'perf': perf, 'conf_mat': confMatx}, confidence=confidence, weights_hash=weights_hash(model))
 
     if plot:
         arr = [
@@ -177,10 +179,7 @@ def compute_confusion_matrix(model, model_name, file_name, imgs_path, X_winTest,
         plot = False
 
     print(f'For model {model_name}:\n{confMatx}')
-    with open(f'../saved_data/test_conf_mats/{model_name}_test_data_perf_at_{confidence}.json', 'w') as f:
-        json.dump(perf, f)
-    with open(f'../saved_data/test_conf_mats/{model_name}_test_data_conf_mat_at_{confidence}.json', 'w') as f:
-        json.dump(confMatx, f)
+    ResultsStore().append(CONF_MAT, model_name, {'perf': perf, 'conf_mat': confMatx}, confidence=confidence, weights_hash=weights_hash(model))
 
     if plot:
         arr = [
@@ -202,6 +201,7 @@ def compute_confusion_matrix(model, model_name, file_name, imgs_path, X_winTest,
 
 
 def make_probabilities_plots(model, model_name, imgs_path, X_winTest, Y_winTest):
+    plot_jobs = []
     for epNo in range( len( X_winTest ) ):
         with tf.device('/GPU:0'):
             print(epNo, ':')
@@ -209,18 +209,20 @@ def make_probabilities_plots(model, model_name, imgs_path, X_winTest, Y_winTest)
             print( Y_winTest[epNo][0], '\n' )
             out_decision = scan_output_for_decision( res, Y_winTest[epNo][0], threshold = 0.90 )
             print(out_decision)
-            graph_episode_output(
+            plot_jobs.append(probability_job(
                 res=res,
                 index=epNo,
                 ground_truth=Y_winTest[epNo][0],
                 out_decision=out_decision,
                 imgs_path=imgs_path,
                 net=model_name,
-                ts_ms = 20,
-                save_fig=True
-            )
+                ts_ms = 20
+            ))
             print()
 
+    # Figures are rendered over a process pool once all episodes are predicted
+    render_batch(plot_jobs)
+
 
 def get_decision( output, trueLabel, threshold = 0.90 ):
     for i, row in enumerate( output ):
@@ -236,74 +238,8 @@ def get_decision( output, trueLabel, threshold = 0.90 ):
     return row[1]
 
 
-def plot_roc_window_data(models: dict, X_data: list, Y_data: list, confidence: float = 0.9):
-    img_path = f'../saved_data/imgs/roc_curves_confidence_{int(confidence * 100)}.png'
-
-    # Setup
-    plt.style.use('seaborn')
-    # From Latex \textwidth
-    fig_width = 800
-    tex_fonts = {
-        # Use LaTeX to write all text
-        # "text.usetex": True,
-        "font.family": "serif",
-        # Use 10pt font in plots, to match 10pt font in document
-        "axes.titlesize": 17,
-        "axes.labelsize": 14,
-        "font.size": 14,
-        # Make the legend/label fonts a little smaller
-        "legend.fontsize": 12,
-        "xtick.labelsize": 12,
-        "ytick.labelsize": 12
-    }
-    plt.rcParams.update(tex_fonts)
-    cmap = cm.get_cmap('Spectral', len(models.keys()))
-    colors = [rgb2hex(cmap(i)[:3]) for i in range(cmap.N)]
-    i = 0
-
-    results = {}
-
-    for model_name, model in models.items():
-        print(f'--> For model {model_name}...')
-        res = []
-        labels = []
-        for epNo in range(len(X_data)):
-            with tf.device('/GPU:0'):
-                pred = model.predict(X_data[epNo])
-                value = get_decision(pred, Y_data[epNo][0], threshold=confidence)
-                if value != 'NC':
-                    res.append(value)
-                    labels.append(Y_data[epNo][0][1])
-
-        # labels = [l[0][1] for l in Y_data]
-        if len(res) != 0:
-            fpr, tpr, _ = metrics.roc_curve(labels, res)
-            auc = metrics.roc_auc_score(labels, res)
-
-            results[model_name] = {'fpr': fpr.tolist(), 'tpr': tpr.tolist(), 'auc': auc}
-
-            label_name = model_name
-            if model_name == 'Transformer':
-                label_name = 'Small Transformer'
-            elif model_name == 'Transformer_big':
-                label_name = 'Big Transformer'
-
-            plt.plot(fpr, tpr, label=f'{label_name} (AUC = {auc:.4f})', color=colors[i])
-
-        i += 1
-
-    with open(f'../saved_data/ROC/results_confidence_{int(confidence * 100)}.json', 'w') as f:
-        json.dump(results, f)
-
-    plt.axline((1, 1), slope=1, linestyle='dashed', color='black')
-    plt.tight_layout()
-    plt.legend()
-    plt.savefig(img_path)
-    plt.clf()
-    plt.close('all')
-
-
-def plot_roc_window_data_from_preds(models: dict, preds: dict, Y_data: list, confidence: float = 0.9, img_path: str = '../saved_data/imgs/roc_curves.png'):
+def _plot_roc_curves(curves: dict, img_path: str):
+    """ ROC curve of every model from the `binary_curves` of the engine """
     # Setup
     plt.style.use('seaborn')
     # From Latex \textwidth
@@ -322,21 +258,16 @@ def plot_roc_window_data_from_preds(models: dict, preds: dict, Y_data: list, con
         "ytick.labelsize": 12
     }
     plt.rcParams.update(tex_fonts)
-    cmap = cm.get_cmap('Spectral', len(models.keys()))
+    cmap = cm.get_cmap('Spectral', max(len(curves), 1))
     colors = [rgb2hex(cmap(i)[:3]) for i in range(cmap.N)]
-    i = 0
-    for model_name, pred in preds.items():
-        labels = [l[0][1] for l in Y_data]
-        fpr, tpr, _ = metrics.roc_curve(labels, pred)
-        auc = metrics.roc_auc_score(labels, pred)
+    for i, (model_name, curve) in enumerate(curves.items()):
         label_name = model_name
         if model_name == 'Transformer':
             label_name = 'Small Transformer'
         elif model_name == 'Transformer_big':
             label_name = 'Big Transformer'
-        plt.plot(fpr, tpr, label=f'{label_name} (AUC = {auc:.4f})', color=colors[i])
 
-        i += 1
+        plt.plot(curve['fpr'], curve['tpr'], label=f'{label_name} (AUC = {curve["roc_auc"]:.4f})', color=colors[i])
 
     plt.axline((1, 1), slope=1, linestyle='dashed', color='black')
     plt.tight_layout()
@@ -346,163 +277,40 @@ def plot_roc_window_data_from_preds(models: dict, preds: dict, Y_data: list, con
     plt.close('all')
 
 
-def plot_equation_simulation_makespan_barplots(models: dict, confidence: float, reactive_eq: float, reactive_sim: list, plot_reactive: bool = True, save: bool = True):
-    img_path = f'../saved_data/imgs/equation_simulation_makespans_barplot_confidence_{int(confidence * 100)}.png'
-    eq_file_dir = f'../saved_data/test_data_makespan_confidence_{int(confidence * 100)}'
-    sim_file_dir = f'../saved_data/test_data_simulation_confidence_{int(confidence * 100)}'
-
-    makespans = {model_name: {'eq': None, 'sim': []} for model_name in models.keys()}
-    for model_name in models.keys():
-        with open(f'{eq_file_dir}/{model_name}.json', 'r') as f:
-            data = json.load(f)
-        makespans[model_name]['eq'] = data['predicted_makespan']
-
-        with open(f'{sim_file_dir}/{model_name}.json', 'r') as f:
-            data = json.load(f)
-        makespans[model_name]['sim'] = data['simulation_makespan_list']
+def plot_roc_window_data(models: dict, X_data: list, Y_data: list, confidence: float = 0.9, recompute: bool = False):
+    """ Episode-level ROC at `confidence`: every classified episode is scored with the Pr(Fail) of its deciding window
 
-    fig_width = 800
-    tex_fonts = {
-        # Use LaTeX to write all text
-        # "text.usetex": True,
-        "font.family": "serif",
-        # Use 10pt font in plots, to match 10pt font in document
-        "axes.titlesize": 17,
-        "axes.labelsize": 14,
-        "font.size": 14,
-        # Make the legend/label fonts a little smaller
-        "legend.fontsize": 14,
-        "xtick.labelsize": 14,
-        "ytick.labelsize": 14
-    }
-    plt.rcParams.update(tex_fonts)
-
-    fig, axes = plt.subplots(1, 1, figsize=set_size(fig_width, subplots=(1, 1)))
-
-    width = 0.25
-    if plot_reactive:
-        r = np.arange(len(list(models.keys())) + 1)
-    else:
-        r = np.arange(len(list(models.keys())) )
-
-    eq_heights = []
-    if plot_reactive and reactive_eq:
-        eq_heights.append(reactive_eq)
-    for v in makespans.values():
-        eq_heights.append(v['eq'])
-
-    sim_heights = []
-    sim_errors = []
-    if plot_reactive and reactive_sim != []:
-        sim_heights.append(np.mean(reactive_sim))
-        sim_errors.append(np.std(reactive_sim))
-    for v in makespans.values():
-        sim_heights.append(np.mean(v['sim']))
-        sim_errors.append(np.std(v['sim']))
-
-    axes.bar(
-        x=r,
-        height=eq_heights,
-        width=width,
-        label='Equation makespans [s]',
-        alpha=0.5
-    )
-
-    axes.bar(
-        x=r + width,
-        height=sim_heights,
-        yerr=sim_errors,
-        width=width,
-        label='Simulation makespans [s]',
-        alpha=0.5,
-        capsize=10
-    )
-
-    labels = []
-    if plot_reactive and reactive_eq and reactive_sim != []:
-        labels.append('Reactive')
-    for model_name in makespans.keys():
-        if model_name == 'Transformer':
-            labels.append('Small Transformer')
-        else:
-            labels.append(model_name)
-    plt.xticks(r + width/2, labels)
-    plt.tight_layout()
-    plt.legend()
-    plt.savefig(img_path)
-    plt.clf()
-    plt.close('all')
-
-
-def plot_monte_carlo_simulation_barplots(models: dict, confidence: float, save: bool = True):
-    img_path = f'../saved_data/imgs/monte_carlo_simulation_barplot_confidence_{int(confidence * 100)}.png'
-    sim_file_dir = f'../saved_data/test_data_simulation_confidence_{int(confidence * 100)}'
+    The windows of all test episodes are predicted once per model and cached (see `cached_window_probabilities`), all
+    curves then come from `classification_metrics.evaluate` """
+    img_path = f'../saved_data/imgs/roc_curves_confidence_{int(confidence * 100)}.png'
 
-    makespans = {model_name: {'sim_eq': None, 'sim': []} for model_name in models.keys()}
-    for model_name in models.keys():
-        with open(f'{sim_file_dir}/{model_name}.json', 'r') as f:
-            data = json.load(f)
-        makespans[model_name]['sim'] = data['simulation_makespan_list']
-        makespans[model_name]['sim_eq'] = data['equation_predicted_makespan']
+    curves = {}
+    store = ResultsStore()
+    for model_name, model in models.items():
+        print(f'--> For model {model_name}...')
+        with tf.device('/GPU:0'):
+            wp = cached_window_probabilities(model_name, model, X_data, Y_data, recompute=recompute)
+        evaluation = evaluate(wp, confidence=confidence)
+        if evaluation['episode'] is None:
+            continue
+
+        episode = evaluation['episode']
+        curves[model_name] = episode
+        store.append(ROC, model_name, {
+            'fpr': episode['fpr'].tolist(),
+            'tpr': episode['tpr'].tolist(),
+            'auc': episode['roc_auc'],
+            'precision': episode['precision'].tolist(),
+            'recall': episode['recall'].tolist(),
+            'average_precision': episode['average_precision'],
+            'window': {key: evaluation['window'][key] for key in ('roc_auc', 'average_precision')},
+            'decision': {key: value.tolist() for key, value in evaluation['decision'].items()}
+        }, confidence=confidence, weights_hash=weights_hash(model))
+
+    _plot_roc_curves(curves, img_path)
 
-    fig_width = 800
-    tex_fonts = {
-        # Use LaTeX to write all text
-        # "text.usetex": True,
-        "font.family": "serif",
-        # Use 10pt font in plots, to match 10pt font in document
-        "axes.titlesize": 17,
-        "axes.labelsize": 14,
-        "font.size": 14,
-        # Make the legend/label fonts a little smaller
-        "legend.fontsize": 14,
-        "xtick.labelsize": 14,
-        "ytick.labelsize": 14
-    }
-    plt.rcParams.update(tex_fonts)
 
-    fig, axes = plt.subplots(1, 1, figsize=set_size(fig_width, subplots=(1, 1)))
-
-    width = 0.25
-    r = np.arange(len(list(models.keys())) )
-
-    eq_heights = []
-    for v in makespans.values():
-        eq_heights.append(v['sim_eq'])
-
-    sim_heights = []
-    sim_errors = []
-    for v in makespans.values():
-        sim_heights.append(np.mean(v['sim']))
-        sim_errors.append(np.std(v['sim']))
-
-    axes.bar(
-        x=r,
-        height=eq_heights,
-        width=width,
-        label='Equation makespans [s]',
-        alpha=0.5
-    )
-
-    axes.bar(
-        x=r + width,
-        height=sim_heights,
-        yerr=sim_errors,
-        width=width,
-        label='Simulation makespans [s]',
-        alpha=0.5,
-        capsize=10
-    )
-
-    labels = []
-    for model_name in makespans.keys():
-        if model_name == 'Transformer':
-            labels.append('Small Transformer')
-        else:
-            labels.append(model_name)
-    plt.xticks(r + width/2, labels)
-    plt.tight_layout()
-    plt.legend()
-    plt.savefig(img_path)
-    plt.clf()
-    plt.close('all')
\ No newline at end of file
+def plot_roc_window_data_from_preds(models: dict, preds: dict, Y_data: list, confidence: float = 0.9, img_path: str = '../saved_data/imgs/roc_curves.png'):
+    """ ROC of per-episode scores `preds` ({model: one score per episode}) """
+    labels = [l[0][1] for l in Y_data]
+    _plot_roc_curves({model_name: binary_curves(pred, labels) for model_name, pred in preds.items()}, img_path)
@@ -11,6 +11,7 @@ import tensorflow as tf
 
 from utilities.makespan_utils import scan_output_for_decision
 from utilities.utils import set_size
+from data_management.episode_index import EpisodeIndex
 
 
 def plot_one_example(episode):
@@ -89,9 +90,8 @@ def plot_ft_classification_for_model(model_names, models, episodes, ep_indices,
     ts_s = 20.0 / 1000.0
     ts_ms = 20
     rolling_window_width = int(7.0 * 50.0)
-    win_width = 10
-    FzCol = 3
-    spikeThresh = 0.05
+    index = EpisodeIndex.from_episodes(episodes, window_width=rolling_window_width)
+    classifiable = index.classifiable(ts_s=ts_s)
 
     fig_width = 1000
     tex_fonts = {
@@ -116,7 +116,7 @@ def plot_ft_classification_for_model(model_names, models, episodes, ep_indices,
     for episode in episodes:
         episode_steps = episode.shape[0]
 
-        ep_label = 'Success' if episode[:, :][0, 7] == 1.0 else 'Failure'
+        ep_label = 'Success' if index.success[i] else 'Failure'
 
         fx = episode[:, 1]
         fy = episode[:, 2]
@@ -144,29 +144,15 @@ def plot_ft_classification_for_model(model_names, models, episodes, ep_indices,
         if plot_preds:
             j = 2
             for model_name, model in zip(model_names, models):
-                n_steps = episode.shape[0]
-                episode_time = n_steps * ts_s
-                chopDex = 0
-                for bgn in range(int(1.5*50), n_steps - win_width + 1):
-                    end     = bgn+win_width
-                    FzSlice = episode[ bgn:end, FzCol ].flatten()
-                    if np.abs( np.amax( FzSlice ) - np.amin( FzSlice ) ) >= spikeThresh:
-                        chopDex = end
-                        break
-                if (chopDex * ts_s) < 15.0:
-                    ep_matrix = episode[chopDex:, :]
-                    if len(ep_matrix) - rolling_window_width + 1 > rolling_window_width:
-                        true_label = 0.0
-                        if ep_matrix[0, 7] == 0.0:
-                            true_label = 1.0
-                        ans, t_c, preds = classify(
-                            model=model,
-                            episode=ep_matrix,
-                            true_label=true_label,
-                            window_width=rolling_window_width,
-                            confidence=confidence,
-                            ts_s=ts_s
-                        )
+                if classifiable[i]:
+                    ans, t_c, preds = classify(
+                        model=model,
+                        episode=episode[index.decision_start[i]:, :],
+                        true_label=float(index.label[i]),
+                        window_width=rolling_window_width,
+                        confidence=confidence,
+                        ts_s=ts_s
+                    )
 
                 N = preds.shape[0]
                 X = np.arange(0, episode_steps*ts_ms, ts_ms)
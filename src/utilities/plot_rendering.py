@@ -0,0 +1,226 @@
+import sys, os
+import multiprocessing as mp
+sys.path.append(os.path.realpath('../'))
+# print(sys.path)
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import matplotlib
+from matplotlib.figure import Figure
+
+from utilities.utils import set_size
+
+# NOTE: Figures are built with `matplotlib.figure.Figure` (no pyplot), so they always render with Agg and never touch
+#       the interactive backend or global figure state. Every worker builds one figure per kind and only updates the
+#       data of its artists for each job. Workers are 'spawn'ed like in `job_scheduler` (TensorFlow is not fork safe)
+
+TEX_FONTS = {
+    # "text.usetex": True,
+    "font.family": "serif",
+    # Use 10pt font in plots, to match 10pt font in document
+    "axes.labelsize": 14,
+    "font.size": 14,
+    # Make the legend/label fonts a little smaller
+    "legend.fontsize": 12,
+    "xtick.labelsize": 12,
+    "ytick.labelsize": 12
+}
+HEAD_COLORS = ['blue', 'green', 'yellow', 'red']
+ATTENTION_DIR = '../saved_data/imgs/attention'
+
+
+# Classes --------------------------------------------------------------------------
+class ProbabilityFigure:
+    """ Stacked Pr(Pass) / Pr(Fail) of one episode over time, as `graph_episode_output` """
+    def __init__(self, fig_width: int = 600) -> None:
+        with matplotlib.rc_context(TEX_FONTS):
+            self.fig = Figure(figsize=set_size(fig_width))
+            self.ax = self.fig.add_subplot()
+            empty = np.zeros(2)
+            self.bands = [
+                self.ax.fill_between(empty, empty, empty, label=label, color=color)
+                for label, color in (('Pr(Pass)', 'C0'), ('Pr(Fail)', 'C1'))
+            ]
+            self.ax.axhline(y=0.9, color='black', linestyle='--')
+            self.ax.axhline(y=0.1, color='black', linestyle='--')
+            self.ax.legend()
+            self.title = self.ax.set_title('')
+
+
+    def render(self, path: str, res, index, ground_truth, out_decision, net: str, ts_ms: int = 20):
+        res = np.asarray(res)
+        X = np.arange(0, res.shape[0] * ts_ms, ts_ms)
+        lower = np.zeros(len(X))
+        for band, values in zip(self.bands, res.T):
+            upper = lower + values
+            band.set_verts([np.concatenate((np.column_stack((X, lower)), np.column_stack((X, upper))[::-1]))])
+            lower = upper
+        self.ax.set_xlim(X[0], X[-1])
+        self.ax.set_ylim(0.0, max(1.0, lower.max()))
+        self.title.set_text(f'Probabilities for {net}: episode {index}\nGT = {ground_truth} | Decision = {out_decision}')
+        with matplotlib.rc_context(TEX_FONTS):
+            self.fig.savefig(path)
+
+
+class AttentionHeadFigure:
+    """ Attention matrix of one head, as `plot_attention_weights` """
+    def __init__(self) -> None:
+        self.fig = Figure(figsize=(20, 10))
+        self.ax = self.fig.add_subplot()
+        self.image = self.ax.matshow(np.zeros((2, 2)))
+        self.fig.colorbar(self.image)
+        self.title = self.ax.set_title('')
+        self.fig.tight_layout()
+
+
+    def render(self, path: str, head, title: str):
+        head = np.asarray(head)
+        self.image.set_data(head)
+        self.image.set_extent((-0.5, head.shape[1] - 0.5, head.shape[0] - 0.5, -0.5))
+        self.image.set_clim(head.min(), head.max())
+        self.title.set_text(title)
+        self.fig.savefig(path)
+
+
+class TimeSeriesFigure:
+    """ Force / torque of an episode (2 rows of 3 lines), with highlighted spans, as `plot_attention_on_time_series` """
+    def __init__(self, color: str = None) -> None:
+        self.fig = Figure(figsize=(15, 8))
+        self.axes = self.fig.subplots(2, 1)
+        styles = ('solid', 'dotted', 'dashed')
+        self.lines = []
+        for ax, name in zip(self.axes, ('Force', 'Torque')):
+            for axis, style in zip('xyz', styles):
+                self.lines.append(ax.plot([], [], linewidth=1, color=color, linestyle=style, label=f'{name} {axis}')[0])
+            ax.legend()
+        self.spans = []
+        self.legend = None
+        self.title = self.fig.suptitle('')
+
+
+    def render(self, path: str, X, ft, spans: list, title: str = '', legend: list = None):
+        """ `ft` is (n, 6) F/T, `spans` are (start, end, color, alpha) highlighted on both rows """
+        for line, values in zip(self.lines, np.asarray(ft).T):
+            line.set_data(X, values)
+        for span in self.spans:
+            span.remove()
+        self.spans = [ax.axvspan(start, end, color=color, alpha=alpha) for start, end, color, alpha in spans for ax in self.axes]
+        for ax in self.axes:
+            ax.relim()
+            ax.autoscale_view()
+        if self.legend is not None:
+            self.legend.remove()
+            self.legend = None
+        if legend:
+            # One entry per (color, label), from the first span of that color on the top row
+            handles = {span.get_facecolor()[:3]: span for span in self.spans[::2]}
+            self.legend = self.fig.legend(list(handles.values()), legend[:len(handles)])
+        self.title.set_text(title)
+        self.fig.savefig(path)
+
+
+FIGURES = {
+    'probability': ProbabilityFigure,
+    'attention_head': AttentionHeadFigure,
+    'time_series': TimeSeriesFigure,
+}
+
+
+# Functions -----------------------------------------------------------------------
+def _render_chunk(jobs: list) -> list:
+    """ Render `jobs` ({'kind', 'path', **render kwargs}) reusing one figure per kind, returns the saved paths """
+    figures = {}
+    paths = []
+    for job in jobs:
+        job = dict(job)
+        kind = job.pop('kind')
+        figure_kwargs = job.pop('figure', {})
+        key = (kind, tuple(sorted(figure_kwargs.items())))
+        if key not in figures:
+            figures[key] = FIGURES[kind](**figure_kwargs)
+        os.makedirs(os.path.dirname(os.path.abspath(job['path'])), exist_ok=True)
+        figures[key].render(**job)
+        paths.append(job['path'])
+
+    return paths
+
+
+def render_batch(jobs: list, n_workers: int = None) -> list:
+    """ Render every job over a process pool (in this process with `n_workers=0`), returns the saved paths
+
+    Jobs are dicts with the figure 'kind' (see `FIGURES`), the output 'path' and the `render` kwargs of that figure """
+    if n_workers is None:
+        n_workers = min(os.cpu_count() or 1, max(1, len(jobs) // 8))
+    if n_workers <= 1 or len(jobs) <= 1:
+        return _render_chunk(jobs)
+
+    # Contiguous chunks keep jobs of one kind together, so each worker builds few figures
+    chunks = [list(chunk) for chunk in np.array_split(np.arange(len(jobs)), n_workers) if len(chunk) > 0]
+    with ProcessPoolExecutor(max_workers=len(chunks), mp_context=mp.get_context('spawn')) as pool:
+        results = pool.map(_render_chunk, [[jobs[i] for i in chunk] for chunk in chunks])
+
+    return [path for paths in results for path in paths]
+
+
+def probability_job(res, index, ground_truth, out_decision, net: str, imgs_path: str, ts_ms: int = 20) -> dict:
+    """ Job of the figure `graph_episode_output` saves """
+    return {
+        'kind': 'probability',
+        'path': imgs_path + f'{net}_prob_{index}.png',
+        'res': np.asarray(res),
+        'index': index,
+        'ground_truth': ground_truth,
+        'out_decision': out_decision,
+        'net': net,
+        'ts_ms': ts_ms
+    }
+
+
+def attention_weights_jobs(attention_heads, episode_num, time_step, res, values) -> list:
+    """ Jobs of the figures `plot_attention_weights` saves, one per head """
+    dir_path = f'{ATTENTION_DIR}/episode_{episode_num}/'
+    return [
+        {
+            'kind': 'attention_head',
+            'path': dir_path + f'attention_mat_ep_{episode_num}_head_{h}.png',
+            'head': np.asarray(head),
+            'title': f'Episode {episode_num}, Head {h+1}\nPredicted {res} at time {time_step} ms ({values})'
+        }
+        for h, head in enumerate(np.asarray(attention_heads)[0])
+    ]
+
+
+def attention_time_series_jobs(episode, attention_heads, episode_num, time_step_ms, ts_ms, window_width: int = 350) -> list:
+    """ Jobs of the figures `plot_attention_on_time_series` saves: the whole episode and the attended window """
+    dir_path = f'{ATTENTION_DIR}/episode_{episode_num}/'
+    jobs = [{
+        'kind': 'time_series',
+        'path': dir_path + f'ep_{episode_num}_big_picture.png',
+        'X': np.arange(0, episode.shape[0] * ts_ms, ts_ms),
+        'ft': episode[:, 1:7],
+        'spans': [(time_step_ms - (window_width * ts_ms), time_step_ms, 'gray', 0.3)]
+    }]
+
+    # Samples of the window with at least 90% of the maximum attention, per head, in the column of that maximum
+    attention_heads = np.asarray(attention_heads)
+    time_step = int(time_step_ms / ts_ms)
+    spans = []
+    for head_num in range(attention_heads.shape[1]):
+        head = attention_heads[0, head_num]
+        max_val_coords = np.unravel_index(head.argmax(), head.shape)
+        for i in np.flatnonzero(head[:, max_val_coords[1]] >= 0.9 * head.max()):
+            spans.append((i, i, HEAD_COLORS[head_num], 0.7))
+    window = episode[time_step - window_width:time_step, 1:7]
+    jobs.append({
+        'kind': 'time_series',
+        'figure': {'color': 'gray'},
+        'path': dir_path + f'head_{head_num}_ep_{episode_num}_truncated.png',
+        'X': np.arange(len(window)),
+        'ft': window,
+        'spans': spans,
+        'title': f'Episode {episode_num}, Head {head_num}: At time step {max_val_coords[1]}, attention is focused on colored strips',
+        'legend': [f'Head {h + 1}' for h in range(attention_heads.shape[1])]
+    })
+
+    return jobs
@@ -0,0 +1,174 @@
+import sys, os, io, json, time, glob
+import hashlib
+import sqlite3
+from contextlib import closing
+sys.path.append(os.path.realpath('../'))
+# print(sys.path)
+
+import numpy as np
+
+# NOTE: Append-only. Every write is one run (model, weights, split, confidence and the full result document) plus one
+#       row per numeric leaf of the document, lists of numbers are stored as .npy payloads. Several evaluation processes
+#       can write at once (WAL mode, one transaction per run), readers take the latest run of each key
+
+RESULTS_DB = '../saved_data/results.sqlite'
+# Kinds of runs written by the evaluation code
+MAKESPAN_EQUATION = 'makespan_equation' # ----- `get_makespan_for_model`
+MAKESPAN_SIMULATION = 'makespan_simulation' # - `run_simulation`
+CONF_MAT = 'conf_mat' # ----------------------- `compute_confusion_matrix` / `plot_evaluation_on_test_window_data`
+ROC = 'roc' # --------------------------------- `plot_roc_window_data`
+SIMULATION_SUMMARY = 'simulation_summary' # --- `run_makespan_simulation` results of `main_runner`
+MAKESPAN_TRADEOFF = 'makespan_tradeoff' # ----- `get_makespan_tradeoff`
+
+
+# Functions -----------------------------------------------------------------------
+def weights_hash(model) -> str:
+    """ Short SHA-1 of the weights of a Keras model, tells results of differently trained models apart """
+    sha = hashlib.sha1()
+    for w in model.get_weights():
+        sha.update(np.ascontiguousarray(w).tobytes())
+
+    return sha.hexdigest()[:16]
+
+
+def _flatten(document, prefix: str = ''):
+    """ (metric, value, payload) of every numeric leaf and numeric list of a JSON-like document, nested keys joined by '.' """
+    if isinstance(document, dict):
+        for key, value in document.items():
+            yield from _flatten(value, f'{prefix}.{key}' if prefix else str(key))
+    elif isinstance(document, bool):
+        return
+    elif isinstance(document, (int, float, np.integer, np.floating)):
+        yield prefix, float(document), None
+    elif isinstance(document, (list, tuple, np.ndarray)) and len(document) > 0:
+        try:
+            values = np.asarray(document, dtype=float)
+        except (TypeError, ValueError):
+            return
+        buffer = io.BytesIO()
+        np.save(buffer, values)
+        yield prefix, None, buffer.getvalue()
+
+
+# Classes --------------------------------------------------------------------------
+class ResultsStore:
+    """ SQLite store of evaluation results, replacing the per-model JSON files of each result directory """
+    def __init__(self, path: str = RESULTS_DB) -> None:
+        self.path = path
+        if not os.path.exists(os.path.dirname(os.path.abspath(path))):
+            os.makedirs(os.path.dirname(os.path.abspath(path)))
+        with closing(self._connect()) as con, con:
+            con.execute('PRAGMA journal_mode=WAL')
+            con.execute('''CREATE TABLE IF NOT EXISTS runs (
+                run_id INTEGER PRIMARY KEY AUTOINCREMENT, created REAL, kind TEXT, model TEXT, weights_hash TEXT,
+                split TEXT, confidence REAL, document TEXT)''')
+            con.execute('''CREATE TABLE IF NOT EXISTS metrics (
+                run_id INTEGER, metric TEXT, value REAL, payload BLOB, PRIMARY KEY (run_id, metric))''')
+            con.execute('CREATE INDEX IF NOT EXISTS runs_key ON runs (kind, model, split, confidence)')
+
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=60)
+
+
+    def append(self, kind: str, model: str, document: dict, confidence: float = None, split: str = 'test', weights_hash: str = None) -> int:
+        """ Record one run in a single transaction. A `None` document records that the run produced no result """
+        with closing(self._connect()) as con, con:
+            cur = con.execute(
+                'INSERT INTO runs (created, kind, model, weights_hash, split, confidence, document) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (time.time(), kind, model, weights_hash, split, confidence, None if document is None else json.dumps(document))
+            )
+            run_id = cur.lastrowid
+            if document is not None:
+                con.executemany(
+                    'INSERT OR REPLACE INTO metrics VALUES (?, ?, ?, ?)',
+                    [(run_id, metric, value, payload) for metric, value, payload in _flatten(document)]
+                )
+
+        return run_id
+
+
+    def latest(self, kind: str, model: str, confidence: float = None, split: str = 'test'):
+        """ Document of the latest run of `model`, None if there is none or it produced no result """
+        with closing(self._connect()) as con, con:
+            row = con.execute(
+                'SELECT document FROM runs WHERE kind = ? AND model = ? AND split = ? AND confidence IS ? ORDER BY run_id DESC LIMIT 1',
+                (kind, model, split, confidence)
+            ).fetchone()
+
+        return None if row is None or row[0] is None else json.loads(row[0])
+
+
+    def latest_many(self, kind: str, models: list, confidence: float = None, split: str = 'test') -> dict:
+        """ {model: document} of the latest run of every model that has a result """
+        documents = {model: self.latest(kind, model, confidence=confidence, split=split) for model in models}
+
+        return {model: doc for model, doc in documents.items() if doc is not None}
+
+
+    def metric(self, kind: str, metric: str, model: str = None, confidence: float = None, split: str = 'test') -> list:
+        """ Every recorded value of a scalar `metric` (e.g. 'variables.EMS'), oldest first, as dicts with the run keys """
+        query = '''SELECT runs.run_id, runs.created, runs.model, runs.weights_hash, runs.confidence, metrics.value
+                   FROM runs JOIN metrics ON runs.run_id = metrics.run_id
+                   WHERE runs.kind = ? AND runs.split = ? AND metrics.metric = ?'''
+        params = [kind, split, metric]
+        if model is not None:
+            query += ' AND runs.model = ?'
+            params.append(model)
+        if confidence is not None:
+            query += ' AND runs.confidence = ?'
+            params.append(confidence)
+        with closing(self._connect()) as con, con:
+            rows = con.execute(query + ' ORDER BY runs.run_id', params).fetchall()
+
+        return [
+            {'run_id': r[0], 'created': r[1], 'model': r[2], 'weights_hash': r[3], 'confidence': r[4], 'value': r[5]}
+            for r in rows
+        ]
+
+
+    def array(self, run_id: int, metric: str) -> np.ndarray:
+        """ Array payload of `metric` (e.g. 'simulation_makespan_list') of one run """
+        with closing(self._connect()) as con, con:
+            row = con.execute('SELECT payload FROM metrics WHERE run_id = ? AND metric = ?', (run_id, metric)).fetchone()
+        if row is None or row[0] is None:
+            raise KeyError(f'Run {run_id} has no array {metric}')
+
+        return np.load(io.BytesIO(row[0]))
+
+
+    def import_json_results(self, saved_data_dir: str = '../saved_data') -> int:
+        """ Append the results of the former per-model JSON directories, returns the number of runs imported """
+        n_runs = 0
+        sources = [(MAKESPAN_EQUATION, 'test_data_makespan_confidence_*'), (MAKESPAN_SIMULATION, 'test_data_simulation_confidence_*')]
+        for kind, pattern in sources:
+            for path in sorted(glob.glob(f'{saved_data_dir}/{pattern}/*.json')):
+                confidence = int(os.path.basename(os.path.dirname(path)).split('_')[-1]) / 100
+                with open(path, 'r') as f:
+                    self.append(kind, os.path.splitext(os.path.basename(path))[0], json.load(f), confidence=confidence)
+                n_runs += 1
+
+        for path in sorted(glob.glob(f'{saved_data_dir}/test_conf_mats/*_test_data_conf_mat_at_*.json')):
+            model_name, confidence = os.path.basename(path)[:-len('.json')].split('_test_data_conf_mat_at_')
+            perf_path = path.replace('_conf_mat_at_', '_perf_at_')
+            with open(path, 'r') as f:
+                document = {'conf_mat': json.load(f)}
+            if os.path.exists(perf_path):
+                with open(perf_path, 'r') as f:
+                    document['perf'] = json.load(f)
+            self.append(CONF_MAT, model_name, document, confidence=float(confidence))
+            n_runs += 1
+
+        for path in sorted(glob.glob(f'{saved_data_dir}/ROC/results_confidence_*.json')):
+            confidence = int(path[:-len('.json')].split('_')[-1]) / 100
+            with open(path, 'r') as f:
+                for model_name, document in json.load(f).items():
+                    self.append(ROC, model_name, document, confidence=confidence)
+                    n_runs += 1
+
+        return n_runs
+
+
+if __name__ == '__main__':
+    store = ResultsStore()
+    print(f'Imported {store.import_json_results()} runs into {store.path}')
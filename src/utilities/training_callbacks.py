@@ -0,0 +1,162 @@
+import sys, os, csv, time, resource
+sys.path.append(os.path.realpath('../'))
+# print(sys.path)
+
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2' # INFO and WARNING messages are not printed
+
+import numpy as np
+import tensorflow as tf
+
+from utilities.utils import atomic_write_json
+
+# NOTE: The makespan utilities (and their plotting dependencies) are only imported by `MakespanCheckpoint`, so that the
+#       model builds can import the throughput logger cheaply
+
+THROUGHPUT_DIR = '../saved_data/throughput'
+
+
+class MakespanCheckpoint(tf.keras.callbacks.Callback):
+    """ Every `every_n_epochs`, classify the cached validation episodes and keep the weights with the lowest expected makespan
+
+    The expected makespan (EMS) is logged as `val_expected_makespan`. It is infinite while the model never crosses
+    `confidence` in both directions, which shows early that a model will be useless at that confidence.
+    Listed after `EarlyStopping`, the restored best makespan weights replace the best val_loss ones.
+    The cache must hold validation episodes of the train split (see `validation_split`), never the test episodes """
+    def __init__(self, cache: 'EpisodeWindowCache', confidence: float = 0.9, every_n_epochs: int = 5, filepath: str = None, restore_best: bool = True, verbose: bool = True) -> None:
+        super().__init__()
+        self.cache = cache
+        self.confidence = confidence
+        self.every_n_epochs = every_n_epochs
+        self.filepath = filepath
+        self.restore_best = restore_best
+        self.verbose = verbose
+        self.best_makespan = np.inf
+        self.best_epoch = None
+        self.best_weights = None
+        self.evaluations = []
+
+
+    def evaluate(self) -> dict:
+        from utilities.makespan_utils import batched_episode_outcomes
+        from utilities.makespan_simulation import outcome_variables
+
+        table = batched_episode_outcomes(model=self.model, cache=self.cache, confidence=self.confidence)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            variables = {key: float(value) for key, value in outcome_variables(table).items()}
+        if not np.isfinite(variables['EMS']):
+            variables['EMS'] = np.inf
+
+        return variables
+
+
+    def on_epoch_end(self, epoch, logs=None):
+        if (epoch + 1) % self.every_n_epochs != 0:
+            return
+
+        variables = self.evaluate()
+        ems = variables['EMS']
+        self.evaluations.append({'epoch': epoch + 1, **variables})
+        if logs is not None:
+            logs['val_expected_makespan'] = ems
+        if self.verbose:
+            print(f' - expected makespan at {self.confidence} confidence: {ems:.3f} [s] (P_NC = {variables["P_NCS"] + variables["P_NCF"]:.3f})')
+
+        if ems < self.best_makespan:
+            self.best_makespan = ems
+            self.best_epoch = epoch + 1
+            self.best_weights = self.model.get_weights()
+            if self.filepath is not None:
+                self.model.save_weights(filepath=self.filepath)
+
+
+    def on_train_end(self, logs=None):
+        if self.best_epoch is None:
+            print(f'WARNING: the model never crossed the {self.confidence} confidence in both directions during training')
+            return
+        if self.restore_best:
+            if self.verbose:
+                print(f'Restoring weights of epoch {self.best_epoch} (expected makespan {self.best_makespan:.3f} [s])')
+            self.model.set_weights(self.best_weights)
+
+
+
+class ThroughputLogger(tf.keras.callbacks.Callback):
+    """ Records steps/s, samples/s, input vs compute time, peak RSS and wall time of every epoch
+
+    Input time is the wait between the end of a batch and the start of the next one, which is where Keras fetches
+    the next batch, compute time is the rest. Logs are rewritten after every epoch to `{log_dir}/{model_name}_{run_id}`
+    as JSON and CSV, so interrupted runs keep what they measured.
+    When the training `data` is a `Sequence`, Keras ignores the `batch_size` of `fit` and the Sequence's own applies """
+    def __init__(self, model_name: str, batch_size: int, data = None, log_dir: str = THROUGHPUT_DIR, run_id: str = None, verbose: bool = False) -> None:
+        super().__init__()
+        self.model_name = model_name
+        self.batch_size = data.batch_size if isinstance(data, tf.keras.utils.Sequence) else batch_size
+        self.log_dir = log_dir
+        # Parallel fold / trial workers train the same model at the same time, the pid keeps their logs apart
+        self.run_id = run_id if run_id is not None else f'{time.strftime("%Y%m%d_%H%M%S")}_{os.getpid()}'
+        self.verbose = verbose
+        self.log_path = f'{self.log_dir}/{self.model_name}_{self.run_id}'
+        self.run = None
+
+
+    def on_train_begin(self, logs=None):
+        self.run = {
+            'model': self.model_name,
+            'run_id': self.run_id,
+            'batch_size': self.batch_size,
+            'steps_per_epoch': self.params.get('steps'),
+            'n_params': int(self.model.count_params()),
+            'started': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'epochs': []
+        }
+
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch_start = time.perf_counter()
+        self.last_batch_end = self.epoch_start
+        self.input_time = 0.0
+        self.compute_time = 0.0
+        self.steps = 0
+
+
+    def on_train_batch_begin(self, batch, logs=None):
+        self.batch_start = time.perf_counter()
+        self.input_time += self.batch_start - self.last_batch_end
+
+
+    def on_train_batch_end(self, batch, logs=None):
+        # Keras hands numpy logs to callbacks that do not support tf logs, so the step has finished by now
+        self.last_batch_end = time.perf_counter()
+        self.compute_time += self.last_batch_end - self.batch_start
+        self.steps += 1
+
+
+    def on_epoch_end(self, epoch, logs=None):
+        now = time.perf_counter()
+        train_time = self.last_batch_end - self.epoch_start
+        record = {
+            'epoch': epoch + 1,
+            'wall_time_s': now - self.epoch_start,
+            'train_time_s': train_time,
+            'validation_time_s': now - self.last_batch_end,
+            'input_time_s': self.input_time,
+            'compute_time_s': self.compute_time,
+            'input_fraction': self.input_time / train_time if train_time > 0 else 0.0,
+            'steps': self.steps,
+            'steps_per_s': self.steps / train_time if train_time > 0 else 0.0,
+            'samples_per_s': self.steps * self.batch_size / train_time if train_time > 0 else 0.0,
+            # ru_maxrss is in kilobytes on Linux
+            'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        }
+        self.run['epochs'].append(record)
+        self.save()
+        if self.verbose:
+            print(f' - {record["samples_per_s"]:.0f} samples/s, {100 * record["input_fraction"]:.1f} % waiting for input, peak RSS {record["peak_rss_mb"]:.0f} MB')
+
+
+    def save(self):
+        atomic_write_json(f'{self.log_path}.json', self.run, indent=4)
+        with open(f'{self.log_path}.csv', 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(self.run['epochs'][0].keys()))
+            writer.writeheader()
+            writer.writerows(self.run['epochs'])
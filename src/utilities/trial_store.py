@@ -0,0 +1,81 @@
+import sys, os, json, time
+import sqlite3
+from contextlib import closing
+sys.path.append(os.path.realpath('../'))
+# print(sys.path)
+
+# NOTE: Several worker processes report to the same database, WAL mode lets them write while others read
+
+
+class TrialStore:
+    """ SQLite record of hyperparameter search trials and of their per-epoch validation loss """
+    def __init__(self, path: str) -> None:
+        self.path = path
+        if not os.path.exists(os.path.dirname(os.path.abspath(path))):
+            os.makedirs(os.path.dirname(os.path.abspath(path)))
+        with closing(self._connect()) as con, con:
+            con.execute('PRAGMA journal_mode=WAL')
+            con.execute('''CREATE TABLE IF NOT EXISTS trials (
+                study TEXT, trial_id INTEGER, config TEXT, status TEXT, rung INTEGER, epochs INTEGER,
+                objective REAL, updated REAL, PRIMARY KEY (study, trial_id))''')
+            con.execute('''CREATE TABLE IF NOT EXISTS reports (
+                study TEXT, trial_id INTEGER, epoch INTEGER, val_loss REAL, PRIMARY KEY (study, trial_id, epoch))''')
+
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=60)
+
+
+    def add_trial(self, study: str, trial_id: int, config: dict):
+        """ Register a trial, already existing trials (e.g. when resuming) are kept as they are """
+        with closing(self._connect()) as con, con:
+            con.execute(
+                'INSERT OR IGNORE INTO trials VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (study, trial_id, json.dumps(config), 'pending', 0, 0, None, time.time())
+            )
+
+
+    def update_trial(self, study: str, trial_id: int, status: str, rung: int, epochs: int, objective: float = None):
+        with closing(self._connect()) as con, con:
+            con.execute(
+                'UPDATE trials SET status = ?, rung = ?, epochs = ?, objective = ?, updated = ? WHERE study = ? AND trial_id = ?',
+                (status, rung, epochs, objective, time.time(), study, trial_id)
+            )
+
+
+    def report(self, study: str, trial_id: int, epoch: int, val_loss: float):
+        with closing(self._connect()) as con, con:
+            con.execute('INSERT OR REPLACE INTO reports VALUES (?, ?, ?, ?)', (study, trial_id, epoch, val_loss))
+
+
+    def epoch_values(self, study: str, epoch: int, exclude_trial: int = None) -> list:
+        """ Validation losses every (other) trial reported at `epoch` """
+        with closing(self._connect()) as con, con:
+            rows = con.execute(
+                'SELECT val_loss FROM reports WHERE study = ? AND epoch = ? AND trial_id != ?',
+                (study, epoch, -1 if exclude_trial is None else exclude_trial)
+            ).fetchall()
+
+        return [row[0] for row in rows]
+
+
+    def trials(self, study: str) -> list:
+        with closing(self._connect()) as con, con:
+            rows = con.execute(
+                'SELECT trial_id, config, status, rung, epochs, objective FROM trials WHERE study = ? ORDER BY trial_id',
+                (study,)
+            ).fetchall()
+
+        return [
+            {'trial_id': r[0], 'config': json.loads(r[1]), 'status': r[2], 'rung': r[3], 'epochs': r[4], 'objective': r[5]}
+            for r in rows
+        ]
+
+
+    def best_trial(self, study: str):
+        """ Completed trial with the lowest objective, preferring the ones that reached the highest rung """
+        completed = [t for t in self.trials(study) if t['status'] == 'complete' and t['objective'] is not None]
+        if len(completed) == 0:
+            return None
+
+        return min(completed, key=lambda t: (-t['rung'], t['objective']))
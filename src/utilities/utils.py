@@ -1,31 +1,58 @@
 ########## INIT ###################################################################################
 
 ##### Imports #####
-import pickle, os, sys, time
+import pickle, os, sys, time, json, tempfile
+import fcntl
+from contextlib import contextmanager
 from time import sleep
 
-import tensorflow
+import numpy as np
+
+# NOTE: TensorFlow is only imported inside `init_gpus_for_tf` so that importing these utilities stays cheap
 
 
 ########## GPU / TENSORFLOW ########################################################################
 
-def init_gpus_for_tf():
-    """ Set up GPU(s) to support classification work in tensorflow-gpu """
+_TF_DEVICES = None
+
+
+def init_gpus_for_tf( verbose = True ):
+    """ Set up GPU(s) to support classification work in tensorflow-gpu, only done once per process """
+    global _TF_DEVICES
+    if _TF_DEVICES is not None:
+        return _TF_DEVICES
+
+    import tensorflow
+
     gpus = tensorflow.config.experimental.list_physical_devices(device_type='GPU')
-    print( f"Found {len(gpus)} GPUs!" )
+    if verbose:
+        print( f"Found {len(gpus)} GPUs!" )
     for i in range( len( gpus ) ):
         try:
             tensorflow.config.experimental.set_memory_growth(device=gpus[i], enable=True)
-            tensorflow.config.experimental.VirtualDeviceConfiguration( memory_limit = 1024*3 )
-            print( f"\t{tensorflow.config.experimental.get_device_details( device=gpus[i] )}" )
+            if verbose:
+                print( f"\t{tensorflow.config.experimental.get_device_details( device=gpus[i] )}" )
         except RuntimeError as e:
             print( '\n', e, '\n' )
 
-    devices = tensorflow.config.list_physical_devices()
-    print( "Tensorflow sees the following devices:" )
-    for dev in devices:
-        print( f"\t{dev}" )
-        print
+    _TF_DEVICES = tensorflow.config.list_physical_devices()
+    if verbose:
+        print( "Tensorflow sees the following devices:" )
+        for dev in _TF_DEVICES:
+            print( f"\t{dev}" )
+
+    return _TF_DEVICES
+
+
+def limit_tf_threads( n_threads = 1 ):
+    """ Cap the intra/inter-op threads of TensorFlow (and BLAS/OpenMP), call before any TF op runs in this process """
+    for var in ( 'OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS' ):
+        os.environ[var] = str( n_threads )
+
+    import tensorflow
+
+    tensorflow.config.threading.set_intra_op_parallelism_threads( n_threads )
+    tensorflow.config.threading.set_inter_op_parallelism_threads( max( 1, n_threads // 2 ) )
 
 
 
@@ -165,6 +192,56 @@ def pkl_obj( fName, obj, binary = 1 ):
     except Exception as err:
         print( "Failed to save" , fName , '!\n' , err )
 
+
+def atomic_write_json( fName, obj, **kwargs ):
+    """ Write `obj` as JSON to a temporary file in the same directory and rename it, readers never see a partial file """
+    dirName = os.path.dirname( os.path.abspath( fName ) )
+    if not os.path.exists( dirName ):
+        os.makedirs( dirName )
+    fd, tmpName = tempfile.mkstemp( dir = dirName, prefix = '.tmp_', suffix = '.json' )
+    try:
+        with os.fdopen( fd, 'w' ) as f:
+            json.dump( obj, f, **kwargs )
+            f.flush()
+            os.fsync( f.fileno() )
+        os.replace( tmpName, fName )
+    except BaseException:
+        if os.path.exists( tmpName ):
+            os.remove( tmpName )
+        raise
+
+
+
+
+@contextmanager
+def file_lock( fName ):
+    """ Exclusive lock held on `fName` + '.lock' for the duration of the block, shared by all processes on the machine """
+    dirName = os.path.dirname( os.path.abspath( fName ) )
+    if not os.path.exists( dirName ):
+        os.makedirs( dirName )
+    with open( fName + '.lock', 'w' ) as lockFile:
+        fcntl.flock( lockFile.fileno(), fcntl.LOCK_EX )
+        try:
+            yield
+        finally:
+            fcntl.flock( lockFile.fileno(), fcntl.LOCK_UN )
+
+
+def update_json( fName, update, **kwargs ):
+    """ Read-modify-write of a JSON dict file under `file_lock`, written with `atomic_write_json`
+
+    `update` gets the current dict ({} if the file does not exist yet) and returns the new one, so concurrent writers
+    each merge their own keys into the latest content instead of overwriting each other. Returns the written dict """
+    with file_lock( fName ):
+        obj = {}
+        if os.path.exists( fName ):
+            with open( fName, 'r' ) as f:
+                obj = json.load( f )
+        obj = update( obj )
+        atomic_write_json( fName, obj, **kwargs )
+
+    return obj
+
         
 def get_pkl( fName, binary = 1 ):
     if binary: